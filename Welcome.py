@@ -1,14 +1,13 @@
 # Welcome.py
 
 import streamlit as st
-from data_loader import load_data_for_page
+from data_loader import load_data_for_page, DEFAULT_MIN_FILTER
+from developer_panel import developer_panel
 
 st.set_page_config(page_title="Welcome", layout="wide")
 
 # Default filters {column: default_value}
-default_min_filter = {
-    "Reviews": 20.0  # Default filter for reviews at the start
-}
+default_min_filter = dict(DEFAULT_MIN_FILTER)  # Default filter for reviews at the start
 default_max_filter = {}
 st.session_state["min_filter"] = default_min_filter
 st.session_state["max_filter"] = default_max_filter
@@ -69,3 +68,6 @@ st.markdown("""
 
 Created by:
 Michael Mor Yosef | Itai Sharon Reder""")
+
+# Timings of this rerun (developer panel, see developer_panel.py)
+developer_panel('Welcome')
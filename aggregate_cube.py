@@ -0,0 +1,160 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+from data_loader import load_filtered_games, default_filter_ranges, derived_cache
+from derived_columns import with_derived_columns
+
+# Pre-aggregated cubes of the games of the common filter states: without sidebar filters and with the default sidebar
+# filters of a new visitor (see cube_filter_states). Every cuboid holds one cell per observed combination of its dimensions with the number of games ('n') and, for every
+# metric, the sum, count and sum of squares of its values, over all games and over the games with a positive value
+# (some pages leave out zeros). Pages roll the cells up to the groups they plot instead of scanning the games.
+CUBE_METRICS = ['Average playtime', 'Peak CCU', 'Reviews', 'Recommendations', 'Review score']
+
+# Dimensions of every cuboid, from the smallest. 'Release Year' is the year range filter of Release Time,
+# 'Release Quarter' follows from the month and adds no cells.
+CUBOIDS = [
+    ('language_count_bins',),
+    ('OS_code',),
+    ('Price Bin',),
+    ('Release Year', 'Release Month', 'Release Quarter'),
+]
+
+class AggregateCube:
+    def __init__(self, df):
+        df = with_derived_columns(df, 'Price Bin', 'OS_code')
+        measures = {'n': np.ones(len(df), dtype='int64')}
+        for metric in CUBE_METRICS:
+            values = df[metric]
+            positive = (values > 0).to_numpy()
+            for prefix, subset in (('', values.notna().to_numpy()), ('positive_', positive)):
+                # Sums of integer metrics stay integers
+                measures[f'{metric}:{prefix}sum'] = values.where(subset, 0)
+                measures[f'{metric}:{prefix}count'] = subset.astype('int64')
+                measures[f'{metric}:{prefix}sumsq'] = np.where(subset, values.to_numpy(dtype=float) ** 2, 0)
+        measures = pd.DataFrame(measures, index=df.index)
+        # Games with a missing dimension value (e.g. no valid release date) have no cell in the cuboids of that dimension
+        self.cuboids = {dims: measures.groupby([df[dim] for dim in dims], observed=True).sum().reset_index()
+                        for dims in CUBOIDS}
+
+    # Cells rolled up to the given dimensions, from the smallest cuboid that has them.
+    # where restricts the cells to {dimension: (min, max)} ranges, the dimensions are columns of the returned cells.
+    def cells(self, dims, where=None):
+        dims, where = list(dims), where or {}
+        cuboid = next(cuboid for cuboid in CUBOIDS if set(dims) | set(where) <= set(cuboid))
+        cells = self.cuboids[cuboid]
+        for dim, (min_value, max_value) in where.items():
+            cells = cells[cells[dim].between(min_value, max_value)]
+        if dims == list(cuboid):
+            return cells
+        return cells.drop(columns=[dim for dim in cuboid if dim not in dims]).groupby(dims, observed=True).sum().reset_index()
+
+    # Partial aggregates of all games (a single series) over groups of cells, like scan_partials:
+    # group_codes is a function of the cells returning the group of every cell
+    def partials(self, dims, group_codes, n_groups, metrics, where=None):
+        cells = self.cells(dims, where)
+        codes = np.asarray(group_codes(cells))
+        codes, cells = codes[codes >= 0], cells[codes >= 0]
+        n = np.bincount(codes, weights=cells['n'], minlength=n_groups)[None]
+        count, total, sumsq = (np.stack([np.bincount(codes, weights=cells[f'{metric}:{measure}'], minlength=n_groups)
+                                         for metric in metrics], axis=-1)[None]
+                               for measure in ['count', 'sum', 'sumsq'])
+        return PartialAggregates(metrics, n.astype('int64'), count, total, sumsq)
+
+# Mergeable partial aggregates of several series of games (e.g. all games, a selection and a comparison) over the same
+# groups: per series and group the number of games, and per metric the count, sum and sum of squares of its values.
+# Partial states of disjoint games are merged by adding them, and means or standard deviations follow from them.
+class PartialAggregates:
+    def __init__(self, metrics, n, count, total, sumsq):
+        self.metrics = list(metrics)
+        self.n = n            # (series, groups)
+        self.count = count    # (series, groups, metrics)
+        self.total = total
+        self.sumsq = sumsq
+
+    # Merge the partial states of disjoint games of the same series and groups
+    def merge(self, other):
+        return PartialAggregates(self.metrics, self.n + other.n, self.count + other.count, self.total + other.total,
+                                 self.sumsq + other.sumsq)
+
+    # Partial states of the series of several partial aggregates of the same groups, in order
+    @staticmethod
+    def concat(partials):
+        return PartialAggregates(partials[0].metrics, *(np.concatenate([getattr(partial, field) for partial in partials])
+                                                         for field in ['n', 'count', 'total', 'sumsq']))
+
+    # Mean of every metric, (series, groups, metrics), NaN for groups without values
+    def mean(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.total / self.count
+
+    # Sample standard deviation of every metric, (series, groups, metrics)
+    def std(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt((self.sumsq - self.count * self.mean() ** 2) / (self.count - 1))
+
+    # Mean of every metric and number of games ('Games released') for the groups of a series that have games,
+    # like a groupby of its games, with the group labels (one per group) in the first column
+    def summary(self, series, labels, name):
+        has_games = self.n[series] > 0
+        summary = pd.DataFrame(self.mean()[series][has_games], columns=self.metrics)
+        summary.insert(0, name, np.asarray(labels)[has_games])
+        summary['Games released'] = self.n[series][has_games]
+        return summary
+
+# Partial aggregates of several boolean row masks (series, rows) over the groups of the rows, in a single grouped pass:
+# group_codes are the group of every row (0 to n_groups - 1, negative for rows without a group) and values the
+# (rows, metrics) metric values (NaN values are skipped).
+def scan_partials(masks, group_codes, n_groups, values, metrics):
+    masks = np.asarray(masks, dtype=bool).reshape(-1, len(group_codes))
+    n_series = len(masks)
+    series, rows = np.nonzero(masks & (group_codes >= 0))
+    keys = series * n_groups + group_codes[rows]
+    shape = (n_series, n_groups)
+    n = np.bincount(keys, minlength=n_series * n_groups).reshape(shape)
+    count, total, sumsq = (np.zeros(shape + (len(metrics),)) for _ in range(3))
+    for j in range(len(metrics)):
+        metric_values = values[rows, j]
+        valid = ~np.isnan(metric_values)
+        count[..., j] = np.bincount(keys[valid], minlength=n_series * n_groups).reshape(shape)
+        total[..., j] = np.bincount(keys[valid], weights=metric_values[valid], minlength=n_series * n_groups).reshape(shape)
+        sumsq[..., j] = np.bincount(keys[valid], weights=metric_values[valid] ** 2, minlength=n_series * n_groups).reshape(shape)
+    return PartialAggregates(metrics, n, count, total, sumsq)
+
+# Mean (or standard deviation, stat='std') of every metric and number of games ('Games released') for every group of
+# cells. Like a groupby of the games, groups of categorical keys without any game are kept (with a NaN statistic).
+# With positive=True only the games with a positive value of the metric are counted (for a single metric).
+def summarize(cells, by, metrics, positive=False, stat='mean'):
+    groups = cells.groupby(by, observed=False).sum(numeric_only=True)
+    prefix = 'positive_' if positive else ''
+    summary = pd.DataFrame(index=groups.index)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for metric in metrics:
+            count = groups[f'{metric}:{prefix}count'].to_numpy()
+            mean = groups[f'{metric}:{prefix}sum'].to_numpy() / count
+            if stat == 'std':
+                summary[metric] = np.sqrt((groups[f'{metric}:{prefix}sumsq'].to_numpy() - count * mean ** 2) / (count - 1))
+            else:
+                summary[metric] = mean
+    summary['Games released'] = groups[f'{metrics[0]}:positive_count'] if positive else groups['n']
+    return summary
+
+# Cached cube of the games passing a tuple of normalized range filters (see load_filtered_games), shared by all sessions
+@derived_cache
+@st.cache_resource(max_entries=2)
+def load_aggregate_cube(ranges=()):
+    return AggregateCube(load_filtered_games(ranges))
+
+# Normalized filter states with a cube: no sidebar filters and the default sidebar filters
+def cube_filter_states():
+    return [(), tuple(tuple(filter_range) for filter_range in default_filter_ranges())]
+
+# Cube to answer the aggregates of the games passing a tuple of normalized range filters from, or None when the filter
+# state has no cube and the pages have to scan the filtered games
+def cube_for(ranges):
+    if ranges not in cube_filter_states():
+        return None
+    return load_aggregate_cube(ranges)
+
+# Build the cube of every filter state with a cube
+def build_aggregate_cubes():
+    return [load_aggregate_cube(ranges) for ranges in cube_filter_states()]
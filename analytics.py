@@ -0,0 +1,261 @@
+import numpy as np
+import pandas as pd
+from data_loader import (load_csv_data, load_column_stats, load_filtered_games, load_release_periods,
+                         normalize_filter_ranges, check_data_version)
+from derived_columns import with_derived_columns, os_code_combinations, OS_ORDER, OS_CODE_COUNTS
+from aggregate_cube import cube_for, scan_partials, summarize
+from game_index import load_game_index, load_incidence_matrix
+
+# Aggregations of the pages as functions of a filter spec, usable without a browser session (see analytics_server.py).
+# A filter spec is a list of (column, min, max) range filters, like the sidebar filters. Every function returns compact
+# aggregated frames computed from the shared in-memory dataset, answered from the aggregate cube of the filter state when
+# it has one (no filters or the default sidebar filters, see aggregate_cube.py). The pages memoize the results (see result_cache.py) and only draw them.
+PRICE_METRICS = ['Games released', 'Average playtime', 'Peak CCU', 'Reviews', 'Review score', 'Recommendations']
+RELEASE_METRICS = ['Average playtime', 'Peak CCU', 'Reviews', 'Review score', 'Recommendations']
+TREND_FIELDS = ['Recommendations', 'Peak CCU', 'Average playtime', 'Reviews', 'Games Released', 'Review score']
+TREND_METRICS = TREND_FIELDS[:4] + ['Review score']  # The sums of the first ones and the mean review score are plotted
+LANGUAGE_METRICS = ['Games released', 'Average playtime', 'Peak CCU', 'Reviews', 'Recommendations', 'Review score']
+OS_METRICS = ['Average playtime', 'Peak CCU', 'Reviews', 'Recommendations', 'Review score']
+
+# Metrics whose zeros are left out of the price bin averages
+POSITIVE_METRICS = ('Average playtime', 'Peak CCU')
+
+# Index files of the tag, genre and category selections of Release Time (in selection order) and of the Trends combinations
+SELECTION_INDEXES = ['tags.json', 'genres.json', 'categories.json']
+COMBINATION_INDEXES = {'Genres': 'genres.json', 'Tags': 'tags.json', 'Categories': 'categories.json'}
+
+# Groupings of the Release Time series: (group column, number of groups)
+RELEASE_GROUPINGS = {'Months': ('Release Month', 12), 'Quarters': ('Release Quarter', 4)}
+
+OS_COLUMNS = ['OS', 'OS_combination', 'OS_count']
+
+# Normalized filter state of a filter spec, as a tuple of (column, min, max) ranges. Every analytics function starts
+# here, so callers outside of the pages (report.py, analytics_server.py) also pick up a new data version.
+def filter_key(filters=()):
+    check_data_version()
+    ranges = normalize_filter_ranges([tuple(filter_range) for filter_range in filters], load_column_stats())
+    return tuple(tuple(filter_range) for filter_range in ranges)
+
+# Games passing a filter spec (shared cached frame, never modified)
+def filtered_games(filters=()):
+    return load_filtered_games(filter_key(filters))
+
+# Mean of a metric (number of games for 'Games released') and number of games of every price bin.
+# Zeros of 'Average playtime' and 'Peak CCU' are left out.
+def price_bin_metrics(filters, metric):
+    df = with_derived_columns(filtered_games(filters), 'Price Bin')
+    cube = cube_for(filter_key(filters))
+    if cube:
+        # Roll up the price bin cells of the cube
+        cells = cube.cells(['Price Bin'])
+        if metric == 'Games released':
+            return summarize(cells, 'Price Bin', [])[['Games released']].reset_index()
+        return summarize(cells, 'Price Bin', [metric], positive=metric in POSITIVE_METRICS).reset_index()
+
+    # Drop rows where Price Bin is NaN (i.e., prices outside the bins)
+    df = df.dropna(subset=['Price Bin'])
+    if metric == 'Games released':
+        return df.groupby('Price Bin', observed=False).size().reset_index(name='Games released')
+    metric_df = df[df[metric] > 0] if metric in POSITIVE_METRICS else df
+    agg_data = metric_df.groupby('Price Bin', observed=False)[metric].mean().reset_index()
+    agg_data['Games released'] = metric_df.groupby('Price Bin', observed=False).size().values
+    return agg_data
+
+# First and last year with released games
+def release_year_range():
+    years = load_release_periods()['year']
+    return int(years.min()), int(years.max())
+
+# Mean metrics and number of games by month or quarter (group_by 'Months' or 'Quarters') of the games released in the
+# year range, averaging over the years, for every selection: a (tags, genres, categories) selection of the games matching
+# all of them, or None for all games. Returns a summary per selection, computed in one grouped pass.
+def release_period_metrics(filters, selections, year_range=None, group_by='Months'):
+    df = filtered_games(filters)
+    cube = cube_for(filter_key(filters))
+    year_range = tuple(year_range or release_year_range())
+    group_column, n_groups = RELEASE_GROUPINGS[group_by]
+    group_labels = range(1, n_groups + 1)
+
+    summaries = [None] * len(selections)
+    scanned = list(range(len(selections)))
+    if cube and None in selections:
+        # All games come from the cube of the filter state
+        all_partials = cube.partials([group_column], lambda cells: cells[group_column].to_numpy(dtype='int64') - 1,
+                                     n_groups, RELEASE_METRICS, where={'Release Year': year_range})
+        all_summary = all_partials.summary(0, group_labels, group_column)
+        summaries = [all_summary if selection is None else None for selection in selections]
+        scanned = [i for i in scanned if selections[i] is not None]
+    if scanned:
+        # Row mask of the games released in the year range, evaluated once for all the selections
+        in_year_range = df['Release Year'].between(*year_range).to_numpy(dtype=bool, na_value=False)
+
+        # Games matching all the selected tags, genres and categories
+        def selection_mask(selection):
+            mask = in_year_range
+            for file, keys in zip(SELECTION_INDEXES, selection or ()):
+                if keys:  # Indexes without selected keys are not built
+                    mask = mask & load_game_index(file).frame_mask(df, keys)
+            return mask
+
+        # Partial aggregates (count, sum, sum of squares) of the selections by month or quarter, computed in one grouped
+        # pass over the stacked masks
+        group_codes = df[group_column].to_numpy(dtype='int64', na_value=0) - 1
+        partials = scan_partials([selection_mask(selections[i]) for i in scanned], group_codes, n_groups,
+                                 df[RELEASE_METRICS].to_numpy(dtype=float), RELEASE_METRICS)
+        for series, i in enumerate(scanned):
+            summaries[i] = partials.summary(series, group_labels, group_column)
+    return summaries
+
+# (year, month) time periods of the trend series: every month of the years with released games
+def trend_periods():
+    min_year, max_year = release_year_range()
+    return pd.MultiIndex.from_product([range(min_year, max_year + 1), range(1, 13)], names=['year', 'month'])
+
+# Trend series of a series of partial aggregates: per time period the sums of the metrics, the number of released games
+# and the mean review score (time periods without any released games are kept as zeros)
+def trend_from_partials(partials, series, time_periods):
+    plot_data = pd.DataFrame(partials.total[series], index=time_periods, columns=partials.metrics)
+    plot_data['Review score'] = partials.mean()[series][:, partials.metrics.index('Review score')]
+    plot_data['Games Released'] = partials.n[series]
+    plot_data[partials.n[series] == 0] = 0
+    return plot_data[TREND_FIELDS].reset_index()
+
+# Monthly trend series of every combination: a {'Genres': [...], 'Tags': [...], 'Categories': [...]} combination of the
+# games matching all of them, or None for all games. Returns a trend series per combination, computed in one grouped pass.
+def trend_series(filters, combinations):
+    df = filtered_games(filters)
+    cube = cube_for(filter_key(filters))
+    time_periods = trend_periods()
+    min_year = time_periods.levels[0][0]
+
+    series_data = [None] * len(combinations)
+    scanned = list(range(len(combinations)))
+    if cube and None in combinations:
+        # All games come from the cube of the filter state
+        all_partials = cube.partials(['Release Year', 'Release Month'],
+                                     lambda cells: (cells['Release Year'].to_numpy(dtype='int64') - min_year) * 12
+                                                   + cells['Release Month'].to_numpy(dtype='int64') - 1,
+                                     len(time_periods), TREND_METRICS)
+        all_data = trend_from_partials(all_partials, 0, time_periods)
+        series_data = [all_data if combination is None else None for combination in combinations]
+        scanned = [i for i in scanned if combinations[i] is not None]
+    if scanned:
+        # Games matching all the selected genres, tags and categories of a combination
+        def combination_mask(combination):
+            mask = np.ones(len(df), dtype=bool)
+            for name, keys in (combination or {}).items():
+                if keys:  # Indexes without selected keys are not built
+                    mask = mask & load_game_index(COMBINATION_INDEXES[name]).frame_mask(df, keys)
+            return mask
+
+        # Time period (position in time_periods) of every filtered game, -1 for games without a valid release date
+        release_periods = load_release_periods()
+        period_codes = np.full(len(load_csv_data()), -1)
+        period_codes[release_periods.index.to_numpy()] = (release_periods['year'] - min_year) * 12 + release_periods['month'] - 1
+        period_codes = period_codes[df.index.to_numpy()]
+
+        partials = scan_partials([combination_mask(combinations[i]) for i in scanned], period_codes,
+                                 len(time_periods), df[TREND_METRICS].to_numpy(dtype=float), TREND_METRICS)
+        for series, i in enumerate(scanned):
+            series_data[i] = trend_from_partials(partials, series, time_periods)
+    return series_data
+
+# Number of games and mean metrics of every supported language with games
+def language_stats(filters):
+    df = filtered_games(filters)
+    stats = load_incidence_matrix('supported_languages.json').key_stats(df, LANGUAGE_METRICS[1:]).rename_axis('language')
+    return stats[stats['Games released'] > 0]
+
+# Mean metrics and number of games ('Games released') of the games supporting all the languages of every combination,
+# as a list of {metric: value}. Computed as products of the row masks with the metric columns (missing values skipped).
+def language_combination_metrics(filters, combinations):
+    if not combinations:
+        return []
+    df = filtered_games(filters)
+    language_index = load_game_index('supported_languages.json')
+    # Games supporting all the languages of each combination, as a bitmap AND over the per-language posting lists
+    masks = np.array([language_index.frame_mask(df, languages) for languages in combinations], dtype=float)
+    values = df[LANGUAGE_METRICS[1:]].to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = masks @ np.where(valid, values, 0) / (masks @ valid)
+    metrics = []
+    for row in range(len(combinations)):
+        combination_metrics = dict(zip(LANGUAGE_METRICS[1:], means[row]))
+        combination_metrics['Games released'] = int(masks[row].sum())
+        metrics.append(combination_metrics)
+    return metrics
+
+# Frame of the metrics of language combinations, one row per combination named after its languages
+def language_combination_frame(combinations, metrics):
+    frame = pd.DataFrame(metrics, columns=LANGUAGE_METRICS[1:] + ['Games released'])
+    frame.insert(0, 'language', [', '.join(languages) for languages in combinations])
+    return frame
+
+# Rows of the language heatmap: the combinations with games on top, then the top 5 languages of every metric among the
+# languages with at least min_games games
+def language_heatmap_rows(language_stats, combination_frame, min_games):
+    combination_frame = combination_frame[combination_frame['Games released'] > 0]
+    languages = language_stats.reset_index()
+    languages = languages[languages['Games released'] >= min_games]
+    top_languages = set()
+    for metric in LANGUAGE_METRICS:
+        top_languages.update(languages.nlargest(5, metric)['language'].values)
+    heatmap = languages[languages['language'].isin(top_languages)]
+    if not combination_frame.empty:
+        heatmap = pd.concat([combination_frame, heatmap], ignore_index=True)
+    return heatmap
+
+# Language heatmap (mean metrics and number of games per row) of a filter spec and language combinations
+def language_heatmap(filters, combinations=(), min_games=10):
+    combinations = [languages for languages in combinations if languages]
+    combination_frame = language_combination_frame(combinations, language_combination_metrics(filters, combinations))
+    return language_heatmap_rows(language_stats(filters), combination_frame, min_games)
+
+# Number of games and mean metrics of every observed bin of the number of supported languages, in bins order
+def language_count_bin_stats(filters):
+    df = filtered_games(filters)
+    cube = cube_for(filter_key(filters))
+    if cube:
+        bin_stats = summarize(cube.cells(['language_count_bins']), 'language_count_bins', LANGUAGE_METRICS[1:])
+        return bin_stats[bin_stats['Games released'] > 0]  # Only the observed bins
+    grouped = df.groupby('language_count_bins', observed=True)
+    bin_stats = grouped[LANGUAGE_METRICS[1:]].mean()
+    bin_stats['Games released'] = grouped.size()
+    return bin_stats
+
+# Games repeated for every OS they support (in a single melt), with their metrics
+def repeat_os(df):
+    os_repeated = df.melt(id_vars=OS_METRICS, value_vars=OS_ORDER, var_name='OS', value_name='supported')
+    os_repeated = os_repeated[os_repeated['supported']].drop(columns='supported')
+    os_repeated['OS'] = pd.Categorical(os_repeated['OS'], categories=OS_ORDER, ordered=True)
+    return os_repeated
+
+# Mean metrics and number of games of every group of an OS column, rolled up from the OS code cells of the cube
+def cube_os_breakdown(cube, column):
+    cells = cube.cells(['OS_code'])
+    codes = cells['OS_code'].to_numpy()
+    if column == 'OS':
+        # Every game counts for every OS it supports (bit i of the code is the i-th OS)
+        cells = pd.concat([cells[(codes & (1 << bit)) > 0].assign(OS=os) for bit, os in enumerate(OS_ORDER)])
+        cells['OS'] = pd.Categorical(cells['OS'], categories=OS_ORDER, ordered=True)
+    elif column == 'OS_combination':
+        cells = cells.assign(OS_combination=os_code_combinations(codes))
+    else:
+        cells = cells.assign(OS_count=OS_CODE_COUNTS[codes])
+    return summarize(cells, column, OS_METRICS)
+
+# Mean metrics and number of games by OS column: 'OS' (every game counts for every OS it supports), 'OS_combination'
+# or 'OS_count'
+def os_breakdown(filters, column):
+    if column not in OS_COLUMNS:
+        raise ValueError(f"Unknown OS column {column!r}, expected one of {OS_COLUMNS}")
+    df = filtered_games(filters)
+    cube = cube_for(filter_key(filters))
+    if cube:
+        return cube_os_breakdown(cube, column)
+    df = with_derived_columns(df, 'OS_combination', 'OS_count')
+    grouped = (df if column != 'OS' else repeat_os(df)).groupby(column, observed=False)
+    group_stats = grouped[OS_METRICS].mean()
+    group_stats['Games released'] = grouped.size()
+    return group_stats
@@ -0,0 +1,116 @@
+import json
+import argparse
+import traceback
+import numpy as np
+import pandas as pd
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from streamlit.logger import set_log_level
+import analytics
+from data_loader import load_csv_data
+from aggregate_cube import build_aggregate_cubes
+from game_index import warm_indexes, index_footprint
+from instrumentation import span
+
+# Local HTTP/JSON endpoint of the analytics functions (see analytics.py), for reporting jobs that need the aggregates
+# without a browser session. Every request is answered from one warm in-memory dataset (the cached frame, indexes and
+# aggregate cube), shared by all callers and loaded at startup.
+#   GET  /health       data shape and footprint of the indexes
+#   GET  /functions    names of the functions
+#   POST /<function>   call a function with the keyword arguments of the JSON body, e.g.
+#                      POST /price_bin_metrics {"filters": [["Price", 0, 20]], "metric": "Reviews"}
+# Frames are returned as {"columns", "index", "data"} (pandas 'split' orient), missing values as null.
+FUNCTIONS = {func.__name__: func for func in [
+    analytics.price_bin_metrics,
+    analytics.release_period_metrics,
+    analytics.trend_series,
+    analytics.language_stats,
+    analytics.language_combination_metrics,
+    analytics.language_heatmap,
+    analytics.language_count_bin_stats,
+    analytics.os_breakdown,
+]}
+
+# JSON-compatible value of a result: frames in 'split' orient, numpy scalars as numbers, NaN as null
+def to_json_value(result):
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return json.loads(result.to_json(orient='split', date_format='iso'))
+    if isinstance(result, (list, tuple)):
+        return [to_json_value(value) for value in result]
+    if isinstance(result, dict):
+        return {str(key): to_json_value(value) for key, value in result.items()}
+    if isinstance(result, np.generic):
+        result = result.item()
+    if isinstance(result, float) and np.isnan(result):
+        return None
+    return result
+
+class AnalyticsHandler(BaseHTTPRequestHandler):
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/health':
+            df = load_csv_data()
+            self.send_json(200, {'status': 'ok', 'games': len(df), 'columns': len(df.columns), 'indexes': index_footprint()})
+        elif self.path == '/functions':
+            self.send_json(200, sorted(FUNCTIONS))
+        else:
+            self.send_json(404, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        func = FUNCTIONS.get(self.path.strip('/'))
+        if func is None:
+            self.send_json(404, {'error': f"Unknown function {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            kwargs = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(kwargs, dict):
+                raise TypeError("The body must be a JSON object of keyword arguments")
+            kwargs.setdefault('filters', [])
+            with span(f"api:{func.__name__}"):
+                result = to_json_value(func(**kwargs))
+        except (TypeError, ValueError, KeyError) as error:
+            # Bad arguments: unknown columns, metrics or keys, missing or unexpected arguments, invalid JSON
+            self.send_json(400, {'error': f"{type(error).__name__}: {error}"})
+            return
+        except Exception:
+            self.send_json(500, {'error': traceback.format_exc()})
+            return
+        self.send_json(200, result)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+# Load the shared dataset, the aggregate cubes and the indexes once, before the first request
+def warm_up():
+    load_csv_data()
+    build_aggregate_cubes()
+    warm_indexes()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the analytics functions over a local HTTP/JSON endpoint")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--verbose', action='store_true', help="log every request")
+    args = parser.parse_args()
+    set_log_level('error')  # Caches used outside of a streamlit server warn on every call
+    warm_up()
+    server = ThreadingHTTPServer((args.host, args.port), AnalyticsHandler)
+    server.verbose = args.verbose
+    print(f"Serving the analytics functions on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import statistics
+import tracemalloc
+import numpy as np
+import plotly.express as px
+import plotly.io as pio
+import streamlit as st
+from streamlit.logger import set_log_level
+from streamlit.testing.v1 import AppTest
+from columnar_cache import CACHE_FILE, CSV_FILE, prepare_games_frame, build_columnar_cache
+from data_loader import load_csv_data, load_column_stats, build_filter_mask, default_filter_ranges, DEFAULT_MIN_FILTER
+from derived_columns import with_derived_columns, load_derived_column, PRICE_BIN_LABELS
+from game_index import load_game_index, load_incidence_matrix, warm_indexes
+from aggregate_cube import load_aggregate_cube, build_aggregate_cubes, scan_partials, CUBE_METRICS
+from result_cache import GLOBAL_RESULTS
+from figures import FIGURES, LEAN_FIGURES, lean_bar, prune_template
+from synthetic_catalog import write_synthetic_catalog
+
+# Benchmarks of the data path of the pages, run headlessly against the real cleaned files and synthetic catalogs.
+# Every stage (loading, filtering, binning, indexes, grouping, figure construction and every page as a whole, run with
+# streamlit's AppTest) is timed over a few runs, then run once more under tracemalloc for its peak memory and the
+# allocations it leaves behind (its results and caches). Results are compared to stored baselines, and the benchmark
+# exits with an error when a stage got slower or needs more memory than its baseline allows.
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SYNTHETIC_CATALOGS = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000}
+CATALOG_DIR = 'benchmark_data'
+BASELINE_FILE = 'benchmark_baselines.json'
+
+PAGES = {
+    'Game Price': 'pages/1_1._Game_Price.py',
+    'Release Time': 'pages/2_2._Release_Time.py',
+    'Trends Analysis': 'pages/3_3._Trends_Analysis.py',
+    'Language Support': 'pages/4_4._Language_Support.py',
+    'OS Support': 'pages/5_5._OS_Support.py',
+}
+
+# A stage regresses when it is slower (or needs more memory) than its baseline by more than the tolerance and the
+# minimum difference, which keeps the noise of short stages out
+TIME_TOLERANCE = 0.5
+MEMORY_TOLERANCE = 0.2
+MIN_TIME_MS = 5
+MIN_MEMORY_MB = 1
+
+# Drop every cache of the app, so the next stage starts from a cold process
+def clear_caches():
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    GLOBAL_RESULTS.clear()
+    FIGURES.clear()
+
+# Games passing the default sidebar filter, through the cached filter mask like apply_filters_sidebar
+def filtered_frame():
+    ranges = default_filter_ranges()
+    return load_csv_data()[build_filter_mask(tuple(tuple(filter_range) for filter_range in ranges))]
+
+# Headless session of a page with the default sidebar filter
+def page_session(page):
+    app = AppTest.from_file(os.path.join(APP_DIR, page), default_timeout=600)
+    app.session_state['min_filter'] = dict(DEFAULT_MIN_FILTER)
+    app.session_state['max_filter'] = {}
+    return app
+
+# Run a page session, failing the benchmark on any exception of the page
+def run_page(app):
+    app.run()
+    if app.exception:
+        raise RuntimeError(f"Page failed: {app.exception[0].value}")
+    return app
+
+# Stages of a catalog as {name: (setup, run)}: setup prepares the state of the stage (e.g. clears its cache) and is not
+# measured, run is the measured work
+def benchmark_stages():
+    state = {}
+
+    def setup_load_cache():
+        clear_caches()
+        if not os.path.exists(CACHE_FILE):
+            build_columnar_cache()
+
+    def setup_grouping():
+        state['df'] = with_derived_columns(filtered_frame(), 'Price Bin')
+
+    # Scan the filtered games grouped by price bin and by release month, the path of the pages under sidebar filters
+    def grouping():
+        df = state['df']
+        values = df[CUBE_METRICS].to_numpy(dtype=float)
+        all_rows = np.ones((1, len(df)), dtype=bool)
+        price_bins = scan_partials(all_rows, df['Price Bin'].cat.codes.to_numpy(dtype='int64'), len(PRICE_BIN_LABELS),
+                                   values, CUBE_METRICS)
+        months = scan_partials(all_rows, df['Release Month'].to_numpy(dtype='int64', na_value=0) - 1, 12, values, CUBE_METRICS)
+        return price_bins, months
+
+    def setup_figures():
+        setup_grouping()
+        state['agg_data'] = grouping()[0].summary(0, PRICE_BIN_LABELS, 'Price Bin')
+
+    # Build and serialize a price bin bar chart of every metric, like Game Price on a figure cache miss
+    def figures():
+        specs = []
+        for metric in CUBE_METRICS:
+            if LEAN_FIGURES:
+                fig = lean_bar(state['agg_data'], x='Price Bin', y=metric, color='Games released', title=metric,
+                               labels={}, color_continuous_scale='Viridis_r')
+            else:
+                fig = px.bar(state['agg_data'], x='Price Bin', y=metric, color='Games released', title=metric,
+                             color_continuous_scale='Viridis_r')
+            specs.append(pio.to_json(prune_template(fig), validate=False))
+        return specs
+
+    stages = {
+        'load (CSV)': (clear_caches, prepare_games_frame),
+        'load (columnar cache)': (setup_load_cache, load_csv_data),
+        'filter': (lambda: (load_column_stats.clear(), build_filter_mask.clear()), filtered_frame),
+        'binning': (load_derived_column.clear, lambda: with_derived_columns(load_csv_data(), 'Price Bin', 'OS_code',
+                                                                            'OS_combination', 'OS_count')),
+        'indexes': (lambda: (load_game_index.clear(), load_incidence_matrix.clear()), warm_indexes),
+        'aggregate cube': (load_aggregate_cube.clear, build_aggregate_cubes),
+        'grouping': (setup_grouping, grouping),
+        'figures': (setup_figures, figures),
+    }
+    for name, page in PAGES.items():
+        # First visit of a session (shared data loaded, no page result or figure cached yet), then a rerun of it
+        def setup_page(page=page):
+            GLOBAL_RESULTS.clear()
+            FIGURES.clear()
+            state['app'] = page_session(page)
+        stages[f"page: {name}"] = (setup_page, lambda: run_page(state['app']))
+        stages[f"page: {name} (rerun)"] = (lambda: None, lambda: run_page(state['app']))
+    return stages
+
+# Median wall time of repeat runs of a stage, then the peak memory of one more run and the number and size of the
+# memory blocks it allocated and still holds (as traced by tracemalloc, i.e. Python and numpy allocations)
+def measure(setup, run, repeat):
+    times = []
+    for _ in range(repeat):
+        setup()
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = run()
+        _, peak = tracemalloc.get_traced_memory()
+        retained = tracemalloc.take_snapshot().statistics('filename')
+    finally:
+        tracemalloc.stop()
+    del result
+    return {
+        'time_ms': 1000 * statistics.median(times),
+        'peak_mb': peak / 2**20,
+        'retained_mb': sum(stat.size for stat in retained) / 2**20,
+        'allocations': sum(stat.count for stat in retained),
+    }
+
+# Directory of a catalog, writing a synthetic catalog first if it does not exist yet
+def catalog_dir(name, data_dir, catalogs_dir, regenerate=False):
+    if name == 'real':
+        return data_dir
+    path = os.path.join(catalogs_dir, name)
+    if regenerate or not os.path.exists(os.path.join(path, CSV_FILE)):
+        print(f"Writing the {name} games synthetic catalog to {path}")
+        write_synthetic_catalog(SYNTHETIC_CATALOGS[name], path, data_dir)
+    return path
+
+# Run the (selected) stages against a catalog directory
+def run_catalog(path, repeat, selected=None):
+    results = {}
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        clear_caches()
+        for stage, (setup, run) in benchmark_stages().items():
+            if selected and not any(name in stage for name in selected):
+                continue
+            results[stage] = measure(setup, run, repeat)
+            print(format_result(stage, results[stage]))
+    finally:
+        clear_caches()
+        os.chdir(cwd)
+    return results
+
+def format_result(stage, result, baseline=None):
+    line = (f"  {stage:<36} {result['time_ms']:>10.1f} ms {result['peak_mb']:>9.1f} MiB peak "
+            f"{result['retained_mb']:>9.1f} MiB {result['allocations']:>9} allocations")
+    if baseline:
+        line += f"   x{result['time_ms'] / max(baseline['time_ms'], 1e-9):.2f} time, x{result['peak_mb'] / max(baseline['peak_mb'], 1e-9):.2f} peak"
+    return line
+
+# Stages slower or needing more memory than their baseline, as (catalog, stage, reason)
+def find_regressions(results, baselines, time_tolerance=TIME_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE):
+    regressions = []
+    for catalog, stages in results.items():
+        for stage, result in stages.items():
+            baseline = baselines.get(catalog, {}).get(stage)
+            if not baseline:
+                continue
+            if result['time_ms'] > max(baseline['time_ms'] * (1 + time_tolerance), baseline['time_ms'] + MIN_TIME_MS):
+                regressions.append((catalog, stage, f"{baseline['time_ms']:.1f} -> {result['time_ms']:.1f} ms"))
+            if result['peak_mb'] > max(baseline['peak_mb'] * (1 + memory_tolerance), baseline['peak_mb'] + MIN_MEMORY_MB):
+                regressions.append((catalog, stage, f"{baseline['peak_mb']:.1f} -> {result['peak_mb']:.1f} MiB peak"))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the data path of every page")
+    parser.add_argument('catalogs', nargs='*', default=['real'] + list(SYNTHETIC_CATALOGS),
+                        help="catalogs to benchmark: real and/or " + ", ".join(SYNTHETIC_CATALOGS) + " (default: all)")
+    parser.add_argument('--stages', nargs='*', help="only run the stages whose name contains one of these")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per stage (default: 3)")
+    parser.add_argument('--data-dir', default='.', help="directory of the real cleaned files (default: .)")
+    parser.add_argument('--catalogs-dir', default=CATALOG_DIR, help=f"directory of the synthetic catalogs (default: {CATALOG_DIR})")
+    parser.add_argument('--regenerate', action='store_true', help="write the synthetic catalogs again")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help=f"baseline file (default: {BASELINE_FILE})")
+    parser.add_argument('--save-baseline', action='store_true', help="store the results as the new baseline")
+    parser.add_argument('--time-tolerance', type=float, default=TIME_TOLERANCE)
+    parser.add_argument('--memory-tolerance', type=float, default=MEMORY_TOLERANCE)
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    args = parser.parse_args()
+    set_log_level('error')  # Caches used outside of a streamlit server warn on every call
+
+    data_dir, catalogs_dir = os.path.abspath(args.data_dir), os.path.abspath(args.catalogs_dir)
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baselines = json.load(f)
+
+    results = {}
+    for catalog in args.catalogs:
+        if catalog != 'real' and catalog not in SYNTHETIC_CATALOGS:
+            parser.error(f"unknown catalog {catalog}")
+        if catalog == 'real' and not os.path.exists(os.path.join(data_dir, CSV_FILE)):
+            print(f"Skipping the real catalog, {CSV_FILE} is not in {data_dir}")
+            continue
+        path = catalog_dir(catalog, data_dir, catalogs_dir, args.regenerate)
+        print(f"{catalog} ({path})")
+        results[catalog] = run_catalog(path, args.repeat, args.stages)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        for catalog, stages in results.items():
+            baselines.setdefault(catalog, {}).update(stages)
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Saved the baseline to {args.baseline}")
+        return
+
+    print("Compared to the baseline:" if baselines else f"No baseline in {args.baseline}, run with --save-baseline")
+    for catalog, stages in results.items():
+        for stage, result in stages.items():
+            if stage in baselines.get(catalog, {}):
+                print(f"{catalog:>5}" + format_result(stage, result, baselines[catalog][stage]))
+    regressions = find_regressions(results, baselines, args.time_tolerance, args.memory_tolerance)
+    for catalog, stage, reason in regressions:
+        print(f"REGRESSION {catalog} {stage}: {reason}")
+    if regressions:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from figures import lean_bar, LEAN_FIGURES
+
+# Figures of the pages as functions of their aggregated data (see analytics.py), shared by the pages, which cache them
+# (see figures.py), and the batch reports (see report.py)
+
+# Define background colors for the Release Time graphs
+RELEASE_BACKGROUND_COLORS = ['#f9fbe7', '#e0f7fa', '#fce4ec', '#f3e5f5', '#e8f5e9', '#fff3e0']
+
+# Predefined colors for the lines of the Trends combinations
+TREND_COLORS = ['#D81B60', '#1E88E5', '#FFC107']
+
+# Function to calculate dynamic y-axis range (from 0 at the lowest)
+def get_y_range(df, column):
+    min_value = df[column].min()
+    max_value = df[column].max()
+    buffer = (max_value - min_value) * 0.2  # Adding a 20% buffer
+    return [max(0, min_value - buffer), max_value + buffer]
+
+# Dynamic y-axis for global range when comparing
+def get_global_y_range(min_value, max_value):
+    buffer = (max_value - min_value) * 0.2 # Adding a 20% buffer
+    return [max(0, min_value - buffer), max_value + buffer]
+
+# Bar plot of a metric by Price Bin (Game Price)
+def price_bin_figure(agg_data, target_dimension):
+    title = f'{target_dimension} by Price Bin' + (" (Averaged per bin)" if target_dimension != "Games released" else "")
+    labels = {'Price Bin': 'Price Bin ($)', target_dimension: f'Average {target_dimension}'}
+    if LEAN_FIGURES:
+        fig = lean_bar(agg_data, x='Price Bin', y=target_dimension, color='Games released', title=title, labels=labels,
+                       color_continuous_scale='Viridis_r')
+    else:
+        fig = px.bar(agg_data, x='Price Bin', y=target_dimension, title=title, labels=labels,
+                     color='Games released', color_continuous_scale='Viridis_r')
+                     # text=target_dimension)
+
+    fig.update_yaxes(range=get_y_range(agg_data, target_dimension),
+                     tickformat='.0%' if target_dimension == 'Review score' else None)
+
+    if target_dimension in ("Average playtime", "Peak CCU"):
+        fig.add_annotation(
+            dict(font=dict(size=18), x=0, y=1.05,
+                showarrow=False, text=f"*Excluding games with 0 {target_dimension}",
+                xref="paper", yref="paper", xanchor='left', yanchor='bottom')
+        )
+
+    # Update layout to show labels and apply visual enhancements
+    # fig.update_traces(texttemplate='%{text:.3s}', textposition='outside')
+    fig.update_layout(title_font_size=24, xaxis_title_font_size=18, yaxis_title_font_size=18, uniformtext_minsize=8, uniformtext_mode='hide',
+                      coloraxis_colorbar=dict(yanchor="top", y=1.05, x=1, xanchor="right", orientation="h"))
+    return fig
+
+# Bar plot of a metric by month or quarter (Release Time): the overall data, and the filtered data if filtered is set
+# (with the comparison data, if any)
+def release_period_figure(aggregated_all_data, aggregated_data, aggregated_data_2, y_category, group_by, background_color,
+                          filtered):
+    compare = aggregated_data_2 is not None
+    group_column = 'Release Month' if group_by == "Months" else 'Release Quarter'
+    x_axis_label = 'Month' if group_by == "Months" else 'Quarter'
+    fig = go.Figure()
+
+    # Calculate the global min and max values for each category
+    global_min = min(aggregated_all_data[y_category].min(), aggregated_data[y_category].min())
+    global_max = max(aggregated_all_data[y_category].max(), aggregated_data[y_category].max())
+
+    if compare:
+        # Include the comparison data in the global range
+        global_min = min(global_min, aggregated_data_2[y_category].min())
+        global_max = max(global_max, aggregated_data_2[y_category].max())
+
+    # Add data for the overall dataset
+    fig.add_trace(go.Bar(
+        x=aggregated_all_data[group_column],
+        y=aggregated_all_data[y_category],
+        name=f'All {y_category}',
+        marker_color='blue',
+        width=0.5 if len(aggregated_all_data[group_column]) == 1 else None  # Adjust bar width if only 1 bar
+    ))
+
+    # Add filtered data (only if filters are applied)
+    if not aggregated_data.empty and filtered:
+        if compare:
+            # Grouped bar plot
+            fig.add_trace(go.Bar(
+                x=aggregated_data[group_column],
+                y=aggregated_data[y_category],
+                name=f'{y_category} (Filtered)',
+                marker_color='orange',
+                width=0.5 if len(aggregated_data[group_column]) == 1 else None
+            ))
+
+            fig.add_trace(go.Bar(
+                x=aggregated_data_2[group_column],
+                y=aggregated_data_2[y_category],
+                name=f'{y_category} (Comparison)',
+                marker_color='black',
+                width=0.5 if len(aggregated_data_2[group_column]) == 1 else None
+            ))
+        else:
+            # Single bar plot for filtered data
+            fig.add_trace(go.Bar(
+                x=aggregated_data[group_column],
+                y=aggregated_data[y_category],
+                name=f'{y_category} (Filtered)',
+                marker_color='orange',
+                width=0.5 if len(aggregated_data[group_column]) == 1 else None
+            ))
+
+    # Set titles for the x and y axis and for the graph
+    fig.update_layout(
+        title=f'{y_category} Over {x_axis_label}s (Averaged Over {group_by})',
+        xaxis_title=x_axis_label,
+        yaxis_title=("" if y_category in ('Average playtime', 'Games released') else "Average ")+y_category,
+        plot_bgcolor=background_color,  # Set background color
+        margin=dict(l=50, r=50, t=50, b=50),  # Adjust the margins to make the graph shorter
+        height=250  # Set graph height (short)
+    )
+
+    # Use global min and max for y-axis range
+    fig.update_yaxes(range=get_global_y_range(global_min, global_max),
+                     tickformat=".0%" if y_category == 'Review score' else None)
+
+    # Ensure all months or quarters are shown on the x-axis
+    if group_by == "Months":
+        fig.update_xaxes(
+            tickmode='array',
+            tickvals=list(range(1, 13)),  # Ensure all months from 1 to 12 are shown
+            ticktext=[str(month) for month in range(1, 13)]
+        )
+    else:
+        fig.update_xaxes(
+            tickmode='array',
+            tickvals=[1, 2, 3, 4],  # Ensure all quarters (1-4) are shown
+            ticktext=['Q1', 'Q2', 'Q3', 'Q4']
+        )
+    return fig
+
+# Legend label of a Trends combination ({'Genres': [...], 'Tags': [...], 'Categories': [...]})
+def trend_label(combination):
+    return "<br>".join([k[0] + ": " + ", ".join(v) for k, v in combination.items() if v])
+
+# x axis and values of a feature of trend plot data, by month or summed by year
+def trend_axis(plot_data, feature, time_granularity):
+    df_plot = pd.DataFrame(plot_data)
+    if time_granularity == "Month":
+        df_plot['date'] = pd.to_datetime(df_plot[['year', 'month']].assign(DAY=1))
+        return df_plot['date'], df_plot[feature]
+    df_plot_grouped = df_plot.groupby('year').sum().reset_index()
+    # df_plot_grouped['Average Review Score'] = 100 * df_plot_grouped['Positive'] / df_plot_grouped['Reviews']
+    return df_plot_grouped['year'], df_plot_grouped[feature]
+
+# Line plot of a feature of all games and of the given (label, plot data, color) series (Trends Analysis)
+def trend_figure(all_plot_data, series, selected_feature, time_granularity):
+    fig = go.Figure()
+    x_axis, y_values = trend_axis(all_plot_data, selected_feature, time_granularity)
+    fig.add_trace(go.Scatter(x=x_axis,
+                            y=y_values,
+                            mode='lines',
+                            name="All Games",
+                            showlegend=True,
+                            line=dict(color="black")))
+
+    for label, plot_data, color in series:
+        x_axis, y_values = trend_axis(plot_data, selected_feature, time_granularity)
+        # Add primary axis trace with distinct predefined color
+        fig.add_trace(go.Scatter(x=x_axis,
+                                 y=y_values,
+                                 mode='lines',
+                                 name=f'{label}',
+                                 showlegend=True,
+                                 line=dict(color=color)))
+
+    fig.update_layout(
+        yaxis=dict(title=selected_feature),
+        xaxis_title="Date (Month)" if time_granularity == "Month" else "Year",
+        showlegend=True
+    )
+    return fig
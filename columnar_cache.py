@@ -0,0 +1,131 @@
+import io
+import os
+import csv
+import json
+import pandas as pd
+import numpy as np
+import pyarrow.feather as feather
+from posting_lists import RowLookup, load_postings, build_lock, write_atomically
+from delta_overlay import load_overlay, overlay_path
+
+CSV_FILE = 'cleaned_games.csv'
+LANGUAGES_FILE = 'supported_languages.json'
+CACHE_FILE = 'cleaned_games.feather'
+VERSION_FILE = 'data_version.json'
+
+LANGUAGE_COUNT_BINS = ["One", "2-4", "5-9", "10+"]
+
+# Columns precomputed from the cleaned CSV columns (see type_games_frame), not offered as sidebar filters
+PRECOMPUTED_COLUMNS = ['Release Year', 'Release Month', 'Release Quarter', 'language_count', 'language_count_bins']
+
+# Current version of the data files, bumped by every (full or incremental) refresh, 0 before the first one
+def data_version(version_file=VERSION_FILE):
+    try:
+        with open(version_file, 'r') as f:
+            return json.load(f)['version']
+    except FileNotFoundError:
+        return 0
+
+# Bump the data version, so running apps reload the data on their next rerun
+def bump_data_version(version_file=VERSION_FILE):
+    version = data_version(version_file) + 1
+
+    def write(tmp_path):
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': version}, f)
+    write_atomically(version_file, write)
+    return version
+
+# Number of languages each game supports, counted from the cleaned {language: [AppID, ...]} postings
+def count_languages(app_ids, supported_languages):
+    rows = RowLookup(app_ids).rows(np.concatenate([ids for _, ids in supported_languages.items()] + [np.empty(0, dtype=np.int64)]))
+    return np.bincount(rows, minlength=len(app_ids))
+
+# Custom binning of the language count (One, 2-4, 5-9, 10+) as an ordered categorical
+def bin_language_count(language_count):
+    bins = np.select([language_count == 1, language_count <= 4, language_count <= 9], LANGUAGE_COUNT_BINS[:3], LANGUAGE_COUNT_BINS[3])
+    return pd.Categorical(bins, categories=LANGUAGE_COUNT_BINS, ordered=True)
+
+# Convert rows of the cleaned CSV to typed, pre-parsed columns
+def type_games_frame(df, language_count):
+    # Parse the release dates once and extract the periods used by the pages
+    df['Release date'] = pd.to_datetime(df['Release date'], errors='coerce', format='mixed')
+    df['Release Year'] = df['Release date'].dt.year.astype('Int16')
+    df['Release Month'] = df['Release date'].dt.month.astype('Int8')
+    df['Release Quarter'] = df['Release date'].dt.quarter.astype('Int8')
+
+    # Precompute the number of supported languages, so the pages never need the full per-game JSON
+    df['language_count'] = language_count
+    df['language_count_bins'] = bin_language_count(df['language_count'])
+
+    # Compact dtypes: AppID as int32, other integer columns as the smallest type that fits (booleans stay bool)
+    df['AppID'] = df['AppID'].astype('int32')
+    return downcast_integers(df)
+
+# Store the integer columns (but AppID) as the smallest integer type that fits their values
+def downcast_integers(df):
+    for column in df.select_dtypes(include=['int8', 'int16', 'int32', 'int64']).columns.drop('AppID'):
+        df[column] = pd.to_numeric(df[column], downcast='integer')
+    return df
+
+# Typed columns of rows of the cleaned CSV under the given header, read back from CSV text like the whole file, so
+# their columns get the types they have in a table of all the games
+def type_csv_rows(columns, rows, language_count):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([columns] + rows)
+    buffer.seek(0)
+    return type_games_frame(pd.read_csv(buffer, dtype={'Name': str}), language_count)
+
+# Read the cleaned CSV and convert it to typed, pre-parsed columns
+def prepare_games_frame(csv_file=CSV_FILE, languages_file=LANGUAGES_FILE):
+    df = pd.read_csv(csv_file)
+    return type_games_frame(df, count_languages(df['AppID'], load_postings(languages_file)))
+
+# Write the typed data to an uncompressed Feather (Arrow IPC) file, which can be memory-mapped.
+# The file is replaced atomically, so running apps keep reading their (memory-mapped) previous version.
+def write_columnar_cache(df, cache_file=CACHE_FILE):
+    write_atomically(cache_file, lambda tmp_path: feather.write_feather(df, tmp_path, compression='uncompressed'))
+
+# Build step: write the cleaned data once to the columnar cache
+def build_columnar_cache(csv_file=CSV_FILE, cache_file=CACHE_FILE, languages_file=LANGUAGES_FILE):
+    df = prepare_games_frame(csv_file, languages_file)
+    write_columnar_cache(df, cache_file)
+    return df
+
+# Read the columnar cache without building it
+def read_columnar_cache(cache_file=CACHE_FILE):
+    # split_blocks avoids consolidating the memory-mapped columns into new 2D blocks
+    return feather.read_table(cache_file, memory_map=True).to_pandas(split_blocks=True)
+
+# Whether the columnar cache is missing or older than its sources
+def cache_stale(csv_file, cache_file, languages_file):
+    return not os.path.exists(cache_file) or os.path.getmtime(cache_file) < max(os.path.getmtime(csv_file), os.path.getmtime(languages_file))
+
+# Merge the overlay of the applied deltas (see delta_overlay.py) into a typed table: the rows of the touched games are
+# replaced by their rows of the overlay, typed on their own
+def overlaid_frame(df, overlay):
+    df = df[~df['AppID'].isin(list(overlay.touched))]
+    if overlay.rows:
+        rows, language_counts = zip(*overlay.rows.values())
+        # The integer columns are widened to fit the values of both frames, then downcast again like in a full build
+        df = downcast_integers(pd.concat([df, type_csv_rows(overlay.columns, list(rows), list(language_counts))]))
+    # The indexes map AppIDs to row positions, so the rows are numbered again
+    return df.reset_index(drop=True)
+
+# Load the cleaned data from the columnar cache, (re)building it first if it is missing or older than its sources.
+# Threads loading a stale cache at the same time build it once. The deltas applied since the last full run of the
+# pipeline are merged in.
+def load_games_frame(csv_file=CSV_FILE, cache_file=CACHE_FILE, languages_file=LANGUAGES_FILE):
+    df = None
+    if cache_stale(csv_file, cache_file, languages_file):
+        with build_lock(cache_file):
+            if cache_stale(csv_file, cache_file, languages_file):  # Unless another thread rebuilt it meanwhile
+                df = build_columnar_cache(csv_file, cache_file, languages_file)
+    if df is None:
+        df = read_columnar_cache(cache_file)
+    overlay = load_overlay(overlay_path(cache_file))
+    return df if overlay is None else overlaid_frame(df, overlay)
+
+if __name__ == '__main__':
+    df = build_columnar_cache()
+    print(f"Wrote {len(df)} games to {CACHE_FILE}")
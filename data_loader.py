@@ -1,33 +1,128 @@
 import streamlit as st
 import pandas as pd
-import json
+import numpy as np
+import threading
+from columnar_cache import load_games_frame, data_version, PRECOMPUTED_COLUMNS
+from instrumentation import begin_rerun, span, timed
 
-# Cached function to load CSV data
-@st.cache_data
+# Default sidebar filters of a new visitor {column: min value} (set by Welcome.py)
+DEFAULT_MIN_FILTER = {'Reviews': 20.0}
+
+# Cached functions of data derived from the loaded data, cleared whenever the data version changes (see
+# check_data_version)
+DERIVED_CACHES = []
+LOADED_VERSION = {}
+VERSION_LOCK = threading.Lock()
+
+# Decorator to register a cached function as derived from the loaded data
+def derived_cache(cached_func):
+    DERIVED_CACHES.append(cached_func)
+    return cached_func
+
+# Cached function to load CSV data of a data version (read from its typed columnar cache, see columnar_cache.py)
+# The frame is shared by all pages and sessions and must never be modified, derived columns live in derived_columns.py
+@st.cache_resource(max_entries=1)
+def load_versioned_csv_data(version):
+    return load_games_frame()
+
+# Current data version, dropping every derived cache if it changed since the last check. A refresh (see
+# preprocessing.py) bumps the version, so the next rerun reloads the data without restarting the app. It must be called
+# outside of any cached function, at least once per rerun (see load_data_for_page) and per analytics call (see
+# analytics.py), since reruns that only hit caches never reach load_csv_data.
+def check_data_version():
+    version = data_version()
+    with VERSION_LOCK:
+        if LOADED_VERSION.setdefault('version', version) != version:
+            for cached_func in DERIVED_CACHES:
+                cached_func.clear()
+            LOADED_VERSION['version'] = version
+    return version
+
+# CSV data of the current data version
+@timed('load_csv_data')
 def load_csv_data():
-    return pd.read_csv('cleaned_games.csv')
+    return load_versioned_csv_data(check_data_version())
+
+# Cached function to get the integer release year/month of every game with a valid release date (indexed like the CSV rows)
+@derived_cache
+@st.cache_resource
+def load_release_periods():
+    release_periods = load_csv_data()[['Release Year', 'Release Month']].dropna().astype(int)
+    return release_periods.rename(columns={'Release Year': 'year', 'Release Month': 'month'})
 
-# Cached function to load JSON data
+# Cached statistics catalog of every column of the dataset, computed once so the widgets never rescan the frame
+# {column: {'dtype', 'nulls', 'cardinality', 'numeric', and for numeric columns 'min', 'max', 'quantiles'}}
+@derived_cache
 @st.cache_data
-def load_json_data(file):
-    with open(file, 'r') as f:
-        return json.load(f)
-    
-# Function to filter the JSON data after applying the CSV filters
-def filter_json_data(json_data, filtered_csv_df, json_key_column='AppID'):
-    filtered_keys = set(filtered_csv_df[json_key_column].astype(str).tolist())
-    return {key: json_data[key] for key in json_data if key in filtered_keys}
+def load_column_stats():
+    df = load_csv_data()
+    stats = {}
+    for column in df.columns:
+        values = df[column]
+        column_stats = {
+            'dtype': str(values.dtype),
+            'nulls': int(values.isna().sum()),
+            'cardinality': int(values.nunique()),
+            'numeric': pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values),
+        }
+        if column_stats['numeric']:
+            column_stats['min'] = float(values.min())
+            column_stats['max'] = float(values.max())
+            column_stats['quantiles'] = values.quantile([0.05, 0.25, 0.5, 0.75, 0.95]).astype(float).to_dict()
+        stats[column] = column_stats
+    return stats
+
+# Cached function to build one combined boolean mask over the full dataset for a tuple of (column, min, max) range filters,
+# reruns with the same filters reuse the mask instead of filtering the frame again
+@derived_cache
+@st.cache_data(max_entries=256)
+def build_filter_mask(ranges):
+    df = load_csv_data()
+    mask = np.ones(len(df), dtype=bool)
+    for column, min_value, max_value in ranges:
+        # Missing values never pass a range filter
+        mask &= df[column].between(min_value, max_value).to_numpy(dtype=bool, na_value=False)
+    return mask
+
+# Cached function to get the games passing a tuple of normalized (column, min, max) range filters, shared by all
+# sessions (and the analytics functions, see analytics.py) and never modified
+@derived_cache
+@st.cache_resource(max_entries=8)
+def load_filtered_games(ranges):
+    df = load_csv_data()
+    if ranges:
+        df = df[build_filter_mask(ranges)]
+    return df
+
+# Canonical form of a list of (column, min, max) range filters, so equal filter states of different sessions are equal:
+# float bounds, sorted by column, without the ranges that keep every game (full range of a column without nulls)
+def normalize_filter_ranges(ranges, column_stats):
+    normalized = []
+    for column, min_value, max_value in sorted(ranges):
+        stats = column_stats[column]
+        if stats['nulls'] == 0 and min_value <= stats['min'] and max_value >= stats['max']:
+            continue
+        normalized.append([column, float(min_value), float(max_value)])
+    return normalized
+
+# Normalized ranges of the default sidebar filters, from their min value to the max of the column
+def default_filter_ranges():
+    column_stats = load_column_stats()
+    return normalize_filter_ranges([(column, min_value, column_stats[column]['max'])
+                                    for column, min_value in DEFAULT_MIN_FILTER.items()], column_stats)
 
 # Sidebar filters functionality, which remembers user selections between pages
-def apply_filters_sidebar(df):
+@timed('apply_filters_sidebar')
+def apply_filters_sidebar():
     st.sidebar.header("🔍 Apply Filters")
+    column_stats = load_column_stats()
 
     min_filter = st.session_state.get('min_filter', {})
     max_filter = st.session_state.get('max_filter', {})
     # Multiselect for choosing which features to filter by
     selected_filters = st.sidebar.multiselect(
         "Select features to filter by",
-        options=[col for col in df.columns if col not in ['AppID', 'Name', 'Release date']],
+        options=[col for col in column_stats if col not in ['AppID', 'Name', 'Release date'] + PRECOMPUTED_COLUMNS],
         # default=list(min_filter.keys())  # Default filters are set here
         default = min_filter.keys()
     )
@@ -37,12 +132,13 @@ def apply_filters_sidebar(df):
         if column not in selected_filters:
             min_filter.pop(column)
 
-    # Apply filters to the DataFrame and store the result in session_state
+    # Collect the range of every selected filter, the bounds are taken from the full dataset
+    ranges = []
     for column in selected_filters:
         st.sidebar.write(f"**{column}**")
-        if df[column].dtype == 'int64' or df[column].dtype == 'float64':
-            min_value = float(df[column].min())
-            max_value = float(df[column].max())
+        if column_stats[column]['numeric']:
+            min_value = column_stats[column]['min']
+            max_value = column_stats[column]['max']
 
             # Inline inputs and slider for numeric filters
             col1, col2 = st.sidebar.columns(2)
@@ -72,13 +168,19 @@ def apply_filters_sidebar(df):
             st.session_state[f"min_filter"][column] = manual_min
             st.session_state[f"max_filter"][column] = manual_max
 
-            df = df[(df[column] >= manual_min) & (df[column] <= manual_max)]
-            st.session_state['filtered_df'] = df
+            ranges.append((column, manual_min, manual_max))
 
-    # Save the filtered DataFrame in session_state for later use
-    st.session_state['filtered_df'] = df
-    return df
+    # The normalized filter state is part of the key of the memoized page computations (see result_cache.py)
+    ranges = normalize_filter_ranges(ranges, column_stats)
+    st.session_state['filter_ranges'] = ranges
+
+    # Apply all filters at once, the filtered frame is cached per filter state
+    return load_filtered_games(tuple(tuple(filter_range) for filter_range in ranges))
 
-# Function to be called in each page to load the CSV and JSON data
+# Function to be called in each page to load the filtered data, it starts the instrumentation of the rerun and picks up
+# a new data version
 def load_data_for_page():
-    return apply_filters_sidebar(load_csv_data())
\ No newline at end of file
+    begin_rerun()
+    with span('load_data_for_page'):
+        check_data_version()
+        return apply_filters_sidebar()
\ No newline at end of file
@@ -0,0 +1,73 @@
+import os
+import json
+import functools
+
+# Append-only overlay of the deltas applied since the last full run of the preprocessing pipeline.
+# Applying a delta (python preprocessing.py delta.json --update) only appends one line to the overlay file of the output
+# directory, with the games it touched and their cleaned CSV rows and index postings:
+#
+#   {"touched": [AppID, ...], "columns": [CSV column, ...], "rows": [[AppID, ...], ...], "language_counts": [n, ...],
+#    "postings": {index file: {key: [AppID, ...]}}}
+#
+# The outputs of the last full run stay the base, the overlay is merged into them lazily by their readers: the rows of
+# the touched games are replaced when the columnar table is loaded (see columnar_cache.load_games_frame), and the AppIDs
+# of the touched games of a key when the key is read (see posting_lists.load_postings). Lines of later deltas win.
+# The overlay is folded into the base files by python preprocessing.py --compact, and dropped by every full run.
+
+DELTA_FILE = 'delta.jsonl'
+
+# Path of the overlay of the output file at path
+def overlay_path(path):
+    return os.path.join(os.path.dirname(path), DELTA_FILE)
+
+# Append the line of a delta to an overlay. A line is only read once complete, so an interrupted append is ignored.
+def append_delta(entry, path):
+    with open(path, 'a', encoding='utf8') as f:
+        f.write(json.dumps(entry) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+# Combined deltas of an overlay, AppIDs as integers:
+#   touched   AppIDs touched by any delta (their base rows and postings are replaced)
+#   rows      {AppID: (cleaned CSV row, number of languages)} of the touched games with a complete row
+#   postings  {index file: {key: {AppID: None}}} of the touched games (the keys of release.json are 'year-month')
+class DeltaOverlay:
+    def __init__(self, entries):
+        self.touched = set()
+        self.columns = None
+        self.rows = {}
+        self.postings = {}
+        for entry in entries:
+            touched = set(map(int, entry['touched']))
+            self.touched |= touched
+            for app_id in touched:
+                self.rows.pop(app_id, None)
+            for postings in self.postings.values():
+                for ids in postings.values():
+                    for app_id in touched:
+                        ids.pop(app_id, None)
+            self.columns = entry['columns']
+            for row, language_count in zip(entry['rows'], entry['language_counts']):
+                self.rows[int(row[0])] = (row, language_count)
+            for file, postings in entry['postings'].items():
+                merged = self.postings.setdefault(file, {})
+                for key, ids in postings.items():
+                    merged.setdefault(key, {}).update(dict.fromkeys(map(int, ids)))
+
+    # AppIDs of the touched games the overlay adds to every key of an index file
+    def added(self, file):
+        return {key: list(ids) for key, ids in self.postings.get(file, {}).items() if ids}
+
+# Overlay of an output directory (see overlay_path), None without applied deltas. Overlays are parsed once per version
+# of the file.
+def load_overlay(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return read_overlay(path, stat.st_mtime_ns, stat.st_size)
+
+@functools.lru_cache(maxsize=8)
+def read_overlay(path, mtime_ns, size):
+    with open(path, 'r', encoding='utf8') as f:
+        return DeltaOverlay([json.loads(line) for line in f if line.endswith('\n')])
@@ -0,0 +1,62 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+from data_loader import load_csv_data, derived_cache
+
+# Derived columns, computed once over the full (read-only) dataset and shared by all pages and sessions.
+# Every derived column is a function that takes the full dataset and returns a Series indexed like it.
+DERIVED_COLUMNS = {}
+
+# Decorator to register a derived column under its name
+def derived_column(name):
+    def register(func):
+        DERIVED_COLUMNS[name] = func
+        return func
+    return register
+
+# Cached function to compute a derived column over the full dataset
+@derived_cache
+@st.cache_resource
+def load_derived_column(name):
+    return DERIVED_COLUMNS[name](load_csv_data()).rename(name)
+
+# Return the (filtered) frame with the requested derived columns added, the shared frame itself is never modified
+def with_derived_columns(df, *names):
+    return df.assign(**{name: load_derived_column(name) for name in names})
+
+# Price bins with free games in a separate bin
+PRICE_BINS = [-0.01, 0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, float('inf')]
+PRICE_BIN_LABELS = ['Free', '(0,10]', '(10,20]', '(20,30]', '(30,40]', '(40,50]', '(50,60]',
+                    '(60,70]', '(70,80]', '(80,90]', '(90,100]', '>100']
+
+# Price Bin as an ordered categorical, prices outside the bins are NaN
+@derived_column('Price Bin')
+def price_bin(df):
+    return pd.cut(df['Price'], bins=PRICE_BINS, labels=PRICE_BIN_LABELS, include_lowest=True, right=True)
+
+OS_ORDER = ['Windows', 'Mac', 'Linux']
+OS_COMBINATION_ORDER = ['W', 'M', 'L', 'W+M', 'W+L', 'M+L', 'W+M+L']
+
+# Lookup tables indexed by the bit-packed OS code (Windows*1 + Mac*2 + Linux*4):
+# the position of the combination in OS_COMBINATION_ORDER (-1 for no OS) and the number of supported OS
+OS_CODE_COMBINATIONS = np.array([-1, 0, 1, 3, 2, 4, 5, 6], dtype='int8')
+OS_CODE_COUNTS = np.array(['0', '1', '1', '2', '1', '2', '2', '3'], dtype=object)
+
+# Bit-packed code of the supported OS
+@derived_column('OS_code')
+def os_code(df):
+    return (df['Windows'].astype('uint8') + 2 * df['Mac'].astype('uint8') + 4 * df['Linux'].astype('uint8')).astype('uint8')
+
+# OS combinations (shortened names) of an array of OS codes, as an ordered categorical
+def os_code_combinations(codes):
+    return pd.Categorical.from_codes(OS_CODE_COMBINATIONS[codes], categories=OS_COMBINATION_ORDER, ordered=True)
+
+# OS combination (shortened names) as an ordered categorical
+@derived_column('OS_combination')
+def os_combination(df):
+    return pd.Series(os_code_combinations(load_derived_column('OS_code').to_numpy()), index=df.index)
+
+# Number of supported OS, as a string label
+@derived_column('OS_count')
+def os_count(df):
+    return pd.Series(OS_CODE_COUNTS[load_derived_column('OS_code').to_numpy()], index=df.index)
@@ -0,0 +1,49 @@
+import os
+import json
+import pandas as pd
+import streamlit as st
+from instrumentation import finish_rerun, span_stats, counter_stats
+from result_cache import result_cache_stats
+from game_index import index_footprint
+
+# Optional developer panel in the sidebar with the timings of the current rerun and of every span across sessions,
+# shown when DEVELOPER_PANEL=1 is set or a page is opened with ?dev=1
+DEVELOPER_PANEL = os.environ.get('DEVELOPER_PANEL') == '1'
+
+# JSON export of the instrumentation of the process: spans (p50/p95 across sessions), counters, result cache stats and
+# the footprint of the indexes
+def export_instrumentation():
+    return {'spans': span_stats(), 'counters': counter_stats(), 'result_cache': result_cache_stats(),
+            'indexes': index_footprint()}
+
+def developer_panel_enabled():
+    return DEVELOPER_PANEL or st.query_params.get('dev') == '1'
+
+# Called last by every page: records the rerun and shows the developer panel if enabled
+def developer_panel(page):
+    rerun = finish_rerun(page)
+    if rerun is None or not developer_panel_enabled():
+        return
+
+    with st.sidebar.expander("🛠️ Developer", expanded=True):
+        st.metric("This rerun", f"{1000 * rerun['total']:.0f} ms")
+
+        # Spans of this rerun, grouped by name (in order of their first call)
+        spans = pd.DataFrame(rerun['spans'], columns=['span', 'ms'])
+        spans['ms'] *= 1000
+        spans = spans.groupby('span', sort=False)['ms'].agg(['count', 'sum']).rename(columns={'count': 'calls', 'sum': 'ms'})
+        st.dataframe(spans.style.format({'ms': '{:.1f}'}), use_container_width=True)
+
+        st.caption("All sessions")
+        stats = pd.DataFrame.from_dict(span_stats(), orient='index')
+        if not stats.empty:
+            st.dataframe(stats.style.format({'p50_ms': '{:.1f}', 'p95_ms': '{:.1f}', 'total_ms': '{:.0f}'}),
+                         use_container_width=True)
+        st.json({'counters': counter_stats(), 'result_cache': result_cache_stats()}, expanded=False)
+
+        st.caption("Indexes")
+        indexes = pd.DataFrame.from_dict(index_footprint(), orient='index')
+        st.dataframe(indexes.style.format({'MB': '{:.1f}', 'build_ms': '{:.0f}', 'keys': '{:.0f}'}, na_rep=''),
+                     use_container_width=True)
+        st.download_button("Export JSON", json.dumps(export_instrumentation(), indent=2),
+                           file_name='instrumentation.json', mime='application/json')
@@ -0,0 +1,87 @@
+import os
+import json
+import pickle
+import hashlib
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+from result_cache import LRUCache
+from instrumentation import span, increment
+
+# Cache of the built Plotly figures, shared by all sessions of the process. Building a figure (plotly.express in
+# particular) costs far more than sending it, and most reruns redraw charts whose data did not change, so every figure
+# is keyed on a hash of its name, its aggregated data and its styling parameters. Cached figures are sent as they are
+# and must never be modified.
+# The template of every cached figure only keeps the trace defaults of the trace types the figure uses, which makes
+# the JSON sent to the browser about half as large without changing the chart.
+# In lean mode (set LEAN_FIGURES=1) the plotly.express charts are built directly as graph_objects traces of numpy arrays,
+# which skips plotly.express and sends the numeric data as typed (base64 binary) arrays.
+FIGURE_MAX_ENTRIES = 512
+LEAN_FIGURES = os.environ.get('LEAN_FIGURES') == '1'
+
+FIGURES = LRUCache(max_entries=FIGURE_MAX_ENTRIES)
+
+# Hash of the name, data (any picklable value, e.g. DataFrames) and styling parameters (any JSON-like value) of a figure
+def figure_key(name, data, style=()):
+    key = hashlib.sha256(json.dumps([name, style], sort_keys=True, default=str).encode('utf8'))
+    key.update(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+    return key.hexdigest()
+
+# Keep only the template trace defaults of the trace types of a figure
+def prune_template(fig):
+    template = fig.layout.template.to_plotly_json()
+    used = {trace.type for trace in fig.data}
+    template['data'] = {trace_type: traces for trace_type, traces in template.get('data', {}).items() if trace_type in used}
+    fig.layout.template = template
+    return fig
+
+# Figure built by build() for the given name, data and styling parameters, built only if it is not cached yet
+def cached_figure(name, data, style, build):
+    key = figure_key(name, data, style)
+    fig = FIGURES.get(key)
+    increment('figures built' if fig is None else 'figures cached')
+    if fig is None:
+        with span(f"figure:{name}"):
+            fig = prune_template(build())
+        FIGURES.put(key, fig)
+    return fig
+
+# Colors of the groups of a discrete color map, groups missing from the map take the colors of the template colorway
+def group_colors(groups, color_map):
+    colorway = pio.templates[pio.templates.default].layout.colorway
+    unmapped = [group for group in dict.fromkeys(groups) if group not in color_map]
+    colors = dict(color_map, **{group: colorway[i % len(colorway)] for i, group in enumerate(unmapped)})
+    return [colors[group] for group in groups]
+
+# Lean counterpart of px.bar(data, x=x, y=y, color=color, title=title, labels=labels, color_continuous_scale=...)
+# for a numeric color column
+def lean_bar(data, x, y, color, title, labels, color_continuous_scale):
+    labels = {column: labels.get(column, column) for column in [x, y, color]}
+    fig = go.Figure(go.Bar(
+        x=data[x].to_numpy(), y=data[y].to_numpy(),
+        marker=dict(color=data[color].to_numpy(), coloraxis='coloraxis'),
+        hovertemplate=f"{labels[x]}=%{{x}}<br>{labels[y]}=%{{y}}<br>{labels[color]}=%{{marker.color}}<extra></extra>",
+        showlegend=False))
+    fig.update_layout(title=title, xaxis_title=labels[x], yaxis_title=labels[y], margin=dict(t=60),
+                      coloraxis=dict(colorscale=color_continuous_scale, colorbar=dict(title=dict(text=labels[color]))))
+    return fig
+
+# Lean counterpart of px.scatter(data, x=x, y=y, size=size, color=x, color_discrete_map=color_map, title=title, ...)
+# with one marker per group: a single trace colored per marker instead of a trace per group.
+# size is a column of data or an array, text a column of data and custom_data a list of columns.
+def lean_scatter(data, x, y, size, color_map, title, size_max=20, text=None, custom_data=None, category_orders=None):
+    sizes = np.asarray(data[size] if isinstance(size, str) else size, dtype=float)
+    size_label = size if isinstance(size, str) else 'size'
+    fig = go.Figure(go.Scatter(
+        x=data[x].to_numpy(), y=data[y].to_numpy(dtype=float),
+        mode='markers+text' if text else 'markers',
+        text=data[text].to_numpy() if text else None,
+        customdata=data[custom_data].to_numpy() if custom_data else None,
+        marker=dict(color=group_colors(data[x].tolist(), color_map), size=sizes, sizemode='area',
+                    sizeref=2 * sizes.max() / size_max ** 2 if len(sizes) else 1),
+        hovertemplate=f"{x}=%{{x}}<br>{y}=%{{y}}<br>{size_label}=%{{marker.size}}<extra></extra>",
+        showlegend=False))
+    fig.update_layout(title=title, xaxis_title=x, yaxis_title=y, margin=dict(t=60))
+    if category_orders and x in category_orders:
+        fig.update_xaxes(categoryorder='array', categoryarray=category_orders[x])
+    return fig
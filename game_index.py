@@ -0,0 +1,178 @@
+import os
+import time
+import logging
+import threading
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import pandas as pd
+import numpy as np
+from data_loader import load_csv_data, derived_cache
+from columnar_cache import data_version
+from posting_lists import RowLookup, load_postings
+
+# Bitmap index over the rows of the cleaned CSV.
+# Every key (tag, genre, category, language) is stored as a packed bitmap of the row positions
+# of the games it contains, so AND/OR queries are bitwise operations and the result is directly a row mask.
+class GameIndex:
+    def __init__(self, postings, app_ids):
+        self.n_rows = len(app_ids)
+        # Map every AppID to its dense row position, games missing from the CSV are skipped
+        lookup = RowLookup(app_ids)
+        self.bitmaps = {key: np.packbits(lookup.mask(ids), bitorder='little') for key, ids in postings.items()}
+        self.keys = sorted(self.bitmaps)
+
+    # Boolean row mask of the games matching all (how='all') or any (how='any') of the keys, no keys selects every game
+    def mask(self, keys, how='all'):
+        keys = list(keys)
+        if not keys:
+            return np.ones(self.n_rows, dtype=bool)
+        combine = np.bitwise_and if how == 'all' else np.bitwise_or
+        bitmap = self.bitmaps[keys[0]].copy()
+        for key in keys[1:]:
+            combine(bitmap, self.bitmaps[key], out=bitmap)
+        return np.unpackbits(bitmap, count=self.n_rows, bitorder='little').view(bool)
+
+    # Same as mask, but aligned with the rows of a (filtered) frame of the cleaned CSV
+    def frame_mask(self, df, keys, how='all'):
+        return self.mask(keys, how)[df.index.to_numpy()]
+
+    # Memory held by the bitmaps
+    def nbytes(self):
+        return sum(bitmap.nbytes for bitmap in self.bitmaps.values())
+
+# Cached function to build the bitmap index of a {key: [AppID, ...]} JSON file (read from its binary posting lists,
+# see posting_lists.py), shared by all sessions
+@derived_cache
+@st.cache_resource
+def load_game_index(file):
+    start = time.perf_counter()
+    index = GameIndex(load_postings(file), load_csv_data()['AppID'])
+    record_index('game index', file, index, time.perf_counter() - start)
+    return index
+
+# Sparse incidence matrix of games x keys (e.g. languages) in CSR form, the rows are aligned with the rows of the cleaned CSV.
+# Per-key counts and sums are sparse products of the metric columns with the matrix, without exploding the frame.
+class IncidenceMatrix:
+    def __init__(self, postings, app_ids):
+        self.n_rows = len(app_ids)
+        self.keys = sorted(key for key, ids in postings.items() if len(ids))
+        lookup = RowLookup(app_ids)
+        rows, cols = [], []
+        for col, key in enumerate(self.keys):
+            key_rows = lookup.rows(postings[key])  # Games missing from the CSV are skipped
+            rows.append(key_rows)
+            cols.append(np.full(len(key_rows), col))
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        order = np.lexsort((cols, rows))
+        # Entry k belongs to row entry_rows[k] and column indices[k], the entries of row r are indptr[r]:indptr[r+1]
+        self.entry_rows = rows[order].astype('int32')
+        self.indices = cols[order].astype('int32')
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(self.entry_rows, minlength=self.n_rows))])
+
+    # Entries of the rows of a (filtered) frame of the cleaned CSV, as (column of each entry, position of its row in the frame)
+    def frame_entries(self, df):
+        frame_rows = np.full(self.n_rows, -1)
+        frame_rows[df.index.to_numpy()] = np.arange(len(df))
+        entry_frame_rows = frame_rows[self.entry_rows]
+        selected = entry_frame_rows >= 0
+        return self.indices[selected], entry_frame_rows[selected]
+
+    # Number of games and mean of every metric for every key, over the rows of a (filtered) frame of the cleaned CSV
+    def key_stats(self, df, metrics):
+        cols, frame_rows = self.frame_entries(df)
+        n_keys = len(self.keys)
+        stats = pd.DataFrame(index=pd.Index(self.keys, name='key'))
+        for metric in metrics:
+            values = df[metric].to_numpy(dtype=float)[frame_rows]
+            valid = ~np.isnan(values)  # Missing values are skipped, like in pandas
+            sums = np.bincount(cols[valid], weights=values[valid], minlength=n_keys)
+            counts = np.bincount(cols[valid], minlength=n_keys)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                stats[metric] = sums / counts
+        stats['Games released'] = np.bincount(cols, minlength=n_keys)
+        return stats
+
+    # Memory held by the entries of the matrix
+    def nbytes(self):
+        return self.entry_rows.nbytes + self.indices.nbytes + self.indptr.nbytes
+
+# Cached function to build the incidence matrix of a {key: [AppID, ...]} JSON file (read from its binary posting lists),
+# shared by all sessions
+@derived_cache
+@st.cache_resource
+def load_incidence_matrix(file):
+    start = time.perf_counter()
+    matrix = IncidenceMatrix(load_postings(file), load_csv_data()['AppID'])
+    record_index('incidence matrix', file, matrix, time.perf_counter() - start)
+    return matrix
+
+# Lazy index registry. The pages only need the keys of an index for their widgets, which are read from the header of
+# its posting lists, an index is only built (once per data version, shared by all sessions) when a selection uses it.
+# Every index a page queries is also built once per process in a background thread, started when the app first imports
+# this module (disable with INDEX_WARMUP=0), so selections find it ready. release.json has no index: Release Time only
+# reads its keys. The memory footprint and build time of every
+# built index are reported by index_footprint (see developer_panel.py).
+INDEX_WARMUP = os.environ.get('INDEX_WARMUP', '1') == '1'
+INDEXES = {
+    'game index': (load_game_index, ['tags.json', 'genres.json', 'categories.json', 'supported_languages.json']),
+    'incidence matrix': (load_incidence_matrix, ['supported_languages.json']),
+}
+
+BUILT_INDEXES = {}  # {(kind, file): {'version', 'keys', 'bytes', 'build_ms'}}
+WARMUP = {}
+WARMUP_THREAD = 'index warmup'
+REGISTRY_LOCK = threading.Lock()
+
+# Cached sorted keys of an index file, without building its index. With nonempty=True only the keys with games.
+@derived_cache
+@st.cache_data
+def load_index_keys(file, nonempty=False):
+    postings = load_postings(file)
+    return sorted(key for key in postings.keys() if not nonempty or len(postings[key]))
+
+# Record the footprint of a built index
+def record_index(kind, file, index, seconds):
+    with REGISTRY_LOCK:
+        BUILT_INDEXES[(kind, file)] = {'version': data_version(), 'keys': len(index.keys), 'bytes': index.nbytes(),
+                                       'build_ms': 1000 * seconds}
+
+# Build every index of the app
+def warm_indexes():
+    for kind, (loader, files) in INDEXES.items():
+        for file in files:
+            loader(file)
+
+# Drop the missing ScriptRunContext warnings of the warmup thread: it runs outside of any session on purpose and only
+# fills the caches shared by all sessions
+class WarmupContextFilter(logging.Filter):
+    def filter(self, record):
+        return not (threading.current_thread().name == WARMUP_THREAD and 'missing ScriptRunContext' in record.getMessage())
+
+# Start building every index in a background thread, once per process
+def start_index_warmup():
+    with REGISTRY_LOCK:
+        if not INDEX_WARMUP or 'thread' in WARMUP:
+            return
+        logging.getLogger('streamlit.runtime.scriptrunner_utils.script_run_context').addFilter(WarmupContextFilter())
+        WARMUP['thread'] = threading.Thread(target=warm_indexes, name=WARMUP_THREAD, daemon=True)
+    WARMUP['thread'].start()
+
+# Footprint of every index of the app: {'<kind>:<file>': {'built', 'keys', 'MB', 'build_ms'}}, only the indexes built
+# for the current data version count as built
+def index_footprint():
+    version = data_version()
+    with REGISTRY_LOCK:
+        built = {name: dict(record) for name, record in BUILT_INDEXES.items() if record['version'] == version}
+    footprint = {}
+    for kind, (loader, files) in INDEXES.items():
+        for file in files:
+            record = built.get((kind, file))
+            footprint[f"{kind}:{file}"] = ({'built': True, 'keys': record['keys'], 'MB': record['bytes'] / 2**20,
+                                            'build_ms': record['build_ms']} if record else {'built': False})
+    return footprint
+
+# The app starts the warmup when one of its pages first imports this module, i.e. once per process before the first page
+# is drawn. Scripts using the module outside of the app (report.py, the analytics server, the benchmark) build what
+# they need themselves.
+if get_script_run_ctx(suppress_warning=True) is not None:
+    start_index_warmup()
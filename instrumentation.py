@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import functools
+import threading
+import contextlib
+import collections
+import numpy as np
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Timing spans and counters of the hot paths (data loading, sidebar filtering, page aggregations and figure building).
+# Every span is recorded process-wide, keeping the last SPAN_HISTORY durations of every span name across sessions for
+# its p50/p95, and in the current rerun of the session, which the developer panel shows (see developer_panel.py).
+# With INSTRUMENTATION_LOG set to a path, every rerun is appended to that file as a JSON line.
+SPAN_HISTORY = 1000
+INSTRUMENTATION_LOG = os.environ.get('INSTRUMENTATION_LOG')
+
+SPANS = collections.defaultdict(lambda: collections.deque(maxlen=SPAN_HISTORY))
+COUNTERS = collections.Counter()
+LOCK = threading.Lock()
+
+# Spans and counters of the current rerun of the session, or None outside of a script run (e.g. in worker threads)
+def rerun_record():
+    if get_script_run_ctx() is None:
+        return None
+    return st.session_state.get('rerun_instrumentation')
+
+# Start recording a new rerun of the session (called first thing by load_data_for_page)
+def begin_rerun():
+    if get_script_run_ctx() is not None:
+        st.session_state['rerun_instrumentation'] = {'start': time.perf_counter(), 'spans': [],
+                                                     'counters': collections.Counter()}
+
+# Record the duration of a span
+def record_span(name, seconds):
+    with LOCK:
+        SPANS[name].append(seconds)
+    rerun = rerun_record()
+    if rerun is not None:
+        rerun['spans'].append((name, seconds))
+
+# Time the block of a with statement as a span
+@contextlib.contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+# Decorator to time every call of a function as a span
+def timed(name):
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# Add to a counter
+def increment(name, n=1):
+    with LOCK:
+        COUNTERS[name] += n
+    rerun = rerun_record()
+    if rerun is not None:
+        rerun['counters'][name] += n
+
+# Record the whole rerun of a page as the 'rerun:<page>' span and log it, returns the rerun record (None outside of a run)
+def finish_rerun(page):
+    rerun = rerun_record()
+    if rerun is None:
+        return None
+    rerun['total'] = time.perf_counter() - rerun['start']
+    record_span(f"rerun:{page}", rerun['total'])
+    if INSTRUMENTATION_LOG:
+        entry = {
+            'time': time.time(),
+            'page': page,
+            'session': get_script_run_ctx().session_id,
+            'total_ms': 1000 * rerun['total'],
+            'spans': [[name, 1000 * seconds] for name, seconds in rerun['spans']],
+            'counters': dict(rerun['counters']),
+        }
+        with LOCK, open(INSTRUMENTATION_LOG, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+    return rerun
+
+# Number of calls and p50/p95/total duration (ms) of every span across sessions, slowest p95 first
+def span_stats():
+    with LOCK:
+        durations = {name: 1000 * np.array(values) for name, values in SPANS.items()}
+    stats = {name: {'calls': len(values), 'p50_ms': float(np.percentile(values, 50)),
+                    'p95_ms': float(np.percentile(values, 95)), 'total_ms': float(values.sum())}
+             for name, values in durations.items() if len(values)}
+    return dict(sorted(stats.items(), key=lambda item: -item[1]['p95_ms']))
+
+# Copy of the counters across sessions
+def counter_stats():
+    with LOCK:
+        return dict(COUNTERS)
@@ -1,34 +1,22 @@
+import functools
 import streamlit as st
 import pandas as pd
 import plotly.express as px
 from data_loader import load_data_for_page
+from analytics import price_bin_metrics, PRICE_METRICS
+from result_cache import memoized
+from figures import cached_figure
+from charts import price_bin_figure
+from progressive import render_charts
+from developer_panel import developer_panel
 
 # Set the page configuration
 st.set_page_config(page_title="Game Price", layout="wide", initial_sidebar_state="expanded")
 
-df = load_data_for_page()
+load_data_for_page()
+filters = st.session_state['filter_ranges']  # Normalized sidebar filters, the aggregations are in analytics.py
 
-# Create price bins with free games in a separate bin
-price_bins = [-0.01, 0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, float('inf')]
-bin_labels = ['Free', '(0,10]', '(10,20]', '(20,30]', '(30,40]', '(40,50]', '(50,60]', 
-              '(60,70]', '(70,80]', '(80,90]', '(90,100]', '>100']
-
-df['Price Bin'] = pd.cut(df['Price'], bins=price_bins, labels=bin_labels, include_lowest=True, right=True)
-
-# Drop rows where Price Bin is NaN (i.e., prices outside the specified range)
-df = df.dropna(subset=['Price Bin'])
-
-# Convert the Price Bin to a categorical type with ordered categories
-df['Price Bin'] = pd.Categorical(df['Price Bin'], categories=bin_labels, ordered=True)
-
-y_categories = ['Games released', 'Average playtime', "Peak CCU", 'Reviews', "Review score", 'Recommendations']
-
-# Function to calculate dynamic y-axis range
-def get_y_range(df, column):
-    min_value = df[column].min()
-    max_value = df[column].max()
-    buffer = (max_value - min_value) * 0.2  # Adding a 20% buffer
-    return [max(0, min_value - buffer), max_value + buffer]
+y_categories = PRICE_METRICS
 
 col1, col2 =  st.columns([3, 1])
 with col1: # Description
@@ -46,39 +34,26 @@ with col2: # Sorting option
 columns = st.columns(2)
 
 y_ordered = y_categories[1:] + [y_categories[0]]
-for i, target_dimension in enumerate(y_ordered):
-    if target_dimension == "Games released":
-        agg_data = df.groupby('Price Bin').size().reset_index(name='Games released')
-    else:
-        target_df = df[df[target_dimension] > 0] if target_dimension in ("Average playtime", "Peak CCU") else df
-        # Aggregate the data by Price Bin
-        agg_data = target_df.groupby('Price Bin')[target_dimension].mean().reset_index()
-        agg_data['Games released'] = target_df.groupby('Price Bin').size().values
+
+# Bar plot of a metric by Price Bin
+def price_chart(target_dimension):
+    # Aggregate the data by Price Bin, memoized on the metric (and the sidebar filters), so changing the sort order
+    # does not aggregate again
+    agg_data = memoized('price:agg', target_dimension, lambda: price_bin_metrics(filters, target_dimension))
 
     # Sort the data
     if sort_by != "Price Bin":
         agg_data = agg_data.sort_values(by=target_dimension, ascending=(sort_by == "Ascending"))
 
-    # Create the bar plot
-    fig = px.bar(agg_data, x='Price Bin', y=target_dimension,
-                title=f'{target_dimension} by Price Bin' + (" (Averaged per bin)" if target_dimension != "Games released" else ""),
-                labels={'Price Bin': 'Price Bin ($)', target_dimension: f'Average {target_dimension}'},
-                color='Games released', color_continuous_scale='Viridis_r')
-                # text=target_dimension)
+    # Create the bar plot, cached on the (sorted) aggregated data
+    return cached_figure('price:bar', agg_data, target_dimension, lambda: price_bin_figure(agg_data, target_dimension))
 
-    fig.update_yaxes(range=get_y_range(agg_data, target_dimension), 
-                     tickformat='.0%' if target_dimension == 'Review score' else None)
-    
-    if target_dimension in ("Average playtime", "Peak CCU"):
-        fig.add_annotation(
-            dict(font=dict(size=18), x=0, y=1.05,
-                showarrow=False, text=f"*Excluding games with 0 {target_dimension}",
-                xref="paper", yref="paper", xanchor='left', yanchor='bottom')
-)
+# Lay out a placeholder for every chart, the cheap "Games released" chart is drawn first and the metric charts are
+# filled in as they are computed (see progressive.py)
+charts = [(columns[int(i>2)].empty(), functools.partial(price_chart, target_dimension))
+          for i, target_dimension in enumerate(y_ordered)]
+render_charts(charts[-1:])
+render_charts(charts[:-1])
 
-    # Update layout to show labels and apply visual enhancements
-    # fig.update_traces(texttemplate='%{text:.3s}', textposition='outside')
-    fig.update_layout(title_font_size=24, xaxis_title_font_size=18, yaxis_title_font_size=18, uniformtext_minsize=8, uniformtext_mode='hide',
-                      coloraxis_colorbar=dict(yanchor="top", y=1.05, x=1, xanchor="right", orientation="h"))
-    with columns[int(i>2)]:
-        st.plotly_chart(fig, use_container_width=True)
+# Timings of this rerun (developer panel, see developer_panel.py)
+developer_panel('Game Price')
@@ -1,37 +1,36 @@
+import functools
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
-import json
-from data_loader import load_data_for_page, load_json_data
+from data_loader import load_data_for_page
+from game_index import load_index_keys
+from analytics import release_period_metrics, RELEASE_METRICS
+from result_cache import memoized_batch
+from figures import cached_figure
+from charts import release_period_figure, RELEASE_BACKGROUND_COLORS
+from progressive import render_charts
+from developer_panel import developer_panel
 
 
 st.set_page_config(page_title="Release Time", layout="wide", initial_sidebar_state="expanded")
 
 # df = load_csv_data()
-df = load_data_for_page()
-release_dict = load_json_data('release.json')  # Load the release dates from the JSON
-tags_dict = load_json_data('tags.json')        # Load tags from your JSON file
-genres_dict = load_json_data('genres.json')    # Load genres from your JSON file
-categories_dict = load_json_data('categories.json')  # Load categories from your JSON file
+load_data_for_page()
+filters = st.session_state['filter_ranges']  # Normalized sidebar filters, the aggregations are in analytics.py
+# Keys of the release dates, tags, genres and categories, the indexes are only built for a selection (see game_index.py)
+release_keys = load_index_keys('release.json')     # 'year-month' release dates
+tag_keys = load_index_keys('tags.json')
+genre_keys = load_index_keys('genres.json')
+category_keys = load_index_keys('categories.json')
 
 # Sidebar functionality
 # notes_sidebar()  # Display notes
 # apply_filters_sidebar()  # Apply filters
 
-# Access the filtered DataFrame from session_state
-if 'filtered_df' in st.session_state:
-    df = st.session_state['filtered_df']
-else:
-    st.write("No data available.")
-
 # Columns to display as bar plots
-y_categories = ['Average playtime', "Peak CCU", 'Reviews', "Review score", 'Recommendations']
+y_categories = RELEASE_METRICS
 
-# Extract 'Release Year', 'Release Month', and 'Release Quarter' for the entire dataset
-df['Release date'] = pd.to_datetime(df['Release date'], errors='coerce', format='mixed')  # Parse date
-df['Release Year'] = df['Release date'].dt.year
-df['Release Month'] = df['Release date'].dt.month
-df['Release Quarter'] = df['Release date'].dt.quarter  # Extract the quarter as an integer
+# 'Release Year', 'Release Month', and 'Release Quarter' are pre-parsed in the columnar cache
 
 # Function to calculate dynamic y-axis range
 def get_y_range(df, column):
@@ -40,11 +39,6 @@ def get_y_range(df, column):
     buffer = (max_value - min_value) * 0.2  # Adding a 20% buffer
     return [min_value - buffer, max_value + buffer]
 
-# Dynamic y-axis for global range when comparing
-def get_global_y_range(min_value, max_value):
-    buffer = (max_value - min_value) * 0.2 # Adding a 20% buffer
-    return [max(0, min_value - buffer), max_value + buffer]
-
 # Display the title first
 desc, filt = st.columns([2,3])
 with desc:
@@ -58,7 +52,7 @@ with filt:
     with st.expander("Filter Game Data"):
         
         # Year Range Selection (above the graphs)
-        years = set(release_dict.keys())
+        years = set(int(key.split('-')[0]) for key in release_keys)
         min_year, max_year = int(min(years)), int(max(years))
         year_range = st.slider("Select Year Range", min_value=min_year, max_value=max_year, value=(min_year, max_year))
 
@@ -71,176 +65,58 @@ with filt:
         
         with col_1:
             # Tag Filter Selection
-            selected_tags = st.multiselect("Select Tags to Filter By", sorted(tags_dict.keys()))
+            selected_tags = st.multiselect("Select Tags to Filter By", tag_keys)
             if compare:
-                selected_tags_2 = st.multiselect("Select Tags to Filter By (Comparison)", sorted(tags_dict.keys()), key='tags_2')
+                selected_tags_2 = st.multiselect("Select Tags to Filter By (Comparison)", tag_keys, key='tags_2')
         with col_2:
             # Genre Filter Selection
-            selected_genres = st.multiselect("Select Genres to Filter By", sorted(genres_dict.keys()))
+            selected_genres = st.multiselect("Select Genres to Filter By", genre_keys)
             if compare:
-                selected_genres_2 = st.multiselect("Select Genres to Filter By (Comparison)", sorted(genres_dict.keys()), key='genres_2')
+                selected_genres_2 = st.multiselect("Select Genres to Filter By (Comparison)", genre_keys, key='genres_2')
         with col_3:
             # Category Filter Selection
-            selected_categories = st.multiselect("Select Categories to Filter By", sorted(categories_dict.keys()))
+            selected_categories = st.multiselect("Select Categories to Filter By", category_keys)
             if compare:
-                selected_categories_2 = st.multiselect("Select Categories to Filter By (Comparison)", sorted(categories_dict.keys()), key='categories_2')
+                selected_categories_2 = st.multiselect("Select Categories to Filter By (Comparison)", category_keys, key='categories_2')
         with col_4:
             # Option to show by month or quarter
             group_by = st.radio("Group by:", options=["Months", "Quarters"], horizontal=True)
         
 
-# Filter the data based on the selected year range, tags, and genres
-df_filtered = df[(df['Release Year'] >= year_range[0]) & (df['Release Year'] <= year_range[1])]
-
-# Apply tag and genre filters
-if selected_tags:
-    selected_game_ids = set.intersection(*(set(tags_dict[tag]) for tag in selected_tags))
-    df_filtered = df_filtered[df_filtered['AppID'].astype(str).isin(selected_game_ids)]
-
-if selected_genres:
-    selected_game_ids_genre = set.intersection(*(set(genres_dict[genre]) for genre in selected_genres))
-    df_filtered = df_filtered[df_filtered['AppID'].astype(str).isin(selected_game_ids_genre)]
+# Lay out a placeholder for every chart (2x3), drawn as soon as its figure is built (see progressive.py)
+chart_columns = st.columns(2)
+placeholders = [chart_columns[i // 3].empty() for i in range(len(y_categories) + 1)]
 
-if selected_categories:
-    selected_game_ids_category = set.intersection(*(set(categories_dict[category]) for category in selected_categories))
-    df_filtered = df_filtered[df_filtered['AppID'].astype(str).isin(selected_game_ids_category)]
-
-# Second filter for comparison
+# Series to plot: the overall data (all games, filtered by year range), the filtered data and the comparison data.
+# Their summaries are memoized on the year range, the grouping and the tag, genre and category selections,
+# so only the series whose selections changed are aggregated again, in one pass (timed as a span, see instrumentation.py)
+selections = [None, (selected_tags, selected_genres, selected_categories)]
 if compare:
-    df_filtered_2 = df[(df['Release Year'] >= year_range[0]) & (df['Release Year'] <= year_range[1])]
-
-    if selected_tags_2:
-        selected_game_ids_2 = set.intersection(*(set(tags_dict[tag]) for tag in selected_tags_2))
-        df_filtered_2 = df_filtered_2[df_filtered_2['AppID'].astype(str).isin(selected_game_ids_2)]
-
-    if selected_genres_2:
-        selected_game_ids_genre_2 = set.intersection(*(set(genres_dict[genre]) for genre in selected_genres_2))
-        df_filtered_2 = df_filtered_2[df_filtered_2['AppID'].astype(str).isin(selected_game_ids_genre_2)]
-
-    if selected_categories_2:
-        selected_game_ids_category_2 = set.intersection(*(set(categories_dict[category]) for category in selected_categories_2))
-        df_filtered_2 = df_filtered_2[df_filtered_2['AppID'].astype(str).isin(selected_game_ids_category_2)]
-
-# Handle grouping by month or quarter
-if group_by == "Months":
-    group_column = 'Release Month'
-    x_axis_label = 'Month'
-    # Group by Release Month for the filtered data, averaging over the years
-    aggregated_data = df_filtered.groupby('Release Month').agg({col : 'mean' for col in y_categories}).reset_index()
-    aggregated_data['Games released'] = df_filtered.groupby('Release Month').size().values
-    # For the overall data (line for all games, filtered by year range)
-    aggregated_all_data = df[(df['Release Year'] >= year_range[0]) & (df['Release Year'] <= year_range[1])].groupby('Release Month').agg({col : 'mean' for col in y_categories}).reset_index()
-    aggregated_all_data['Games released'] = df[(df['Release Year'] >= year_range[0]) & (df['Release Year'] <= year_range[1])].groupby('Release Month').size().values
-    # Handle comparison data if applicable
-    if compare:
-        aggregated_data_2 = df_filtered_2.groupby('Release Month').agg({col : 'mean' for col in y_categories}).reset_index()
-        aggregated_data_2['Games released'] = df_filtered_2.groupby('Release Month').size().values
-else:
-    group_column = 'Release Quarter'
-    x_axis_label = 'Quarter'
-    # Group by Release Quarter for the filtered data, averaging over the years
-    aggregated_data = df_filtered.groupby('Release Quarter').agg({col : 'mean' for col in y_categories}).reset_index()
-    aggregated_data['Games released'] = df_filtered.groupby('Release Quarter').size().values
-    # For the overall data (line for all games, filtered by year range)
-    aggregated_all_data = df[(df['Release Year'] >= year_range[0]) & (df['Release Year'] <= year_range[1])].groupby('Release Quarter').agg({col : 'mean' for col in y_categories}).reset_index()
-    aggregated_all_data['Games released'] = df[(df['Release Year'] >= year_range[0]) & (df['Release Year'] <= year_range[1])].groupby('Release Quarter').size().values
-    # Handle comparison data if applicable
-    if compare:
-        aggregated_data_2 = df_filtered_2.groupby('Release Quarter').agg({col : 'mean' for col in y_categories}).reset_index()
-        aggregated_data_2['Games released'] = df_filtered_2.groupby('Release Quarter').size().values
-
-# Placeholder for y-axis categories (you can replace these with actual column names)
-import plotly.graph_objects as go
-
-# Define background colors for the graphs
-background_colors = ['#f9fbe7', '#e0f7fa', '#fce4ec', '#f3e5f5', '#e8f5e9', '#fff3e0']
-
-# Create the bar plots for all y-categories
-figs = []
-for i, y_category in enumerate(y_categories + ['Games released']):
-    # Create a new figure for each graph
-    fig = go.Figure()
-
-    # Calculate the global min and max values for each category
-    global_min = min(aggregated_all_data[y_category].min(), aggregated_data[y_category].min())
-    global_max = max(aggregated_all_data[y_category].max(), aggregated_data[y_category].max())
-
-    if compare:
-        # Include the comparison data in the global range
-        global_min = min(global_min, aggregated_data_2[y_category].min())
-        global_max = max(global_max, aggregated_data_2[y_category].max())
-
-    # Add data for the overall dataset
-    fig.add_trace(go.Bar(
-        x=aggregated_all_data[group_column],
-        y=aggregated_all_data[y_category],
-        name=f'All {y_category}',
-        marker_color='blue',
-        width=0.5 if len(aggregated_all_data[group_column]) == 1 else None  # Adjust bar width if only 1 bar
-    ))
-
-    # Add filtered data (only if filters are applied)
-    if not df_filtered.empty and (selected_tags or selected_genres or selected_categories):
-        if compare:
-            # Grouped bar plot
-            fig.add_trace(go.Bar(
-                x=aggregated_data[group_column],
-                y=aggregated_data[y_category],
-                name=f'{y_category} (Filtered)',
-                marker_color='orange',
-                width=0.5 if len(aggregated_data[group_column]) == 1 else None
-            ))
-
-            fig.add_trace(go.Bar(
-                x=aggregated_data_2[group_column],
-                y=aggregated_data_2[y_category],
-                name=f'{y_category} (Comparison)',
-                marker_color='black',
-                width=0.5 if len(aggregated_data_2[group_column]) == 1 else None
-            ))
-        else:
-            # Single bar plot for filtered data
-            fig.add_trace(go.Bar(
-                x=aggregated_data[group_column],
-                y=aggregated_data[y_category],
-                name=f'{y_category} (Filtered)',
-                marker_color='orange',
-                width=0.5 if len(aggregated_data[group_column]) == 1 else None
-            ))
-
-    # Set titles for the x and y axis and for the graph
-    fig.update_layout(
-        title=f'{y_category} Over {x_axis_label}s (Averaged Over {group_by})',
-        xaxis_title=x_axis_label,
-        yaxis_title=("" if y_category in ('Average playtime', 'Games released') else "Average ")+y_category,
-        plot_bgcolor=background_colors[i],  # Set background color
-        margin=dict(l=50, r=50, t=50, b=50),  # Adjust the margins to make the graph shorter
-        height=250  # Set graph height (short)
-    )
-
-    # Use global min and max for y-axis range
-    fig.update_yaxes(range=get_global_y_range(global_min, global_max), 
-                     tickformat=".0%" if y_category == 'Review score' else None)
-
-    # Ensure all months or quarters are shown on the x-axis
-    if group_by == "Months":
-        fig.update_xaxes(
-            tickmode='array',
-            tickvals=list(range(1, 13)),  # Ensure all months from 1 to 12 are shown
-            ticktext=[str(month) for month in range(1, 13)]
-        )
-    else:
-        fig.update_xaxes(
-            tickmode='array',
-            tickvals=[1, 2, 3, 4],  # Ensure all quarters (1-4) are shown
-            ticktext=['Q1', 'Q2', 'Q3', 'Q4']
-        )
-
-    # Add the figure to the list
-    figs.append(fig)
-
-# Display the figures, 2x2
-for c, col in enumerate(st.columns(2)):
-    with col:
-        for i in range(c*3, c*3+3):
-            st.plotly_chart(figs[i], use_container_width=True)
\ No newline at end of file
+    selections.append((selected_tags_2, selected_genres_2, selected_categories_2))
+
+# Means and number of games of the overall, filtered and comparison series (None without comparison). Every chart asks
+# for them, so in progressive mode the first chart task aggregates them and the others wait for its result.
+def series_summaries():
+    summaries = memoized_batch('release:series', [[year_range, group_by, selection] for selection in selections],
+                               lambda batch: release_period_metrics(filters, [selection for _, _, selection in batch],
+                                                                    year_range, group_by))
+    return summaries[0], summaries[1], summaries[2] if compare else None
+
+# The filtered (and comparison) data are only plotted when tags, genres or categories are selected
+filtered = bool(selected_tags or selected_genres or selected_categories)
+
+# Bar plot of a y-category, cached on the plotted series
+def release_chart(i, y_category):
+    aggregated_all_data, aggregated_data, aggregated_data_2 = series_summaries()
+    def build_figure():
+        return release_period_figure(aggregated_all_data, aggregated_data, aggregated_data_2, y_category,
+                                     group_by, RELEASE_BACKGROUND_COLORS[i], filtered)
+    return cached_figure('release:bar', [aggregated_all_data, aggregated_data, aggregated_data_2],
+                         [i, y_category, group_by, compare, filtered], build_figure)
+
+# Aggregate and create the bar plots for all y-categories, in parallel in progressive mode
+render_charts([(placeholders[i], functools.partial(release_chart, i, y_category))
+               for i, y_category in enumerate(y_categories + ['Games released'])])
+
+# Timings of this rerun (developer panel, see developer_panel.py)
+developer_panel('Release Time')
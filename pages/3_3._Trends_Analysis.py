@@ -1,15 +1,22 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from data_loader import load_data_for_page, load_json_data
+from data_loader import load_data_for_page
+from game_index import load_index_keys
+from analytics import trend_series, trend_periods, TREND_FIELDS
+from result_cache import memoized_batch
+from figures import cached_figure
+from charts import trend_figure, trend_label, TREND_COLORS
+from developer_panel import developer_panel
 
 st.set_page_config(page_title="Trends Analysis", layout="wide", initial_sidebar_state="expanded")
 
 # Define fields, including the new "Games Released" feature
-fields = ['Recommendations', "Peak CCU", 'Average playtime','Reviews', 'Games Released', 'Review score']
+fields = TREND_FIELDS
 
-colors = ['#D81B60', '#1E88E5', '#FFC107']  # Predefined colors for the lines
+colors = TREND_COLORS  # Predefined colors for the lines
 dividers = ['red', 'blue', 'orange']
 
 # Title and Description at the top of the app
@@ -20,23 +27,18 @@ This dashboard helps explore trends in game success metrics based on various fea
 You can visualize how these features impact success metrics like recommendations, playtime, user scores, and more over different time periods (year or month). 
 """)
 
-df = load_data_for_page()
+load_data_for_page()
+filters = st.session_state['filter_ranges']  # Normalized sidebar filters, the aggregations are in analytics.py
 
-release_dict = load_json_data('release.json')
-genres_dict = load_json_data('genres.json')
-tags_dict = load_json_data('tags.json')
-categories_dict = load_json_data('categories.json')
+# Keys of the genres, tags and categories, the indexes are only built for a selection (see game_index.py)
 filters_dict = {
-    "Genres" : genres_dict,
-    "Tags" : tags_dict,
-    "Categories" : categories_dict,
+    "Genres" : load_index_keys('genres.json'),
+    "Tags" : load_index_keys('tags.json'),
+    "Categories" : load_index_keys('categories.json'),
 }
 
-# Define all time periods as (year, month) tuples
-years = set(release_dict.keys())
-min_year, max_year = int(min(years)), int(max(years))
-time_periods = [(year, month) for year in range(min_year, max_year + 1) for month in range(1, 13)]
-all_ids = set(df['AppID'].astype(str))
+# Define all time periods as (year, month) pairs
+time_periods = trend_periods()
 
 n_combinations = 3
 
@@ -52,65 +54,13 @@ with plot_placeholder:
 
 # Initialize plot data structures for selected combinations
 plot_data_list = []
-game_ids_list = []
 
-for _ in range(n_combinations + 1):
-    plot_data = {
-        'year': [tp[0] for tp in time_periods],
-        'month': [tp[1] for tp in time_periods],
-        "Reviews": [0] * len(time_periods),
-        "Positive": [0] * len(time_periods),
-        "Review score": [0] * len(time_periods),
-        'Games Released': [0] * len(time_periods),
-    }
-    plot_data_list.append(plot_data)
-    game_ids_list.append(set())
-
-# Function to plot selected filters
-def plot_selected_filters():
-    for i, comb in enumerate(selected_filters_dict.values()):
-        if any(comb.values()) or i == n_combinations:
-            label = "<br>".join([k[0] + ": " + ", ".join(v) for k, v in comb.items() if v])
-            df_plot = pd.DataFrame(plot_data_list[i])
+# Empty plot data, one row of zeros per time period
+def empty_plot_data():
+    return pd.DataFrame(0, index=time_periods, columns=fields).reset_index()
 
-            if time_granularity == "Month":
-                df_plot['date'] = pd.to_datetime(df_plot[['year', 'month']].assign(DAY=1))
-                x_axis = df_plot['date']
-            else:
-                df_plot_grouped = df_plot.groupby('year').sum().reset_index()
-                # df_plot_grouped['Average Review Score'] = 100 * df_plot_grouped['Positive'] / df_plot_grouped['Reviews']
-                x_axis = df_plot_grouped['year']
-
-            # Add primary axis trace with distinct predefined color
-            fig.add_trace(go.Scatter(x=x_axis, 
-                                     y=df_plot_grouped[selected_feature] if time_granularity == "Year" else df_plot[selected_feature], 
-                                     mode='lines', 
-                                     name=f'{label}', 
-                                     showlegend=True,
-                                     line=dict(color=colors[i])))
-
-# Function to aggregate selected filters
-def aggregate_selected_filters(current_ids, i):
-    game_ids_list[i] = current_ids
-    aggregated_values = {field: [0] * len(time_periods) for field in fields}
-    for j, (year, month) in enumerate(time_periods):
-        year_str = str(year)
-        month_str = str(month)
-        if year_str in release_dict and month_str in release_dict[year_str]:
-            common_ids = current_ids.intersection(set(release_dict[year_str][month_str]))
-            if common_ids:
-                filtered_df = df[df['AppID'].astype(str).isin(common_ids)]
-                aggregated_values['Games Released'][j] = len(common_ids)
-                for field in fields[:-2]:
-                    aggregated_values[field][j] += filtered_df[field].sum()
-                # if aggregated_values['Reviews'][j] > 0:
-                #     aggregated_values['Average Review Score'][j] = 100 * aggregated_values['Positive'][j] / aggregated_values['Reviews'][j]
-                aggregated_values['Review score'][j] = filtered_df['Review score'].mean()
-
-    aggregated_values['year'] = [tp[0] for tp in time_periods]
-    aggregated_values['month'] = [tp[1] for tp in time_periods]
-
-    plot_data_list[i] = aggregated_values
+for _ in range(n_combinations + 1):
+    plot_data_list.append(empty_plot_data())
 
 # Explain about the combinations
 st.markdown("""
@@ -120,9 +70,6 @@ st.markdown("""
             The data is visualized for each combination separately, and the combinations can be compared in the plot above.
             """)
 
-# Process All Games
-aggregate_selected_filters(all_ids, n_combinations)
-
 # ---- Position the combinations on the same level ----
 comb_cols = st.columns(n_combinations)
 
@@ -134,76 +81,74 @@ for i, col in enumerate(comb_cols):
 
         # Multiselects stacked in each combination
         selected_filters_dict[i] = {
-            "Genres": st.multiselect(f"Genres", options=sorted(genres_dict.keys()), key=f"G{i}"),
-            "Tags": st.multiselect(f"Tags", options=sorted(tags_dict.keys()), key=f"T{i}"),
-            "Categories": st.multiselect(f"Categories", options=sorted(categories_dict.keys()), key=f"C{i}")
+            "Genres": st.multiselect(f"Genres", options=filters_dict["Genres"], key=f"G{i}"),
+            "Tags": st.multiselect(f"Tags", options=filters_dict["Tags"], key=f"T{i}"),
+            "Categories": st.multiselect(f"Categories", options=filters_dict["Categories"], key=f"C{i}")
         }
 
     # combinations = [{filt: selected_filters_dict[filt][i] for filt in filters_dict} for i in range(n_combinations)]
 
-# Process each combination
-for i in range(n_combinations):
-    current_ids = all_ids
-    if any(filter_val for filter_val in selected_filters_dict[i].values()):
-        for filt, selected_filter in selected_filters_dict[i].items():
-            if selected_filter:
-                for ids in selected_filter:
-                    current_ids = current_ids.intersection(set(filters_dict[filt][ids]))
-                aggregate_selected_filters(current_ids, i)
-    else:
-        # Reset if no selection
-        game_ids_list[i].clear()
-        for field in fields:
-            plot_data_list[i][field] = [0] * len(time_periods)
-        plot_data_list[i]['Games Released'] = [0] * len(time_periods)
+# Plot data of the selected combinations and of all games, memoized on the selections of each combination (and the
+# sidebar filters), so only the combinations whose selections changed are aggregated again, in one pass (timed as a
+# span, see instrumentation.py). All games are the None combination.
+selected = [i for i in range(n_combinations) if any(selected_filters_dict[i].values())] + [n_combinations]
+combinations = [selected_filters_dict[i] if i < n_combinations else None for i in selected]
+for i, plot_data in zip(selected, memoized_batch('trends:combination', combinations,
+                                                 lambda batch: trend_series(filters, batch))):
+    plot_data_list[i] = plot_data
 
 # ---- Dual Axis Plot for Each Combination (displayed even if no selection) ----
 for i in range(n_combinations):
     with comb_cols[i]:
         # st.subheader(f"Combination {i+1}: {', '.join([f'{filt}: {', '.join(selected_filters_dict[i][filt])}' for filt in filters_dict if selected_filters_dict[i][filt]])}")
 
-        fig_comb = make_subplots(specs=[[{"secondary_y": True}]])
-        df_plot = pd.DataFrame(plot_data_list[i])
-
-        if time_granularity == "Month":
-            df_plot['date'] = pd.to_datetime(df_plot[['year', 'month']].assign(DAY=1))
-            x_axis = df_plot['date']
-        else:
-            df_plot_grouped = df_plot.groupby('year').sum().reset_index()
-            # df_plot_grouped['Average Review Score'] = 100 * df_plot_grouped['Positive'] / df_plot_grouped['Reviews']
-            x_axis = df_plot_grouped['year']
-
-        # Left axis: Line plot for the selected feature
-        fig_comb.add_trace(go.Scatter(x=x_axis,
-                                    y=df_plot_grouped[selected_feature] if time_granularity == "Year" else df_plot[selected_feature],
-                                    mode='lines',
-                                    name=f'{selected_feature}',
-                                    line=dict(color="black")),
-                        secondary_y=False)
-
-        # Right axis: Bar plot for Games Released with lower opacity
-        fig_comb.add_trace(go.Bar(x=x_axis,
-                                y=df_plot_grouped['Games Released'] if time_granularity == "Year" else df_plot['Games Released'],
-                                name="Games Released",
-                                marker=dict(color=dividers[i], opacity=0.5)),
-                        secondary_y=True)
-
-        # Update layout for the dual axis plot
-        fig_comb.update_layout(
-            title=f"Comb. {i+1} - Avg. playtime & Games released",
-            xaxis_title="Date" if time_granularity == "Month" else "Year",
-            # legend above the plot
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="right",
-                x=1
-    )
+        # Dual axis plot, cached on the plot data of the combination
+        def build_combination_figure():
+            fig_comb = make_subplots(specs=[[{"secondary_y": True}]])
+            df_plot = pd.DataFrame(plot_data_list[i])
+
+            if time_granularity == "Month":
+                df_plot['date'] = pd.to_datetime(df_plot[['year', 'month']].assign(DAY=1))
+                x_axis = df_plot['date']
+            else:
+                df_plot_grouped = df_plot.groupby('year').sum().reset_index()
+                # df_plot_grouped['Average Review Score'] = 100 * df_plot_grouped['Positive'] / df_plot_grouped['Reviews']
+                x_axis = df_plot_grouped['year']
+
+            # Left axis: Line plot for the selected feature
+            fig_comb.add_trace(go.Scatter(x=x_axis,
+                                        y=df_plot_grouped[selected_feature] if time_granularity == "Year" else df_plot[selected_feature],
+                                        mode='lines',
+                                        name=f'{selected_feature}',
+                                        line=dict(color="black")),
+                            secondary_y=False)
+
+            # Right axis: Bar plot for Games Released with lower opacity
+            fig_comb.add_trace(go.Bar(x=x_axis,
+                                    y=df_plot_grouped['Games Released'] if time_granularity == "Year" else df_plot['Games Released'],
+                                    name="Games Released",
+                                    marker=dict(color=dividers[i], opacity=0.5)),
+                            secondary_y=True)
+
+            # Update layout for the dual axis plot
+            fig_comb.update_layout(
+                title=f"Comb. {i+1} - Avg. playtime & Games released",
+                xaxis_title="Date" if time_granularity == "Month" else "Year",
+                # legend above the plot
+                legend=dict(
+                    orientation="h",
+                    yanchor="bottom",
+                    y=1.02,
+                    xanchor="right",
+                    x=1
         )
+            )
 
-        fig_comb.update_yaxes(title_text=selected_feature, secondary_y=False)
-        fig_comb.update_yaxes(title_text="Games Released", secondary_y=True)
+            fig_comb.update_yaxes(title_text=selected_feature, secondary_y=False)
+            fig_comb.update_yaxes(title_text="Games Released", secondary_y=True)
+            return fig_comb
+        fig_comb = cached_figure('trends:combination', plot_data_list[i], [i, selected_feature, time_granularity],
+                                 build_combination_figure)
 
         # Display the combination plot
         st.plotly_chart(fig_comb, use_container_width=True)
@@ -216,32 +161,15 @@ with plot_placeholder:
 
     with plot_columns[0]:
             
-        fig = go.Figure()
-        label = "All Games"
-        df_plot = pd.DataFrame(plot_data_list[n_combinations])
-
-        if time_granularity == "Month":
-            df_plot['date'] = pd.to_datetime(df_plot[['year', 'month']].assign(DAY=1))
-            x_axis = df_plot['date']
-        else:
-            df_plot_grouped = df_plot.groupby('year').sum().reset_index()
-            # df_plot_grouped['Average Review Score'] = 100 * df_plot_grouped['Positive'] / df_plot_grouped['Reviews']
-            x_axis = df_plot_grouped['year']
-
-        fig.add_trace(go.Scatter(x=x_axis,
-                                y=df_plot_grouped[selected_feature] if time_granularity == "Year" else df_plot[selected_feature],
-                                mode='lines',
-                                name=label,
-                                showlegend=True,
-                                line=dict(color="black")))
-
-        plot_selected_filters()
-
-
-        fig.update_layout(
-            yaxis=dict(title=selected_feature),
-            xaxis_title="Date (Month)" if time_granularity == "Month" else "Year",
-            showlegend=True
-        )
-
-        st.plotly_chart(fig, use_container_width=True)
\ No newline at end of file
+        # Plot of all games and of the selected combinations, cached on their plot data and labels
+        def build_figure():
+            series = [(trend_label(comb), plot_data_list[i], colors[i])
+                      for i, comb in enumerate(selected_filters_dict.values()) if any(comb.values())]
+            return trend_figure(plot_data_list[n_combinations], series, selected_feature, time_granularity)
+        fig = cached_figure('trends:plot', [plot_data_list, selected_filters_dict], [selected_feature, time_granularity],
+                            build_figure)
+
+        st.plotly_chart(fig, use_container_width=True)
+
+# Timings of this rerun (developer panel, see developer_panel.py)
+developer_panel('Trends Analysis')
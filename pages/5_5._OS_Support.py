@@ -1,18 +1,20 @@
+import functools
 import streamlit as st
 import pandas as pd
 import plotly.express as px
 import numpy as np
 from data_loader import load_data_for_page
+from derived_columns import OS_ORDER, OS_COMBINATION_ORDER
+from analytics import os_breakdown, OS_METRICS
+from result_cache import memoized
+from figures import cached_figure, lean_scatter, LEAN_FIGURES
+from progressive import render_charts, lazy_expander
+from developer_panel import developer_panel
 
 st.set_page_config(page_title="OS Support", layout="wide", initial_sidebar_state="expanded")
 
-df = load_data_for_page()
-
-# Access the filtered DataFrame from session_state
-if 'filtered_df' in st.session_state:
-    df = st.session_state['filtered_df']
-else:
-    st.write("No data available.")
+load_data_for_page()
+filters = st.session_state['filter_ranges']  # Normalized sidebar filters, the aggregations are in analytics.py
 
 # Custom color palette for OS and combinations
 colors = {
@@ -32,24 +34,11 @@ colors = {
 }
 
 # Set the custom order for the OS and OS Combinations
-os_order = ['Windows', 'Mac', 'Linux']
-os_combination_order = ['W', 'M', 'L', 'W+M', 'W+L', 'M+L', 'W+M+L']
-
-# Add OS combination column (shortened names)
-df['OS_combination'] = df.apply(lambda row: '+'.join([os[0] for os in ['Windows', 'Mac', 'Linux'] if row[os]]), axis=1)
-df['OS_count'] = df.apply(lambda row: len([os for os in ['Windows', 'Mac', 'Linux'] if row[os]]), axis=1).astype(str)
-
-# Create new DataFrame where each game is repeated for every OS it supports (name it "OS_repeated")
-os_repeated = pd.DataFrame()
+os_order = OS_ORDER
+os_combination_order = OS_COMBINATION_ORDER  # OS combination column (shortened names) is a derived column
 
-for os in ['Windows', 'Mac', 'Linux']:
-    os_df = df[df[os]].copy()  # Filter for each OS
-    os_df['OS'] = os  # Add a column to indicate the OS (Windows, Mac, Linux)
-    os_repeated = pd.concat([os_repeated, os_df], ignore_index=True)
-
-# Ensure the OS and OS_combination columns follow the specified order
-os_repeated['OS'] = pd.Categorical(os_repeated['OS'], categories=os_order, ordered=True)
-df['OS_combination'] = pd.Categorical(df['OS_combination'], categories=os_combination_order, ordered=True)
+# Define success metrics (features)
+success_metrics = OS_METRICS
 
 # Function to calculate dynamic y-axis range
 def get_y_range(df, column):
@@ -61,7 +50,7 @@ def get_y_range(df, column):
 # Function to apply 5% threshold in pie chart
 def apply_pie_threshold(df, value_column, name_column):
     total = df[value_column].sum()
-    df = df.groupby(name_column).sum().reset_index()
+    df = df.groupby(name_column, observed=False).sum().reset_index()
     return df
 
 # General title and description at the top
@@ -72,9 +61,6 @@ st.write("""
     You can examine metrics such as reviews, recommendations, and review scores.
 """)
 
-# Define success metrics (features)
-success_metrics = ['Average playtime', 'Peak CCU', 'Reviews', 'Recommendations', 'Review score']
-
 # Data visualizations
 data_types = {
     "OS Combinations": 'OS_combination',
@@ -97,74 +83,97 @@ descriptions = {
 # Move "Individual OS" to the top
 data_types = dict(reversed(list(data_types.items())))
 
+# Mean success metrics and number of games of every group of an OS column, from the cube when no sidebar filter leaves
+# out games (memoized on the column and the sidebar filters). Every chart of the column asks for them, so in progressive
+# mode the first chart task aggregates them and the others wait for its result.
+def os_group_stats(column):
+    return memoized('os:group stats', column, lambda: os_breakdown(filters, column))
+
+# Dot plot of a metric of every group, where x-group, y-metric, size-count, color-group
+def os_metric_chart(data_type, column, metric):
+    group_stats = os_group_stats(column)
+    data_grouped = group_stats[[metric]].reset_index()
+    data_grouped['count'] = group_stats['Games released'].values  # Add count column for bar plot
+
+    # Scale the 'count' column for size between 5 and 30
+    size_scaled = np.interp(data_grouped['count'], (data_grouped['count'].min(), data_grouped['count'].max()), [5, 30])
+
+    # Create the scatter plot, cached on the metric of every group
+    def build_metric_figure():
+        category_orders = {"OS": os_order, "OS_combination": os_combination_order}
+        if LEAN_FIGURES:
+            fig = lean_scatter(data_grouped, y=metric, x=column, size=size_scaled, text=column,
+                               title=f"{metric} by {data_type}", color_map=colors, size_max=30,
+                               custom_data=['count'], category_orders=category_orders)
+        else:
+            fig = px.scatter(data_grouped, y=metric, x=column, size=size_scaled, color=column, text=column,
+                            title=f"{metric} by {data_type}",
+                            color_discrete_map=colors, size_max=30, custom_data=['count'],
+                            category_orders=category_orders)
+
+        # Handle OS Count: Set only 1, 2, 3 as x-axis ticks
+        if data_type == 'OS Count':
+            fig.update_xaxes(tickmode='array', tickvals=[1, 2, 3], ticktext=['1', '2', '3'])
+
+        # Pass the 'count' value as custom data
+        fig.update_traces(
+            hovertemplate=f"<b>%{{text}}</b><br>{metric}: %{{y}}<br>Count: %{{customdata}}<extra></extra>"
+        )
+
+        fig.update_traces(textposition='top center')
+        fig.update_layout(showlegend=False)
+        return fig
+    return cached_figure('os:metric', data_grouped, [metric, data_type], build_metric_figure)
+
 for data_type, column in data_types.items():
-    with st.expander(f"{data_type} Visualizations"):
+    # The expanders are collapsed, in progressive mode their charts are only computed once opened (see progressive.py)
+    expander, expander_open = lazy_expander(f"{data_type} Visualizations", key=f"os_expander_{column}")
+    with expander:
 
         st.subheader(f"{data_type} Analysis")
         st.write(subheaders[data_type])
         st.write(descriptions[data_type])
+        if not expander_open:
+            continue
 
         plots = st.columns(3) + st.columns(3)
 
-        with plots.pop(1):
-            # Pie chart for OS Combinations (unordered)
-            data_source = df if column != 'OS' else os_repeated
-            game_count = data_source.groupby(column).size().reset_index(name='count')
+        # Pie chart for OS Combinations (unordered)
+        def count_chart(data_type=data_type, column=column):
+            game_count = os_group_stats(column)['Games released'].reset_index(name='count')
             game_count = apply_pie_threshold(game_count, 'count', column)
 
-            if data_type == 'Individual OS':  # Bar plot instead of pie
-                fig_pie = px.bar(game_count, y=column, x='count', title=f"Games Released for {data_type}",
-                                color=column, color_discrete_map=colors)
-                fig_pie.update_traces(showlegend=False)
-            else:
-                if data_type == 'OS Count': # ordered
-                    fig_pie = px.pie(game_count, values='count', names=column, title=f"Games Released for {data_type}",
-                                    color=column, color_discrete_map=colors, category_orders={"OS_count": ["1", "2", "3"]})
-                else: # unordered
-                    fig_pie = px.pie(game_count, values='count', names=column, title=f"Games Released for {data_type}",
+            # Chart of the number of games, cached on the counts
+            def build_count_figure():
+                if data_type == 'Individual OS':  # Bar plot instead of pie
+                    fig_pie = px.bar(game_count, y=column, x='count', title=f"Games Released for {data_type}",
                                     color=column, color_discrete_map=colors)
-                # Custom label format to include combination and percentage
-                fig_pie.update_traces(
-                    texttemplate="%{label}: %{percent}",  # Shows combination and percentage
-                    textposition="auto",  # Automatically moves text outside if the slice is too small
-                    hovertemplate="<b>%{label}</b><br>Count: %{value}<br>Percentage: %{percent}<extra></extra>"
-                )
-
-                # Move legend to the bottom
-                fig_pie.update_layout(legend=dict(orientation="h", yanchor="top", y=-0.02, xanchor="right", x=1))
-
-            st.plotly_chart(fig_pie, use_container_width=True)
-
-
-
-            for i, metric in enumerate(success_metrics):
-                data_grouped = data_source.groupby(column)[metric].mean().reset_index()
-                data_grouped['count'] = data_source.groupby(column).size().values  # Add count column for bar plot
-
-                # Scale the 'count' column for size between 5 and 30
-                size_scaled = np.interp(data_grouped['count'], (data_grouped['count'].min(), data_grouped['count'].max()), [5, 30])
-                
-                with plots[i]:  # Dot plots where x-group, y-metric, size-count, color-group
-
-                    # Create the scatter plot
-                    fig = px.scatter(data_grouped, y=metric, x=column, size=size_scaled, color=column, text=column,
-                                    title=f"{metric} by {data_type}",
-                                    color_discrete_map=colors, size_max=30, custom_data=['count'],
-                                    category_orders={
-                                        "OS": os_order,
-                                        "OS_combination": os_combination_order
-                                    })
-
-                    # Handle OS Count: Set only 1, 2, 3 as x-axis ticks
-                    if data_type == 'OS Count':
-                        fig.update_xaxes(tickmode='array', tickvals=[1, 2, 3], ticktext=['1', '2', '3'])
-
-                    # Pass the 'count' value as custom data
-                    fig.update_traces(
-                        hovertemplate=f"<b>%{{text}}</b><br>{metric}: %{{y}}<br>Count: %{{customdata}}<extra></extra>"
+                    fig_pie.update_traces(showlegend=False)
+                else:
+                    if data_type == 'OS Count': # ordered
+                        fig_pie = px.pie(game_count, values='count', names=column, title=f"Games Released for {data_type}",
+                                        color=column, color_discrete_map=colors, category_orders={"OS_count": ["1", "2", "3"]})
+                    else: # unordered
+                        fig_pie = px.pie(game_count, values='count', names=column, title=f"Games Released for {data_type}",
+                                        color=column, color_discrete_map=colors)
+                    # Custom label format to include combination and percentage
+                    fig_pie.update_traces(
+                        texttemplate="%{label}: %{percent}",  # Shows combination and percentage
+                        textposition="auto",  # Automatically moves text outside if the slice is too small
+                        hovertemplate="<b>%{label}</b><br>Count: %{value}<br>Percentage: %{percent}<extra></extra>"
                     )
 
-                    fig.update_traces(textposition='top center')
-                    fig.update_layout(showlegend=False)
+                    # Move legend to the bottom
+                    fig_pie.update_layout(legend=dict(orientation="h", yanchor="top", y=-0.02, xanchor="right", x=1))
+                return fig_pie
+            return cached_figure('os:count', game_count, data_type, build_count_figure)
+
+        # The chart of the number of games goes in the second slot, the metric charts in the others. Every chart is
+        # aggregated and built in the render pool in progressive mode, and drawn as soon as it is built.
+        count_placeholder = plots.pop(1).empty()
+        render_charts([(count_placeholder, count_chart)] +
+                      [(plots[i].empty(), functools.partial(os_metric_chart, data_type, column, metric))
+                       for i, metric in enumerate(success_metrics)])
 
-                    st.plotly_chart(fig, use_container_width=True)
+# Timings of this rerun (developer panel, see developer_panel.py)
+developer_panel('OS Support')
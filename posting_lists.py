@@ -0,0 +1,192 @@
+import os
+import json
+import tempfile
+import threading
+import numpy as np
+from delta_overlay import load_overlay, overlay_path
+
+# Binary posting lists: a {key: [AppID, ...]} inverted index stored as sorted uint32 arrays in a single file
+#
+#   magic (8 bytes) | number of keys (uint32) | length of the keys (uint32) | keys (JSON list) | padding to 8 bytes
+#   | offsets (uint64, number of keys + 1) | AppIDs (uint32)
+#
+# The AppIDs of the i-th key are AppIDs[offsets[i]:offsets[i + 1]]. The file is memory-mapped when loaded,
+# so only the keys are parsed and every posting list is a view of the file.
+
+MAGIC = b'POSTING1'
+
+# Locks of the files being (re)built, so the threads of a process build a file once
+BUILD_LOCKS = {}
+BUILD_LOCKS_LOCK = threading.Lock()
+
+# Lock of a file being (re)built
+def build_lock(path):
+    with BUILD_LOCKS_LOCK:
+        return BUILD_LOCKS.setdefault(os.path.abspath(path), threading.Lock())
+
+# Write a file through write(temporary path) and move it over path atomically. Every writer gets its own temporary file
+# next to path, so concurrent writers (threads or processes) never clash and readers only ever see complete files.
+def write_atomically(path, write):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+# Path of the binary posting lists of an index JSON file
+def postings_path(json_file):
+    return os.path.splitext(json_file)[0] + '.postings'
+
+# Flatten an index JSON into {key: [AppID, ...]}, release.json's {year: {month: ids}} becomes {'year-month': ids}
+def flat_postings(data):
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            for month, ids in value.items():
+                flat[f"{key}-{month}"] = ids
+        else:
+            flat[key] = value
+    return flat
+
+# Write {key: [AppID, ...]} (AppIDs as strings or integers) as binary posting lists, atomically
+def write_postings(postings, path):
+    keys = list(postings)
+    arrays = [np.unique(np.fromiter(map(int, postings[key]), dtype=np.int64, count=len(postings[key])))
+              for key in keys]
+    offsets = np.concatenate([[0], np.cumsum([len(ids) for ids in arrays])]).astype('<u8')
+    data = np.concatenate(arrays + [np.empty(0, dtype=np.int64)])
+    if len(data) and (data.min() < 0 or data.max() > np.iinfo(np.uint32).max):
+        raise ValueError(f"AppIDs of {path} do not fit in uint32")
+
+    keys_bytes = json.dumps(keys).encode('utf8')
+    header = MAGIC + np.array([len(keys), len(keys_bytes)], dtype='<u4').tobytes() + keys_bytes
+
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            f.write(header + b'\0' * (-len(header) % 8))
+            f.write(offsets.tobytes())
+            f.write(data.astype('<u4').tobytes())
+    write_atomically(path, write)
+
+# Convert an index JSON file to its binary posting lists
+def build_postings(json_file):
+    with open(json_file, 'r') as f:
+        write_postings(flat_postings(json.load(f)), postings_path(json_file))
+
+# Row positions of AppIDs in a frame of the cleaned CSV, found by binary search in the sorted AppIDs of the frame
+class RowLookup:
+    def __init__(self, app_ids):
+        app_ids = np.asarray(app_ids, dtype=np.int64)
+        self.n_rows = len(app_ids)
+        self.order = np.argsort(app_ids, kind='stable')
+        self.sorted_ids = app_ids[self.order]
+
+    # Row positions of the given AppIDs, AppIDs missing from the frame are skipped
+    def rows(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.searchsorted(self.sorted_ids, ids)
+        found = positions < self.n_rows
+        found[found] = self.sorted_ids[positions[found]] == ids[found]
+        return self.order[positions[found]]
+
+    # Boolean row mask of the given AppIDs
+    def mask(self, ids):
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.rows(ids)] = True
+        return mask
+
+# Memory-mapped binary posting lists, a read-only mapping of every key to its sorted uint32 AppIDs
+class PostingLists:
+    def __init__(self, path):
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        if buffer[:len(MAGIC)].tobytes() != MAGIC:
+            raise ValueError(f"{path} is not a posting lists file")
+        n_keys, keys_length = buffer[8:16].view('<u4')
+        keys_end = 16 + int(keys_length)
+        self.key_list = json.loads(buffer[16:keys_end].tobytes().decode('utf8'))
+        self.positions = {key: i for i, key in enumerate(self.key_list)}
+        offsets_start = keys_end + (-keys_end % 8)
+        data_start = offsets_start + 8 * (int(n_keys) + 1)
+        self.offsets = buffer[offsets_start:data_start].view('<u8')
+        self.data = buffer[data_start:].view('<u4')
+
+    def __len__(self):
+        return len(self.key_list)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    # Sorted AppIDs of a key
+    def __getitem__(self, key):
+        i = self.positions[key]
+        return self.data[self.offsets[i]:self.offsets[i + 1]]
+
+    def keys(self):
+        return list(self.key_list)
+
+    def items(self):
+        return [(key, self[key]) for key in self.key_list]
+
+# Binary posting lists with the overlay of the applied deltas merged in (see delta_overlay.py): the touched AppIDs are
+# removed from the base AppIDs of a key and the overlay's added when the key is first read. Keys left without games are
+# dropped, new keys come after those of the base.
+class OverlaidPostings:
+    def __init__(self, base, overlay, file):
+        self.base = base
+        self.touched = np.array(sorted(overlay.touched), dtype=np.uint32)
+        self.added = overlay.added(file)
+        self.merged = {}
+        self.key_list = None
+
+    def merge(self, key):
+        if key not in self.merged:
+            ids = self.base[key] if key in self.base else np.empty(0, dtype=np.uint32)
+            ids = ids[~np.isin(ids, self.touched)]
+            self.merged[key] = np.union1d(ids, np.array(self.added.get(key, []), dtype=np.uint32)).astype(np.uint32)
+        return self.merged[key]
+
+    def keys(self):
+        if self.key_list is None:
+            keys = self.base.keys() + [key for key in self.added if key not in self.base]
+            self.key_list = [key for key in keys if len(self.merge(key))]
+        return list(self.key_list)
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return self.merge(key)
+
+    def items(self):
+        return [(key, self.merge(key)) for key in self.keys()]
+
+# Whether the binary posting lists of an index JSON file are missing or older than the JSON
+def postings_stale(json_file, path):
+    return not os.path.exists(path) or (os.path.exists(json_file) and os.path.getmtime(path) < os.path.getmtime(json_file))
+
+# Load the binary posting lists of an index JSON file, (re)building them first if they are missing or older than the JSON.
+# Threads loading stale posting lists at the same time (the index warmup, pages of several sessions) build them once.
+# The deltas applied since the last full run of the pipeline are merged in (see delta_overlay.py).
+def load_postings(json_file):
+    path = postings_path(json_file)
+    if postings_stale(json_file, path):
+        with build_lock(path):
+            if postings_stale(json_file, path):  # Unless another thread rebuilt them while this one was waiting
+                build_postings(json_file)
+    postings = PostingLists(path)
+    overlay = load_overlay(overlay_path(json_file))
+    return postings if overlay is None else OverlaidPostings(postings, overlay, os.path.basename(json_file))
+
+if __name__ == '__main__':
+    for file in ['release.json', 'tags.json', 'genres.json', 'categories.json', 'supported_languages.json']:
+        build_postings(file)
+        print(f"Wrote {postings_path(file)}")
@@ -0,0 +1,552 @@
+import os
+import re
+import csv
+import json
+import argparse
+import functools
+import io
+import shutil
+import concurrent.futures
+import pandas as pd
+from columnar_cache import (build_columnar_cache, read_columnar_cache, write_columnar_cache, type_csv_rows,
+                            downcast_integers, overlaid_frame, data_version, bump_data_version)
+from delta_overlay import DELTA_FILE, append_delta, load_overlay
+from posting_lists import flat_postings, write_postings, postings_path, write_atomically
+
+# Preprocessing pipeline of the raw Steam games.json (previously data_preprocessing.ipynb).
+# The source is read segment by segment and the cleaned CSV and every inverted index are emitted in a single pass,
+# so the memory used is bounded by the output indexes and never holds the whole source.
+#
+#   python preprocessing.py path/to/games.json [--out-dir .] [--games-json] [--force] [--jobs N]
+#
+# The source is split into segments of whole games at byte offsets, with --jobs every segment is read, decoded, cleaned,
+# typed and indexed by a process of a pool. The pool then merges the partial indexes and the rows of the segments in
+# source order and writes every index file and the CSV in parallel, so the outputs are the same as with a single process.
+#
+# The outputs of every finished segment are kept in a .preprocessing directory of the output directory until the outputs
+# are written, so a run that was interrupted continues from its finished segments when it is started again.
+#
+# A delta of added, changed or removed games ({AppID: game, or null to remove it}) is appended to an overlay of the
+# outputs that the app merges in when it loads them (see delta_overlay.py), and folded into the outputs by --compact:
+#
+#   python preprocessing.py path/to/delta.json --update [--out-dir .]
+#   python preprocessing.py --compact [--out-dir .]
+
+CHUNK_SIZE = 1 << 20    # Characters read from the source at a time
+SEGMENT_SIZE = 8 << 20  # Bytes of the source decoded, cleaned and indexed per task of the process pool
+
+CSV_FILE = 'cleaned_games.csv'
+GAMES_JSON_FILE = 'cleaned_games.json'
+RELEASE_FILE = 'release.json'
+CACHE_FILE = 'cleaned_games.feather'
+VERSION_FILE = 'data_version.json'
+PROGRESS_DIR = '.preprocessing'
+DONE_FILE = 'done.json'
+
+# Columns of the cleaned CSV: {CSV column: function of the raw game}
+CSV_COLUMNS = {
+    'Name': lambda game: game.get('name'),
+    'Release date': lambda game: game.get('release_date'),
+    'Est. owners': lambda game: estimate_owners(game.get('estimated_owners')),
+    'Peak CCU': lambda game: game.get('peak_ccu'),
+    'Required age': lambda game: game.get('required_age'),
+    'Price': lambda game: game.get('price'),
+    'DLC count': lambda game: game.get('dlc_count'),
+    'Windows': lambda game: game.get('windows'),
+    'Mac': lambda game: game.get('mac'),
+    'Linux': lambda game: game.get('linux'),
+    'Metacritic score': lambda game: game.get('metacritic_score'),
+    'User score': lambda game: game.get('user_score'),
+    'Positive': lambda game: game.get('positive'),
+    'Negative': lambda game: game.get('negative'),
+    'Achievements': lambda game: game.get('achievements'),
+    'Recommendations': lambda game: game.get('recommendations'),
+    'Average playtime': lambda game: game.get('average_playtime_forever'),
+    'Median playtime': lambda game: game.get('median_playtime_forever'),
+    'Reviews': lambda game: game['reviews'],
+    # Games without reviews have no review score in the CSV (and are dropped from it with the other missing values)
+    'Review score': lambda game: game['review score'] if game['reviews'] > 0 else None,
+}
+
+# List columns of the raw games turned into {value: [AppID, ...]} inverted indexes, written to '<column>.json'
+INDEX_COLUMNS = ['categories', 'genres', 'supported_languages', 'full_audio_languages', 'developers', 'publishers', 'tags']
+
+# Raw columns dropped from the cleaned per-game JSON
+DROPPED_COLUMNS = ['packages', 'required_age', 'dlc_count', 'detailed_description', 'about_the_game', 'short_description',
+                   'header_image', 'website', 'support_url', 'support_email', 'metacritic_url', 'notes', 'screenshots',
+                   'movies', 'score_rank']
+
+# Language cleanup rules (see canonical_languages)
+LANGUAGE_STRIP = ("\n", "\r", " ", ";", "[b][/b]")
+LANGUAGE_CUTS = (" (", "#", "&")
+LANGUAGE_SEPARATORS = (",", "\r", "\n")
+LANGUAGE_FIXES = {"Slovakian": ("Slovak",), "English Dutch  English": ("English", "Dutch")}
+
+# Stream the (AppID, game) pairs of a {AppID: game} JSON file without loading the whole file
+def iter_games(path, chunk_size=CHUNK_SIZE):
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf8') as f:
+        buffer, pos, eof = '', 0, False
+
+        # Skip whitespace and the given separators, reading more of the file when the buffer runs out
+        def skip(chars):
+            nonlocal buffer, pos, eof
+            while True:
+                while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] in chars):
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return
+                buffer, pos = f.read(chunk_size), 0
+                eof = not buffer
+
+        # Decode the next JSON value, reading more of the file while the value is incomplete
+        def decode():
+            nonlocal buffer, pos, eof
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    chunk = f.read(chunk_size)
+                    eof = not chunk
+                    buffer, pos = buffer[pos:] + chunk, 0
+                    continue
+                pos = end
+                return value
+
+        skip('')
+        if buffer[pos:pos + 1] != '{':
+            raise ValueError(f"{path} is not a JSON object of games")
+        pos += 1
+        while True:
+            skip(',')
+            if eof or buffer[pos] == '}':
+                return
+            app_id = decode()
+            skip(':')
+            yield app_id, decode()
+
+# Start of a game in the source: the '"AppID": {' key of a game after the closing brace of the previous game. Quotes
+# are escaped within JSON strings, so only object keys match (a nested object with numeric keys would match as well,
+# the decoding of its segment then fails, see decode_segment).
+GAME_START = re.compile(rb'\}\s*,\s*("\d+"\s*:\s*\{)')
+
+# Split the games of a {AppID: game} JSON file into (start, end) byte ranges of about segment_size bytes, each holding
+# whole games. Only the bytes around every split point are read.
+def source_segments(path, segment_size=SEGMENT_SIZE):
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(CHUNK_SIZE)
+        start = len(head) - len(head.lstrip())
+        f.seek(max(0, size - CHUNK_SIZE))
+        tail = f.read()
+        end = size - (len(tail) - len(tail.rstrip())) - 1
+        if head[start:start + 1] != b'{' or tail.rstrip()[-1:] != b'}' or end <= start:
+            raise ValueError(f"{path} is not a JSON object of games")
+        bounds = [start + 1]
+        while bounds[-1] + segment_size < end:
+            # Start of the first game after the next split point
+            offset = bounds[-1] + segment_size
+            f.seek(offset)
+            window, match = b'', None
+            while not match:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                window += chunk
+                match = GAME_START.search(window)
+            if not match or offset + match.start(1) >= end:
+                break
+            bounds.append(offset + match.start(1))
+        bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+# Decode the {AppID: game} games of a byte range of the source (see source_segments)
+def decode_segment(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf8').rstrip().rstrip(',')
+    try:
+        return json.loads('{' + text + '}')
+    except json.JSONDecodeError as error:
+        raise ValueError(f"Bytes {start}-{end} of {path} are not whole games") from error
+
+# Middle of the 'a - b' estimated owners range
+def estimate_owners(estimated_owners):
+    if not estimated_owners:
+        return None
+    low, high = estimated_owners.split(' - ')
+    return int((int(low) + int(high)) / 2)
+
+# Canonical language names of a raw supported language value, as a tuple (a raw value can hold several languages).
+# Same rules as the notebook's fixed-point cleanup: strip markup and separators from both ends, cut everything after
+# ' (', '#' or '&', split on ',' and line breaks, then apply the manual fixes. Cached, since raw values repeat a lot.
+@functools.lru_cache(maxsize=None)
+def canonical_languages(raw):
+    value = raw
+    stripped = True
+    while stripped:
+        stripped = False
+        for s in LANGUAGE_STRIP:
+            if value.startswith(s):
+                value, stripped = value[len(s):], True
+            if value.endswith(s):
+                value, stripped = value[:-len(s)], True
+    for cut in LANGUAGE_CUTS:
+        if value.split(cut)[0] != value:
+            return canonical_languages(value.split(cut)[0])
+    for separator in LANGUAGE_SEPARATORS:
+        if separator in value:
+            return tuple(dict.fromkeys(lang for part in value.split(separator) if part for lang in canonical_languages(part)))
+    if not value:
+        return ()
+    return LANGUAGE_FIXES.get(value, (value,))
+
+# Year and month of a raw release date, None for invalid or missing dates (cached, since dates repeat a lot)
+@functools.lru_cache(maxsize=None)
+def release_month(release_date):
+    date = pd.to_datetime(release_date, errors='coerce')
+    if pd.isna(date):
+        return None
+    return date.year, date.month
+
+# Clean a raw game in place: tags as a list, reviews, review score and canonical languages
+def clean_game(game):
+    if isinstance(game.get('tags'), dict):
+        game['tags'] = list(game['tags'].keys())
+    game['reviews'] = game.get('positive', 0) + game.get('negative', 0)
+    game['review score'] = game.get('positive', 0) / game['reviews'] if game['reviews'] > 0 else 0
+    game['est_owners'] = estimate_owners(game.get('estimated_owners'))
+    game['supported_languages'] = list(dict.fromkeys(
+        lang for raw in game.get('supported_languages', []) for lang in canonical_languages(raw)))
+    return game
+
+# Row of a cleaned game in the cleaned CSV, None if it has missing values (like the notebook's dropna)
+def csv_row(app_id, game):
+    row = [app_id] + [value(game) for value in CSV_COLUMNS.values()]
+    if all(value is not None and value != '' for value in row):
+        return row
+    return None
+
+# Add a cleaned game to the inverted indexes
+def index_game(app_id, game, indexes, release_index):
+    for column in INDEX_COLUMNS:
+        for value in dict.fromkeys(game.get(column) or []):
+            indexes[column].setdefault(value, []).append(app_id)
+    month = release_month(game.get('release_date'))
+    if month:
+        release_index.setdefault(str(month[0]), {}).setdefault(str(month[1]), []).append(app_id)
+
+# Write a JSON file atomically, so an interrupted run never leaves a half-written output behind (json.dumps uses the C
+# encoder, json.dump does not)
+def write_json(data, path):
+    write_text(json.dumps(data), path)
+
+# Write a text file atomically
+def write_text(text, path):
+    def write(tmp_path):
+        with open(tmp_path, 'w', newline='', encoding='utf8') as f:
+            f.write(text)
+    write_atomically(path, write)
+
+# Write an inverted index as JSON and as binary posting lists (read by the app, see posting_lists.py)
+def write_index(index, path):
+    write_json(index, path)
+    write_postings(flat_postings(index), postings_path(path))
+
+# Output files of the pipeline
+def output_files(out_dir, games_json=False):
+    files = [CSV_FILE, RELEASE_FILE] + [f"{column}.json" for column in INDEX_COLUMNS]
+    files += [postings_path(file) for file in files[1:]]
+    if games_json:
+        files.append(GAMES_JSON_FILE)
+    return [os.path.join(out_dir, file) for file in files]
+
+# Clean and index a batch of (AppID, raw game) pairs.
+# Returns the number of games, the rows of the cleaned CSV with the number of languages of each, the partial inverted
+# indexes and the cleaned per-game JSON entries (if requested).
+def process_batch(batch, games_json=False):
+    indexes = {column: {} for column in INDEX_COLUMNS}
+    release_index = {}
+    rows, language_counts, entries = [], [], []
+    for app_id, game in batch:
+        game = clean_game(game)
+        index_game(app_id, game, indexes, release_index)
+        row = csv_row(app_id, game)
+        if row:
+            rows.append(row)
+            language_counts.append(len(game['supported_languages']))
+        if games_json:
+            for column in DROPPED_COLUMNS:
+                game.pop(column, None)
+            entries.append(json.dumps(app_id) + ': ' + json.dumps(game))
+    return len(batch), rows, language_counts, indexes, release_index, entries
+
+# Decode, clean and index the games of a byte range of the source, the unit of work of the process pool. Its outputs
+# are saved in segment_dir under the names of the pipeline outputs: the rows of the cleaned CSV (without header), their
+# typed columnar table, every partial inverted index and the cleaned per-game JSON entries (if requested). A done marker
+# with the numbers of games and rows is written last.
+def process_segment(path, start, end, segment_dir, games_json=False):
+    n_games, rows, language_counts, indexes, release_index, entries = process_batch(
+        list(decode_segment(path, start, end).items()), games_json)
+    os.makedirs(segment_dir, exist_ok=True)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    write_text(buffer.getvalue(), os.path.join(segment_dir, CSV_FILE))
+    if rows:
+        write_columnar_cache(type_csv_rows(['AppID'] + list(CSV_COLUMNS), rows, language_counts), os.path.join(segment_dir, CACHE_FILE))
+    for column, index in indexes.items():
+        write_json(index, os.path.join(segment_dir, f"{column}.json"))
+    write_json(release_index, os.path.join(segment_dir, RELEASE_FILE))
+    if games_json:
+        write_text(', '.join(entries), os.path.join(segment_dir, GAMES_JSON_FILE))
+    write_json({'games': n_games, 'rows': len(rows)}, os.path.join(segment_dir, DONE_FILE))
+
+# Merge a partial inverted index into an index, the batches hold disjoint games so their union is a concatenation
+# (done in source order, which keeps the order of the keys and AppIDs of a single pass). Nested indexes
+# (release.json's {year: {month: ids}}) are merged level by level.
+def merge_index(index, partial):
+    for key, ids in partial.items():
+        if isinstance(ids, dict):
+            merge_index(index.setdefault(key, {}), ids)
+        else:
+            index.setdefault(key, []).extend(ids)
+
+# Merge the partial inverted indexes of an index file saved by every segment, in source order, and write the index
+def merge_index_file(file, segment_dirs, out_dir):
+    index = {}
+    for segment_dir in segment_dirs:
+        with open(os.path.join(segment_dir, file), 'r', encoding='utf8') as f:
+            merge_index(index, json.load(f))
+    write_index(index, os.path.join(out_dir, file))
+
+# Concatenate the CSV rows saved by every segment, in source order, under the CSV header
+def merge_csv(segment_dirs, path):
+    def write(tmp_path):
+        with open(tmp_path, 'w', newline='', encoding='utf8') as f:
+            csv.writer(f).writerow(['AppID'] + list(CSV_COLUMNS))
+            for segment_dir in segment_dirs:
+                with open(os.path.join(segment_dir, CSV_FILE), 'r', newline='', encoding='utf8') as part:
+                    shutil.copyfileobj(part, f)
+    write_atomically(path, write)
+
+# Concatenate the cleaned per-game JSON entries saved by every segment, in source order, into one JSON object
+def merge_games_json(segment_dirs, path):
+    parts = []
+    for segment_dir in segment_dirs:
+        with open(os.path.join(segment_dir, GAMES_JSON_FILE), 'r', newline='', encoding='utf8') as f:
+            parts.append(f.read())
+    write_text('{' + ', '.join(part for part in parts if part) + '}', path)
+
+# Concatenate the typed columnar tables saved by every segment, in source order, and downcast the integer columns to
+# the values of all the games like in a table built from the full CSV
+def merge_columnar_cache(segment_dirs, csv_path, cache_path, languages_path):
+    frames = [read_columnar_cache(os.path.join(segment_dir, CACHE_FILE)) for segment_dir in segment_dirs
+              if os.path.exists(os.path.join(segment_dir, CACHE_FILE))]
+    if not frames:  # No game with a complete row
+        build_columnar_cache(csv_path, cache_path, languages_path)
+        return
+    write_columnar_cache(downcast_integers(pd.concat(frames, ignore_index=True)), cache_path)
+
+# Results of the (func, args) tasks, in order: in the process pool if there is one, in this process otherwise
+def run_tasks(executor, tasks):
+    if executor is None:
+        return [func(*args) for func, args in tasks]
+    futures = [executor.submit(func, *args) for func, args in tasks]
+    return [future.result() for future in futures]
+
+# Segments of the source (see source_segments) of the run in progress_dir if it was started for the same source and
+# options, otherwise the progress of a new run, starting with the segments of the source
+def load_progress(source, progress_dir, games_json=False):
+    stat = os.stat(source)
+    marker = {'source': os.path.abspath(source), 'size': stat.st_size, 'mtime': stat.st_mtime, 'games_json': games_json}
+    path = os.path.join(progress_dir, 'progress.json')
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf8') as f:
+            progress = json.load(f)
+        if all(progress.get(key) == value for key, value in marker.items()):
+            return progress['segments']
+    shutil.rmtree(progress_dir, ignore_errors=True)
+    os.makedirs(progress_dir)
+    segments = source_segments(source)
+    write_json(dict(marker, segments=segments), path)
+    return segments
+
+# Directory of the saved outputs of a segment of a run
+def segment_dir(progress_dir, i):
+    return os.path.join(progress_dir, f"segment-{i:05d}")
+
+# Process the segments of the source that are not done yet (an interrupted run keeps its finished segments), in the
+# process pool if there is one. Returns the directories of the saved outputs of every segment, in source order, and
+# the numbers of games and of rows of the cleaned CSV.
+def process_segments(source, progress_dir, games_json=False, executor=None):
+    segments = load_progress(source, progress_dir, games_json)
+    segment_dirs = [segment_dir(progress_dir, i) for i in range(len(segments))]
+    run_tasks(executor, [(process_segment, (source, start, end, directory, games_json))
+                         for (start, end), directory in zip(segments, segment_dirs)
+                         if not os.path.exists(os.path.join(directory, DONE_FILE))])
+    n_games = n_rows = 0
+    for directory in segment_dirs:
+        with open(os.path.join(directory, DONE_FILE), 'r', encoding='utf8') as f:
+            done = json.load(f)
+        n_games += done['games']
+        n_rows += done['rows']
+    return segment_dirs, n_games, n_rows
+
+# Run the pipeline: read the source once and emit the cleaned CSV (games with missing values are left out, like the
+# notebook's dropna), every inverted index, the columnar cache and optionally the cleaned per-game JSON.
+# With jobs > 1 the segments are processed by a process pool, which then merges and writes every index file and the
+# CSV in parallel. Only the concatenation of the typed tables of the segments and the final write of the columnar cache
+# (last, so it is newer than its sources) run in this process.
+def run_pipeline(source, out_dir='.', games_json=False, jobs=1):
+    progress_dir = os.path.join(out_dir, PROGRESS_DIR)
+    csv_path = os.path.join(out_dir, CSV_FILE)
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        segment_dirs, n_games, n_rows = process_segments(source, progress_dir, games_json, executor)
+        tasks = [(merge_index_file, (file, segment_dirs, out_dir))
+                 for file in [RELEASE_FILE] + [f"{column}.json" for column in INDEX_COLUMNS]]
+        tasks.append((merge_csv, (segment_dirs, csv_path)))
+        if games_json:
+            tasks.append((merge_games_json, (segment_dirs, os.path.join(out_dir, GAMES_JSON_FILE))))
+        run_tasks(executor, tasks)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    merge_columnar_cache(segment_dirs, csv_path, os.path.join(out_dir, CACHE_FILE),
+                         os.path.join(out_dir, 'supported_languages.json'))
+    # The source of a full run already holds the deltas applied to the previous outputs
+    if os.path.exists(os.path.join(out_dir, DELTA_FILE)):
+        os.remove(os.path.join(out_dir, DELTA_FILE))
+    bump_data_version(os.path.join(out_dir, VERSION_FILE))
+    shutil.rmtree(progress_dir)
+    return n_games, n_rows
+
+# Remove the given AppIDs from a {key: [AppID, ...]} index and add the given ones, keys left without games are dropped
+def patch_postings(postings, removed, added):
+    for key in list(postings):
+        ids = [app_id for app_id in postings[key] if app_id not in removed]
+        ids.extend(added.pop(key, []))
+        if ids:
+            postings[key] = ids
+        else:
+            del postings[key]
+    postings.update(added)
+
+# Apply a delta of added, changed or removed games to the outputs of a previous run in out_dir and bump the data version.
+# Only the games of the delta are parsed, cleaned and indexed, and the result is appended to the overlay of out_dir (see
+# delta_overlay.py), which the app merges into the outputs when it loads them: the outputs themselves are not read nor
+# rewritten, so a refresh takes time in the size of the delta. The cleaned per-game JSON is not patched (it is not used
+# by the app), rerun the full pipeline with --games-json to refresh it.
+def apply_delta(delta, out_dir='.'):
+    touched = []
+    rows, language_counts = [], []
+    indexes = {column: {} for column in INDEX_COLUMNS}
+    release_index = {}
+    for app_id, game in iter_games(delta):
+        touched.append(app_id)
+        if game is not None:
+            game = clean_game(game)
+            index_game(app_id, game, indexes, release_index)
+            row = csv_row(app_id, game)
+            if row:
+                rows.append(row)
+                language_counts.append(len(game['supported_languages']))
+
+    postings = {f"{column}.json": index for column, index in indexes.items()}
+    postings[RELEASE_FILE] = flat_postings(release_index)
+    append_delta({'touched': touched, 'columns': ['AppID'] + list(CSV_COLUMNS), 'rows': rows,
+                  'language_counts': language_counts, 'postings': postings}, os.path.join(out_dir, DELTA_FILE))
+    version = bump_data_version(os.path.join(out_dir, VERSION_FILE))
+    return len(touched), len(rows), version
+
+# Fold the overlay of the deltas applied to out_dir into its outputs and drop it, then bump the data version. Every
+# index file, the CSV and the columnar table are rewritten, so this takes time in the size of the catalog. Merging the
+# overlay into outputs it was already folded into gives the same data, so readers stay consistent while the files are
+# replaced one by one, and an interrupted compaction can simply be run again.
+def compact_delta(out_dir='.'):
+    path = os.path.join(out_dir, DELTA_FILE)
+    overlay = load_overlay(path)
+    if overlay is None:
+        return 0, data_version(os.path.join(out_dir, VERSION_FILE))
+    touched = {str(app_id) for app_id in overlay.touched}
+
+    # Patch the inverted indexes
+    for column in INDEX_COLUMNS:
+        file = os.path.join(out_dir, f"{column}.json")
+        with open(file, 'r', encoding='utf8') as f:
+            index = json.load(f)
+        patch_postings(index, touched, {key: list(map(str, ids)) for key, ids in overlay.added(f"{column}.json").items()})
+        write_index(index, file)
+    added = {}
+    for key, ids in overlay.added(RELEASE_FILE).items():  # Flat 'year-month' keys, see posting_lists.flat_postings
+        year, month = key.split('-')
+        added.setdefault(year, {})[month] = list(map(str, ids))
+    file = os.path.join(out_dir, RELEASE_FILE)
+    with open(file, 'r', encoding='utf8') as f:
+        release = json.load(f)
+    for year in set(release) | set(added):
+        months = release.setdefault(year, {})
+        patch_postings(months, touched, added.get(year, {}))
+        if not months:
+            del release[year]
+    write_index(release, file)
+
+    # Patch the cleaned CSV: the rows of the touched games are replaced by their complete rows of the overlay
+    csv_path = os.path.join(out_dir, CSV_FILE)
+    def write(tmp_path):
+        with open(csv_path, 'r', newline='', encoding='utf8') as old_file, \
+             open(tmp_path, 'w', newline='', encoding='utf8') as new_file:
+            reader, writer = csv.reader(old_file), csv.writer(new_file)
+            writer.writerow(next(reader))
+            writer.writerows(row for row in reader if row[0] not in touched)
+            writer.writerows(row for row, _ in overlay.rows.values())
+    write_atomically(csv_path, write)
+
+    # Patch the columnar table (written last, so it stays newer than its sources)
+    cache_path = os.path.join(out_dir, CACHE_FILE)
+    if os.path.exists(cache_path):
+        write_columnar_cache(overlaid_frame(read_columnar_cache(cache_path), overlay), cache_path)
+    else:
+        build_columnar_cache(csv_path, cache_path, os.path.join(out_dir, 'supported_languages.json'))
+
+    os.remove(path)
+    return len(touched), bump_data_version(os.path.join(out_dir, VERSION_FILE))
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean the raw Steam games.json into the files used by the app.")
+    parser.add_argument('source', nargs='?', help="raw games.json ({AppID: game}), or the delta to apply with --update")
+    parser.add_argument('--out-dir', default='.', help="directory of the output files (default: current directory)")
+    parser.add_argument('--games-json', action='store_true', help=f"also write the cleaned per-game {GAMES_JSON_FILE}")
+    parser.add_argument('--force', action='store_true', help="rebuild even if all outputs are newer than the source")
+    parser.add_argument('--jobs', type=int, default=1, help="number of processes cleaning and indexing the games (default: 1)")
+    parser.add_argument('--update', action='store_true',
+                        help="apply the source as a delta ({AppID: game, or null to remove it}) to the existing outputs")
+    parser.add_argument('--compact', action='store_true', help=f"fold the applied deltas ({DELTA_FILE}) into the outputs")
+    args = parser.parse_args()
+
+    if args.compact:
+        n_games, version = compact_delta(args.out_dir)
+        print(f"Folded {n_games} games of {DELTA_FILE} into the outputs, data version {version}")
+        return
+    if args.source is None:
+        parser.error("the source is required unless --compact is given")
+
+    if args.update:
+        n_games, n_rows, version = apply_delta(args.source, args.out_dir)
+        print(f"Updated {n_games} games, {n_rows} written to {CSV_FILE}, data version {version}")
+        return
+
+    # Outputs are only replaced once complete, so a run is only needed if some output is missing or stale
+    outputs = output_files(args.out_dir, args.games_json)
+    if not args.force and all(os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(args.source)
+                              for path in outputs):
+        print("All outputs are up to date, use --force to rebuild")
+        return
+    n_games, n_rows = run_pipeline(args.source, args.out_dir, args.games_json, args.jobs)
+    print(f"Processed {n_games} games, {n_rows} written to {CSV_FILE}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import os
+import threading
+import concurrent.futures
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx, add_script_run_ctx
+from streamlit.runtime.scriptrunner_utils.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME
+
+# Progressive rendering of the multi-chart pages (set PROGRESSIVE_RENDERING=1). The pages lay out placeholders for all
+# their charts, then every chart is aggregated and built as one task of a thread pool shared by all sessions and drawn in
+# its placeholder as soon as it completes, so the first charts show up while the others are computed. Charts sharing an
+# aggregation ask for the same memoized result, which is computed once (see result_cache.py).
+# The content of collapsed expanders is only evaluated once they are opened (every open or close is a rerun).
+# Without it, the charts are computed and drawn one after the other and every expander is evaluated.
+PROGRESSIVE_RENDERING = os.environ.get('PROGRESSIVE_RENDERING') == '1'
+RENDER_WORKERS = 4
+
+RENDER_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix='render')
+
+# Run func in the render pool with the script run context of the current rerun, so it can use the session state
+# (memoized results, see result_cache.py) and record its spans in the rerun (see instrumentation.py)
+def submit(func, *args):
+    ctx = get_script_run_ctx()
+    def run():
+        thread = threading.current_thread()
+        add_script_run_ctx(thread, ctx)
+        try:
+            return func(*args)
+        finally:
+            # add_script_run_ctx(thread, None) would keep the context (it falls back to the one of the thread), the
+            # pooled thread must not hold on to the context of a finished rerun
+            if hasattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME):
+                delattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME)
+    return RENDER_POOL.submit(run)
+
+# Draw charts in their placeholders: charts are (placeholder, build) pairs, build aggregating the data of the chart and
+# returning its figure. In progressive mode every chart is built in the render pool and drawn as soon as it is built.
+def render_charts(charts):
+    if not PROGRESSIVE_RENDERING:
+        for placeholder, build in charts:
+            placeholder.plotly_chart(build(), use_container_width=True)
+        return
+    futures = {submit(build): placeholder for placeholder, build in charts}
+    for future in concurrent.futures.as_completed(futures):
+        futures[future].plotly_chart(future.result(), use_container_width=True)
+
+# Expander whose content only has to be evaluated when open, returned with whether it is open (always in the
+# default mode). In progressive mode opening or closing it reruns the page (expander on_change and open, streamlit 1.55+).
+def lazy_expander(label, key, expanded=False):
+    if not PROGRESSIVE_RENDERING:
+        return st.expander(label, expanded=expanded), True
+    expander = st.expander(label, expanded=expanded, key=key, on_change='rerun')
+    return expander, bool(expander.open)
@@ -0,0 +1,223 @@
+import os
+import re
+import html
+import json
+import time
+import argparse
+import importlib.util
+import concurrent.futures
+import numpy as np
+import pandas as pd
+import plotly.offline
+from streamlit.logger import set_log_level
+from data_loader import load_csv_data, load_column_stats, load_release_periods, build_filter_mask, normalize_filter_ranges
+from derived_columns import load_derived_column, PRICE_BIN_LABELS
+from game_index import load_game_index, load_index_keys
+from aggregate_cube import scan_partials, PartialAggregates
+from analytics import (PRICE_METRICS, POSITIVE_METRICS, RELEASE_METRICS, RELEASE_GROUPINGS, TREND_FIELDS, TREND_METRICS,
+                       SELECTION_INDEXES, release_year_range, trend_periods, trend_from_partials)
+from charts import price_bin_figure, release_period_figure, trend_figure, trend_label, RELEASE_BACKGROUND_COLORS, TREND_COLORS
+
+# Batch reports of the Price vs Popularity grid, the Release Time bars and the Trends lines for a list of specs, without
+# a browser. A spec file is a JSON list of specs like
+#   {"name": "Indie RPG", "tags": ["Indie"], "genres": ["RPG"], "categories": [], "filters": [["Price", 0, 20]],
+#    "year_range": [2015, 2024]}
+# where every key is optional: the selected games match all the tags, genres and categories and pass the (column, min,
+# max) range filters, the release bars only count the games released in the year range (default: all years).
+# The aggregates of all the specs are computed in the main process in one grouped pass per chart type over the stacked
+# row masks of the specs (see scan_partials), then every report is rendered by a pool of processes to a standalone HTML
+# page (sharing one plotly.js file), and optionally to one SVG/PNG image per chart (needs kaleido).
+CHUNK_SERIES = 64  # Row masks stacked per grouped pass, bounds the memory of the masks on large catalogs
+IMAGE_FORMATS = ['svg', 'png']
+
+# Specs of a spec file, with the keys of every selection checked against the indexes
+def load_specs(path):
+    with open(path, 'r') as f:
+        specs = json.load(f)
+    column_stats = load_column_stats()
+    loaded = []
+    for i, spec in enumerate(specs):
+        selection = [list(spec.get(name, [])) for name in ['tags', 'genres', 'categories']]
+        for file, keys in zip(SELECTION_INDEXES, selection):
+            unknown = set(keys) - set(load_index_keys(file))
+            if unknown:
+                raise ValueError(f"Spec {i}: unknown keys {sorted(unknown)} in {file}")
+        filters = normalize_filter_ranges([tuple(filter_range) for filter_range in spec.get('filters', [])], column_stats)
+        loaded.append({
+            'name': spec.get('name') or ' + '.join(key for keys in selection for key in keys) or 'All games',
+            'selection': selection,
+            'filters': filters,
+            'year_range': tuple(spec.get('year_range') or release_year_range()),
+        })
+    return loaded
+
+# Row mask over the full dataset of the games passing range filters and matching a (tags, genres, categories) selection
+def selection_mask(filters, selection):
+    mask = build_filter_mask(tuple(tuple(filter_range) for filter_range in filters))
+    for file, keys in zip(SELECTION_INDEXES, selection):
+        if keys:
+            mask = mask & load_game_index(file).mask(keys)
+    return mask
+
+# Partial aggregates of the series of (filters, selection, year range) row masks, year_range None for all years.
+# Equal series of several specs are scanned once, the masks are stacked CHUNK_SERIES at a time.
+def scan_series(series, group_codes, n_groups, values, metrics):
+    unique = list(dict.fromkeys(json.dumps(item) for item in series))
+    release_years = load_csv_data()['Release Year']
+    partials = []
+    for start in range(0, len(unique), CHUNK_SERIES):
+        masks = []
+        for item in unique[start:start + CHUNK_SERIES]:
+            filters, selection, year_range = json.loads(item)
+            mask = selection_mask(filters, selection)
+            if year_range:
+                mask = mask & release_years.between(*year_range).to_numpy(dtype=bool, na_value=False)
+            masks.append(mask)
+        partials.append(scan_partials(np.array(masks), group_codes, n_groups, values, metrics))
+    partials = PartialAggregates.concat(partials)
+    positions = {item: position for position, item in enumerate(unique)}
+    return partials, [positions[json.dumps(item)] for item in series]
+
+# Price bin metrics of the selected games of every spec, as {metric: frame} like price_bin_metrics (analytics.py)
+def price_reports(specs):
+    df = load_csv_data()
+    metrics = PRICE_METRICS[1:]
+    values = df[metrics].to_numpy(dtype=float)
+    for j, metric in enumerate(metrics):
+        if metric in POSITIVE_METRICS:
+            values[values[:, j] <= 0, j] = np.nan  # Zeros are left out
+    codes = load_derived_column('Price Bin').cat.codes.to_numpy(dtype='int64')
+    partials, positions = scan_series([(spec['filters'], spec['selection'], None) for spec in specs], codes,
+                                      len(PRICE_BIN_LABELS), values, metrics)
+    means = partials.mean()
+    price_bins = pd.Categorical(PRICE_BIN_LABELS, categories=PRICE_BIN_LABELS, ordered=True)
+    reports = []
+    for series in positions:
+        report = {'Games released': pd.DataFrame({'Price Bin': price_bins, 'Games released': partials.n[series]})}
+        for j, metric in enumerate(metrics):
+            n_games = partials.count[series, :, j].astype('int64') if metric in POSITIVE_METRICS else partials.n[series]
+            report[metric] = pd.DataFrame({'Price Bin': price_bins, metric: means[series, :, j], 'Games released': n_games})
+        reports.append(report)
+    return reports
+
+# Release Time summaries (all games, selected games) of every spec, by month or quarter
+def release_reports(specs, group_by):
+    df = load_csv_data()
+    group_column, n_groups = RELEASE_GROUPINGS[group_by]
+    series = []
+    for spec in specs:
+        series += [(spec['filters'], [[], [], []], spec['year_range']), (spec['filters'], spec['selection'], spec['year_range'])]
+    partials, positions = scan_series(series, df[group_column].to_numpy(dtype='int64', na_value=0) - 1, n_groups,
+                                      df[RELEASE_METRICS].to_numpy(dtype=float), RELEASE_METRICS)
+    summaries = [partials.summary(position, range(1, n_groups + 1), group_column) for position in positions]
+    return list(zip(summaries[::2], summaries[1::2]))
+
+# Trends plot data (all games, selected games) of every spec
+def trend_reports(specs):
+    df = load_csv_data()
+    time_periods = trend_periods()
+    min_year = time_periods.levels[0][0]
+    release_periods = load_release_periods()
+    period_codes = np.full(len(df), -1)
+    period_codes[release_periods.index.to_numpy()] = (release_periods['year'] - min_year) * 12 + release_periods['month'] - 1
+    series = []
+    for spec in specs:
+        series += [(spec['filters'], [[], [], []], None), (spec['filters'], spec['selection'], None)]
+    partials, positions = scan_series(series, period_codes, len(time_periods), df[TREND_METRICS].to_numpy(dtype=float),
+                                      TREND_METRICS)
+    plot_data = [trend_from_partials(partials, position, time_periods) for position in positions]
+    return list(zip(plot_data[::2], plot_data[1::2]))
+
+# File name of a report
+def report_slug(i, name):
+    return f"{i:03d}_{re.sub(r'[^A-Za-z0-9_-]+', '_', name).strip('_')}"
+
+# Figures of a report, as (chart name, figure): the price grid, the release bars and the trend lines of every field
+def report_figures(job):
+    figures = []
+    price_order = PRICE_METRICS[1:] + [PRICE_METRICS[0]]
+    for metric in price_order:
+        figures.append((f"price_{metric}", price_bin_figure(job['price'][metric], metric)))
+
+    all_summary, selected_summary = job['release']
+    filtered = any(job['selection'])
+    for i, metric in enumerate(RELEASE_METRICS + ['Games released']):
+        figures.append((f"release_{metric}", release_period_figure(all_summary, selected_summary, None, metric,
+                                                                   job['group_by'], RELEASE_BACKGROUND_COLORS[i], filtered)))
+
+    all_plot_data, selected_plot_data = job['trends']
+    combination = dict(zip(['Tags', 'Genres', 'Categories'], job['selection']))
+    series = [(trend_label(combination), selected_plot_data, TREND_COLORS[0])] if filtered else []
+    for field in sorted(TREND_FIELDS):
+        fig = trend_figure(all_plot_data, series, field, job['time_granularity'])
+        fig.update_layout(title=f"{field} over time")
+        figures.append((f"trends_{field}", fig))
+    return figures
+
+# Render a report to its HTML page (and images), run in the worker processes
+def render_report(job, out_dir, formats):
+    figures = report_figures(job)
+    if 'html' in formats:
+        charts = "\n".join(fig.to_html(full_html=False, include_plotlyjs=False) for _, fig in figures)
+        filters = ", ".join(f"{column} in [{min_value:g}, {max_value:g}]" for column, min_value, max_value in job['filters'])
+        name = html.escape(job['name'])
+        with open(os.path.join(out_dir, f"{job['slug']}.html"), 'w', encoding='utf8') as f:
+            f.write(f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{name}</title><script src="plotly.min.js"></script></head>
+<body><h1>{name}</h1><p>Filters: {html.escape(filters) or 'none'}</p>
+{charts}
+</body></html>""")
+    image_formats = [image_format for image_format in formats if image_format in IMAGE_FORMATS]
+    if image_formats:
+        image_dir = os.path.join(out_dir, job['slug'])
+        os.makedirs(image_dir, exist_ok=True)
+        for chart, fig in figures:
+            for image_format in image_formats:
+                fig.write_image(os.path.join(image_dir, f"{re.sub(r'[^A-Za-z0-9_-]+', '_', chart)}.{image_format}"))
+    return job['slug']
+
+# Compute the aggregates of every spec and render the reports to out_dir with a pool of workers
+def write_reports(specs, out_dir, formats=('html',), workers=None, group_by='Months', time_granularity='Year'):
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    jobs = [{'slug': report_slug(i, spec['name']), 'name': spec['name'], 'selection': spec['selection'],
+             'filters': spec['filters'], 'group_by': group_by, 'time_granularity': time_granularity,
+             'price': price, 'release': release, 'trends': trends}
+            for i, (spec, price, release, trends)
+            in enumerate(zip(specs, price_reports(specs), release_reports(specs, group_by), trend_reports(specs)))]
+    print(f"Aggregated {len(specs)} specs in {time.perf_counter() - start:.1f} s")
+
+    # One plotly.js file for all the HTML reports, they work offline
+    if 'html' in formats:
+        with open(os.path.join(out_dir, 'plotly.min.js'), 'w', encoding='utf8') as f:
+            f.write(plotly.offline.get_plotlyjs())
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(render_report, job, out_dir, formats) for job in jobs]
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            future.result()
+            print(f"\rRendered {done}/{len(jobs)} reports", end='', flush=True)
+    print()
+    if 'html' in formats:
+        links = "\n".join(f'<li><a href="{job["slug"]}.html">{html.escape(job["name"])}</a></li>' for job in jobs)
+        with open(os.path.join(out_dir, 'index.html'), 'w', encoding='utf8') as f:
+            f.write(f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Reports</title></head>\n"
+                    f"<body><h1>Reports</h1><ul>\n{links}\n</ul></body></html>")
+    print(f"Wrote {len(jobs)} reports to {out_dir} in {time.perf_counter() - start:.1f} s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the charts of a list of filter specs to static reports")
+    parser.add_argument('specs', help="JSON file of the specs")
+    parser.add_argument('out_dir', help="directory to write the reports to")
+    parser.add_argument('--formats', nargs='+', default=['html'], choices=['html'] + IMAGE_FORMATS,
+                        help="html pages and/or one image per chart (svg, png: needs kaleido)")
+    parser.add_argument('--workers', type=int, help="rendering processes (default: number of CPUs)")
+    parser.add_argument('--group-by', default='Months', choices=list(RELEASE_GROUPINGS))
+    parser.add_argument('--time-granularity', default='Year', choices=['Year', 'Month'])
+    args = parser.parse_args()
+    if set(args.formats) & set(IMAGE_FORMATS) and importlib.util.find_spec('kaleido') is None:
+        parser.error("svg and png reports need kaleido (pip install kaleido)")
+    set_log_level('error')  # Caches used outside of a streamlit server warn on every call
+    write_reports(load_specs(args.specs), args.out_dir, args.formats, args.workers, args.group_by, args.time_granularity)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import os
+import copy
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+import collections
+import streamlit as st
+from columnar_cache import data_version
+from instrumentation import span
+
+# Memoization of page computations across reruns. Every result is keyed on a canonical hash of the name of the
+# computation, the page's own selections it depends on, the normalized sidebar filters and the data version, so a rerun
+# only recomputes the parts whose inputs changed. Results are looked up in three tiers:
+#   - a bounded LRU cache per session,
+#   - a process-wide LRU cache shared by all sessions, bounded by the pickled size of the results,
+#   - optionally a SQLite file shared by several app processes (set RESULT_CACHE_DB to its path).
+# Results are pure functions of their key. The cached results are shared by all sessions and never handed out: every
+# lookup returns its own copy (results are compact aggregates, cheap to copy), so a page changing a result in place
+# never changes the cached one. Identical queries from different sessions are computed once: concurrent sessions
+# missing the same key wait for the first one to compute it.
+SESSION_MAX_ENTRIES = 128
+GLOBAL_MAX_BYTES = 256 << 20
+RESULT_CACHE_DB = os.environ.get('RESULT_CACHE_DB')
+DB_MAX_BYTES = 1 << 30
+
+# Least recently used cache bounded by a number of entries and/or their total size, safe to use from several threads
+class LRUCache:
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()  # {key: (value, size)}
+        self.size = 0
+        self.lock = threading.Lock()
+
+    # Value of a key (now the most recently used), or default if the key is not cached
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    # Cache the value of a key, evicting the least recently used entries beyond max_entries or max_bytes
+    def put(self, key, value, size=0):
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries[key][1]
+            self.entries[key] = (value, size)
+            self.entries.move_to_end(key)
+            self.size += size
+            while len(self.entries) > 1 and ((self.max_entries and len(self.entries) > self.max_entries)
+                                             or (self.max_bytes and self.size > self.max_bytes)):
+                self.size -= self.entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+# Results shared by several processes in a SQLite file, evicting the least recently used results beyond max_bytes.
+# A connection is opened per operation, so the store can be used from any thread.
+class SQLiteStore:
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        with self.connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB, size INTEGER, used REAL)")
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    # Pickled result of a key, or None
+    def get(self, key):
+        with self.connect() as db:
+            row = db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row:
+                db.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+        return row[0] if row else None
+
+    # Store the pickled result of a key and evict the least recently used results beyond max_bytes
+    def put(self, key, data):
+        with self.connect() as db:
+            db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (key, data, len(data), time.time()))
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total > self.max_bytes:
+                # Delete the oldest results until the remaining ones fit
+                db.execute("""DELETE FROM results WHERE key IN (
+                                  SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY used DESC) AS kept FROM results)
+                                  WHERE kept > ?)""", (self.max_bytes,))
+
+GLOBAL_RESULTS = LRUCache(max_bytes=GLOBAL_MAX_BYTES)
+DB_RESULTS = SQLiteStore(RESULT_CACHE_DB, DB_MAX_BYTES) if RESULT_CACHE_DB else None
+MISSING = object()
+
+# Hit and miss counters of every tier (the number of computed results is the number of misses of the last tier)
+STATS = {tier: {'hits': 0, 'misses': 0} for tier in ['session', 'global', 'disk']}
+STATS_LOCK = threading.Lock()
+
+# Locks of the keys being computed, so concurrent sessions compute a result once
+KEY_LOCKS = {}
+KEY_LOCKS_LOCK = threading.Lock()
+
+# Count a hit or miss of a tier
+def count(tier, hit):
+    with STATS_LOCK:
+        STATS[tier]['hits' if hit else 'misses'] += 1
+
+# Copy of the hit and miss counters of every tier, with the number and size of the results of the process-wide cache
+def result_cache_stats():
+    with STATS_LOCK:
+        stats = {tier: dict(counters) for tier, counters in STATS.items()}
+    stats['global'].update(entries=len(GLOBAL_RESULTS.entries), bytes=GLOBAL_RESULTS.size)
+    if not DB_RESULTS:
+        del stats['disk']
+    return stats
+
+# LRU cache of the results of the current session
+def session_results():
+    if 'result_cache' not in st.session_state:
+        st.session_state['result_cache'] = LRUCache(max_entries=SESSION_MAX_ENTRIES)
+    return st.session_state['result_cache']
+
+# Canonical hash of the inputs of a page computation: its name, the given selections (any JSON-like value),
+# the normalized sidebar filters (see apply_filters_sidebar) and the data version
+def result_key(name, inputs=()):
+    state = [name, inputs, st.session_state.get('filter_ranges', []), data_version()]
+    return hashlib.sha256(json.dumps(state, sort_keys=True, default=str).encode('utf8')).hexdigest()
+
+# Cached result of a key (the cached object itself) from the session cache, then the process-wide one, then the disk
+# one, or MISSING
+def lookup_result(key):
+    result = session_results().get(key, MISSING)
+    count('session', result is not MISSING)
+    if result is MISSING:
+        result = GLOBAL_RESULTS.get(key, MISSING)
+        count('global', result is not MISSING)
+        if result is MISSING and DB_RESULTS:
+            data = DB_RESULTS.get(key)
+            count('disk', data is not None)
+            if data is not None:
+                result = pickle.loads(data)
+                GLOBAL_RESULTS.put(key, result, len(data))
+        if result is not MISSING:
+            session_results().put(key, result)
+    return result
+
+# Copy of the cached result of a key, or MISSING
+def cached_result(key):
+    result = lookup_result(key)
+    return result if result is MISSING else copy.deepcopy(result)
+
+# Cache the result of a key in every tier
+def store_result(key, result):
+    data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+    session_results().put(key, result)
+    GLOBAL_RESULTS.put(key, result, len(data))
+    if DB_RESULTS:
+        DB_RESULTS.put(key, data)
+
+# Results of compute(inputs_list) for a batch of selections of the same computation (a list of results, one per
+# selection), like memoized for every selection: only the selections whose result is not cached yet are computed, in a
+# single call with their list, and only once when several sessions ask for them at the same time
+def memoized_batch(name, inputs_list, compute):
+    keys = [result_key(name, inputs) for inputs in inputs_list]
+    results = {key: lookup_result(key) for key in keys}
+    missing = sorted(key for key, result in results.items() if result is MISSING)
+    if missing:
+        # The locks are taken in key order, so sessions waiting for overlapping batches never deadlock
+        with KEY_LOCKS_LOCK:
+            key_locks = [KEY_LOCKS.setdefault(key, threading.Lock()) for key in missing]
+        for key_lock in key_locks:
+            key_lock.acquire()
+        try:
+            # Other sessions may have computed some of them while this one was waiting
+            for key in missing:
+                results[key] = GLOBAL_RESULTS.get(key, MISSING)
+                if results[key] is not MISSING:
+                    session_results().put(key, results[key])
+            computed = [key for key in missing if results[key] is MISSING]
+            if computed:
+                inputs = dict(zip(keys, inputs_list))
+                with span(f"aggregate:{name}"):
+                    for key, result in zip(computed, compute([inputs[key] for key in computed])):
+                        store_result(key, result)
+                        results[key] = result
+        finally:
+            for key_lock in key_locks:
+                key_lock.release()
+            with KEY_LOCKS_LOCK:
+                for key in missing:
+                    KEY_LOCKS.pop(key, None)
+    return [copy.deepcopy(results[key]) for key in keys]
+
+# Result of compute() for the given name and selections, computed only if it is not cached yet (and only once when
+# several sessions ask for it at the same time)
+def memoized(name, inputs, compute):
+    return memoized_batch(name, [inputs], lambda inputs_list: [compute()])[0]
@@ -0,0 +1,117 @@
+import os
+import json
+import argparse
+import calendar
+import numpy as np
+import pandas as pd
+from preprocessing import CSV_COLUMNS, CSV_FILE, RELEASE_FILE, write_index
+from columnar_cache import bump_data_version, VERSION_FILE
+
+# Synthetic catalogs of the cleaned files read by the app (cleaned CSV, index JSONs and their binary posting lists), to
+# benchmark the pages at sizes the real catalog does not have. The distributions follow the real index files:
+# every genre, category, language and tag is given to each game with its frequency in the real catalog, release months
+# follow release.json. Without a real index file its keys get Zipf-like frequencies instead.
+INDEX_FILES = ['tags.json', 'genres.json', 'categories.json', 'supported_languages.json']
+
+# Number of keys and frequency of the most common key of an index without a real file
+FALLBACK_KEYS = {'tags.json': (400, 0.5), 'genres.json': (30, 0.6), 'categories.json': (40, 0.9),
+                 'supported_languages.json': (100, 0.95)}
+
+# Number of games of the real catalog, i.e. with a release date
+def real_game_count(source_dir):
+    with open(os.path.join(source_dir, RELEASE_FILE), 'r') as f:
+        release = json.load(f)
+    return sum(len(ids) for months in release.values() for ids in months.values())
+
+# {key: frequency} of the keys of an index, from its real file or Zipf-like
+def key_frequencies(file, source_dir, n_real):
+    path = os.path.join(source_dir, file)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return {key: min(1.0, len(ids) / n_real) for key, ids in json.load(f).items()}
+    n_keys, top = FALLBACK_KEYS[file]
+    name = os.path.splitext(file)[0].rstrip('s').title()
+    return {f"{name} {i + 1}": top / (i + 1) ** 0.8 for i in range(n_keys)}
+
+# {key: [AppID, ...]} index giving every game each key with its frequency
+def synthetic_index(app_ids, frequencies, rng):
+    index = {}
+    for key, frequency in frequencies.items():
+        rows = rng.choice(len(app_ids), size=rng.binomial(len(app_ids), frequency), replace=False)
+        if len(rows):
+            index[key] = app_ids[np.sort(rows)].tolist()
+    return index
+
+# Year and month of every game, drawn from the release months of the real catalog
+def synthetic_release_months(n_games, source_dir, rng):
+    with open(os.path.join(source_dir, RELEASE_FILE), 'r') as f:
+        release = json.load(f)
+    months = [(int(year), int(month), len(ids)) for year, by_month in release.items() for month, ids in by_month.items()]
+    years, month_numbers, counts = (np.array(column) for column in zip(*months))
+    picked = rng.choice(len(months), size=n_games, p=counts / counts.sum())
+    return years[picked], month_numbers[picked]
+
+# Cleaned CSV rows of the games: metrics with heavy-tailed distributions like the real ones
+def synthetic_games_frame(app_ids, years, months, rng):
+    n = len(app_ids)
+    days = rng.integers(1, 29, n)
+    month_names = np.array(calendar.month_abbr)[months]
+    release_dates = pd.Series(month_names) + ' ' + pd.Series(days).astype(str) + ', ' + pd.Series(years).astype(str)
+    positive = rng.negative_binomial(1, 0.01, n) + 1  # Games without reviews are not in the cleaned CSV
+    negative = rng.negative_binomial(1, 0.05, n)
+    df = pd.DataFrame({
+        'AppID': app_ids,
+        'Name': [f"Game {app_id}" for app_id in app_ids],
+        'Release date': release_dates,
+        'Est. owners': rng.choice([10000, 35000, 75000, 150000, 350000, 750000], n, p=[.55, .2, .1, .08, .05, .02]),
+        'Peak CCU': rng.negative_binomial(1, 0.02, n) * (rng.random(n) < 0.4),
+        'Required age': rng.choice([0, 13, 17, 18], n, p=[.95, .02, .02, .01]),
+        'Price': np.round(np.where(rng.random(n) < 0.2, 0, rng.gamma(2, 8, n)), 2),
+        'DLC count': rng.poisson(0.5, n),
+        'Windows': rng.random(n) < 0.99,
+        'Mac': rng.random(n) < 0.2,
+        'Linux': rng.random(n) < 0.15,
+        'Metacritic score': rng.integers(20, 100, n) * (rng.random(n) < 0.1),
+        'User score': np.zeros(n, dtype=int),
+        'Positive': positive,
+        'Negative': negative,
+        'Achievements': rng.poisson(10, n) * (rng.random(n) < 0.6),
+        'Recommendations': rng.negative_binomial(1, 0.01, n) * (rng.random(n) < 0.5),
+        'Average playtime': rng.negative_binomial(1, 0.005, n) * (rng.random(n) < 0.3),
+        'Median playtime': rng.negative_binomial(1, 0.01, n) * (rng.random(n) < 0.3),
+        'Reviews': positive + negative,
+    })
+    df['Review score'] = df['Positive'] / df['Reviews']
+    return df[['AppID'] + list(CSV_COLUMNS)]
+
+# Write a synthetic catalog of n_games games to out_dir, with the distributions of the real index files in source_dir
+def write_synthetic_catalog(n_games, out_dir, source_dir='.', seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    n_real = real_game_count(source_dir)
+    app_ids = 10 * np.arange(1, n_games + 1)  # Steam-like AppIDs
+
+    years, months = synthetic_release_months(n_games, source_dir, rng)
+    df = synthetic_games_frame(app_ids, years, months, rng)
+    df.to_csv(os.path.join(out_dir, CSV_FILE), index=False)
+
+    release_index = {}
+    for (year, month), rows in pd.Series(np.arange(n_games)).groupby([years, months]):
+        release_index.setdefault(str(year), {})[str(month)] = app_ids[rows.to_numpy()].tolist()
+    write_index(release_index, os.path.join(out_dir, RELEASE_FILE))
+    for file in INDEX_FILES:
+        write_index(synthetic_index(app_ids, key_frequencies(file, source_dir, n_real), rng), os.path.join(out_dir, file))
+    bump_data_version(os.path.join(out_dir, VERSION_FILE))
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic catalog of the cleaned files")
+    parser.add_argument('games', type=int, help="number of games")
+    parser.add_argument('out_dir', help="directory to write the catalog to")
+    parser.add_argument('--source-dir', default='.', help="directory of the real index files (default: .)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_synthetic_catalog(args.games, args.out_dir, args.source_dir, args.seed)
+    print(f"Wrote {args.games} games to {args.out_dir}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+import os
+import sys
+import pytest
+
+# The modules of the app live at the root of the repository
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import streamlit as st
+from streamlit.logger import set_log_level
+
+CATALOG_GAMES = 5000
+
+# Caches used outside of a streamlit server warn on every call
+set_log_level('error')
+
+# Synthetic catalog of the cleaned files (see synthetic_catalog.py) with the key frequencies of the index files of the
+# repository, as the working directory the app modules read their files from
+@pytest.fixture(scope='session')
+def catalog(tmp_path_factory):
+    from synthetic_catalog import write_synthetic_catalog
+    path = tmp_path_factory.mktemp('catalog')
+    write_synthetic_catalog(CATALOG_GAMES, str(path), REPO_DIR)
+    cwd = os.getcwd()
+    os.chdir(path)
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    yield path
+    os.chdir(cwd)
+
+# Typed games of the synthetic catalog, as loaded by the app
+@pytest.fixture(scope='session')
+def games(catalog):
+    from data_loader import load_csv_data
+    return load_csv_data()
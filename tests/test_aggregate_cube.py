@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+from aggregate_cube import AggregateCube, PartialAggregates, scan_partials, summarize, CUBE_METRICS
+from derived_columns import with_derived_columns
+
+@pytest.fixture(scope='module')
+def cube(games):
+    return AggregateCube(games)
+
+# Mean of every metric and number of games of every group, like summarize
+def grouped_means(df, by, metrics):
+    grouped = df.groupby(by, observed=False)
+    expected = grouped[metrics].mean()
+    expected['Games released'] = grouped.size()
+    return expected
+
+def assert_summary_equal(summary, expected):
+    pd.testing.assert_frame_equal(summary, expected, check_dtype=False, check_index_type=False, check_names=False,
+                                  rtol=1e-9)
+
+def test_price_bin_cells_match_groupby(games, cube):
+    df = with_derived_columns(games, 'Price Bin')
+    summary = summarize(cube.cells(['Price Bin']), 'Price Bin', CUBE_METRICS)
+    assert_summary_equal(summary, grouped_means(df, 'Price Bin', CUBE_METRICS))
+
+def test_standard_deviations_match_groupby(games, cube):
+    df = with_derived_columns(games, 'OS_code')
+    summary = summarize(cube.cells(['OS_code']), 'OS_code', CUBE_METRICS, stat='std')
+    expected = df.groupby('OS_code')[CUBE_METRICS].std()
+    pd.testing.assert_frame_equal(summary[CUBE_METRICS], expected, check_dtype=False, check_names=False, rtol=1e-6)
+
+# Only the games with a positive value of the metric are counted (zeros are left out of some averages)
+@pytest.mark.parametrize('metric', ['Average playtime', 'Peak CCU'])
+def test_positive_cells_match_groupby(games, cube, metric):
+    df = with_derived_columns(games, 'Price Bin')
+    summary = summarize(cube.cells(['Price Bin']), 'Price Bin', [metric], positive=True)
+    assert_summary_equal(summary, grouped_means(df[df[metric] > 0], 'Price Bin', [metric]))
+
+# Cells restricted to a range of a dimension and rolled up to another one of the same cuboid
+def test_rolled_up_cells_match_groupby(games, cube):
+    summary = summarize(cube.cells(['Release Quarter'], where={'Release Year': (2015, 2020)}), 'Release Quarter',
+                        CUBE_METRICS)
+    df = games[games['Release Year'].between(2015, 2020).fillna(False)]
+    expected = grouped_means(df, 'Release Quarter', CUBE_METRICS)
+    assert_summary_equal(summary, expected)
+    assert summary['Games released'].sum() == len(df)
+
+def test_language_count_bins_cells_match_groupby(games, cube):
+    summary = summarize(cube.cells(['language_count_bins']), 'language_count_bins', CUBE_METRICS)
+    assert_summary_equal(summary, grouped_means(games, 'language_count_bins', CUBE_METRICS))
+
+# Partial aggregates of several masks scanned at once give the groupbys of every mask
+def test_scan_partials_match_groupby(games):
+    rng = np.random.default_rng(0)
+    masks = rng.random((3, len(games))) < np.array([[0.1], [0.5], [1.0]])
+    codes = games['Release Month'].to_numpy(dtype='int64', na_value=0) - 1
+    partials = scan_partials(masks, codes, 12, games[CUBE_METRICS].to_numpy(dtype=float), CUBE_METRICS)
+    for series, mask in enumerate(masks):
+        df = games[mask]
+        summary = partials.summary(series, range(1, 13), 'Release Month').set_index('Release Month')
+        expected = df.groupby('Release Month')
+        expected_means = expected[CUBE_METRICS].mean()
+        expected_means['Games released'] = expected.size()
+        assert_summary_equal(summary, expected_means)
+        std = pd.DataFrame(partials.std()[series], index=range(1, 13), columns=CUBE_METRICS)
+        pd.testing.assert_frame_equal(std.loc[summary.index], expected[CUBE_METRICS].std(), check_dtype=False,
+                                      check_index_type=False, check_names=False, rtol=1e-6)
+
+# Partial aggregates of disjoint games merge into the partial aggregates of all of them
+def test_partials_merge_of_disjoint_games(games):
+    codes = with_derived_columns(games, 'OS_code')['OS_code'].to_numpy(dtype='int64')
+    values = games[CUBE_METRICS].to_numpy(dtype=float)
+    first_half = np.arange(len(games)) < len(games) // 2
+    whole = scan_partials([np.ones(len(games), dtype=bool)], codes, 8, values, CUBE_METRICS)
+    merged = scan_partials([first_half], codes, 8, values, CUBE_METRICS).merge(
+        scan_partials([~first_half], codes, 8, values, CUBE_METRICS))
+    for field in ['n', 'count', 'total', 'sumsq']:
+        np.testing.assert_allclose(getattr(merged, field), getattr(whole, field), rtol=1e-12)
+    concatenated = PartialAggregates.concat([whole, merged])
+    assert concatenated.n.shape == (2, 8)
+
+# The partial aggregates of the cube cells are those of a scan of all games
+def test_cube_partials_match_scan(games, cube):
+    partials = cube.partials(['Release Month'], lambda cells: cells['Release Month'].to_numpy(dtype='int64') - 1, 12,
+                             CUBE_METRICS)
+    codes = games['Release Month'].to_numpy(dtype='int64', na_value=0) - 1
+    scanned = scan_partials([np.ones(len(games), dtype=bool)], codes, 12, games[CUBE_METRICS].to_numpy(dtype=float),
+                            CUBE_METRICS)
+    for field in ['n', 'count', 'total', 'sumsq']:
+        np.testing.assert_allclose(getattr(partials, field), getattr(scanned, field), rtol=1e-9)
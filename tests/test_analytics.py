@@ -0,0 +1,67 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+import analytics
+from aggregate_cube import cube_for
+from data_loader import default_filter_ranges
+
+# The default sidebar filter, answered from its cube, and a filter of the same games that does not normalize to it, so
+# is answered by scanning the games
+@pytest.fixture(scope='module')
+def filters(catalog):
+    cube_filters = [list(filter_range) for filter_range in default_filter_ranges()]
+    column, low, high = cube_filters[0]
+    scan_filters = [[column, low, high + 1]]
+    assert cube_for(analytics.filter_key(cube_filters)) is not None
+    assert cube_for(analytics.filter_key(scan_filters)) is None
+    assert analytics.filtered_games(cube_filters).equals(analytics.filtered_games(scan_filters))
+    return cube_filters, scan_filters
+
+def assert_frames_equal(left, right):
+    pd.testing.assert_frame_equal(left, right, check_dtype=False, check_index_type=False, check_categorical=False,
+                                  rtol=1e-9)
+
+@pytest.mark.parametrize('metric', analytics.PRICE_METRICS)
+def test_price_bin_metrics_of_cube_match_scan(filters, metric):
+    cube_filters, scan_filters = filters
+    assert_frames_equal(analytics.price_bin_metrics(cube_filters, metric),
+                        analytics.price_bin_metrics(scan_filters, metric))
+
+@pytest.mark.parametrize('column', analytics.OS_COLUMNS)
+def test_os_breakdown_of_cube_matches_scan(filters, column):
+    cube_filters, scan_filters = filters
+    assert_frames_equal(analytics.os_breakdown(cube_filters, column), analytics.os_breakdown(scan_filters, column))
+
+@pytest.mark.parametrize('group_by', list(analytics.RELEASE_GROUPINGS))
+def test_release_period_metrics_of_cube_match_scan(filters, group_by):
+    cube_filters, scan_filters = filters
+    [cube_summary] = analytics.release_period_metrics(cube_filters, [None], group_by=group_by)
+    [scan_summary] = analytics.release_period_metrics(scan_filters, [None], group_by=group_by)
+    assert_frames_equal(cube_summary, scan_summary)
+
+def test_trend_series_of_cube_match_scan(filters):
+    cube_filters, scan_filters = filters
+    assert_frames_equal(analytics.trend_series(cube_filters, [None])[0], analytics.trend_series(scan_filters, [None])[0])
+
+def test_language_count_bin_stats_of_cube_match_scan(filters):
+    cube_filters, scan_filters = filters
+    assert_frames_equal(analytics.language_count_bin_stats(cube_filters),
+                        analytics.language_count_bin_stats(scan_filters))
+
+# Games of the filter whose AppIDs are in all the given index keys
+def games_of_keys(filters, file, keys):
+    with open(file, 'r') as f:
+        index = json.load(f)
+    df = analytics.filtered_games(filters)
+    return df[np.logical_and.reduce([df['AppID'].isin(list(map(int, index[key]))) for key in keys])]
+
+def test_language_combination_metrics_match_pandas(filters):
+    cube_filters, _ = filters
+    combinations = [['English'], ['English', 'French'], ['English', 'French', 'German', 'Japanese']]
+    for languages, metrics in zip(combinations, analytics.language_combination_metrics(cube_filters, combinations)):
+        df = games_of_keys(cube_filters, 'supported_languages.json', languages)
+        assert metrics['Games released'] == len(df)
+        expected = df[analytics.LANGUAGE_METRICS[1:]].mean()
+        np.testing.assert_allclose([metrics[metric] for metric in expected.index], expected.to_numpy(dtype=float),
+                                   rtol=1e-9)
@@ -0,0 +1,66 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from columnar_cache import (prepare_games_frame, write_columnar_cache, read_columnar_cache, load_games_frame,
+                            downcast_integers, bin_language_count, data_version, bump_data_version,
+                            LANGUAGE_COUNT_BINS)
+
+# Typed frame of the cleaned CSV of the synthetic catalog
+def test_columnar_cache_round_trip(catalog, tmp_path):
+    df = prepare_games_frame()
+    assert df['AppID'].dtype == 'int32'
+    assert df['Release date'].dtype == 'datetime64[ns]'
+    assert df['Release Year'].dtype == 'Int16' and df['Release Month'].dtype == 'Int8'
+    cache_file = str(tmp_path / 'games.feather')
+    write_columnar_cache(df, cache_file)
+    pd.testing.assert_frame_equal(read_columnar_cache(cache_file), df)
+
+# The cache is rebuilt when the CSV is newer
+def test_columnar_cache_rebuilds_stale_cache(catalog, tmp_path):
+    cache_file = str(tmp_path / 'games.feather')
+    write_columnar_cache(prepare_games_frame().head(10), cache_file)
+    assert len(load_games_frame(cache_file=cache_file)) == 10
+    mtime = os.path.getmtime(cache_file) + 10
+    os.utime('cleaned_games.csv', (mtime, mtime))
+    assert len(load_games_frame(cache_file=cache_file)) == len(pd.read_csv('cleaned_games.csv'))
+
+def test_downcast_integers_keeps_values():
+    df = pd.DataFrame({'AppID': np.array([1, 2], dtype='int32'), 'small': [0, 100], 'medium': [-1, 40000],
+                       'large': [0, 3 * 10 ** 9], 'flag': [True, False], 'price': [0.5, 1.0]})
+    typed = downcast_integers(df.copy())
+    assert typed.dtypes.astype(str).tolist() == ['int32', 'int8', 'int32', 'int64', 'bool', 'float64']
+    pd.testing.assert_frame_equal(typed, df, check_dtype=False)
+
+# The precomputed language count is the number of languages listing every game
+def test_language_count_matches_languages_file(games):
+    with open('supported_languages.json', 'r') as f:
+        postings = json.load(f)
+    counts = pd.Series([int(app_id) for ids in postings.values() for app_id in ids]).value_counts()
+    expected = counts.reindex(games['AppID'], fill_value=0).to_numpy()
+    np.testing.assert_array_equal(games['language_count'].to_numpy(), expected)
+
+# Same bins as the per-game binning of the Language Support page they replace
+def test_language_count_bins_match_per_game_binning():
+    counts = np.arange(0, 41)
+    expected = ['One' if count == 1 else '2-4' if count <= 4 else '5-9' if count <= 9 else '10+' for count in counts]
+    bins = bin_language_count(counts)
+    assert list(bins) == expected
+    assert list(bins.categories) == LANGUAGE_COUNT_BINS and bins.ordered
+
+# A failed write leaves the previous cache and no temporary file behind
+def test_failed_cache_write_keeps_previous_cache(catalog, tmp_path):
+    cache_file = str(tmp_path / 'games.feather')
+    df = prepare_games_frame().head(10)
+    write_columnar_cache(df, cache_file)
+    with pytest.raises(Exception):
+        write_columnar_cache(df.assign(bad=[object()] * 10), cache_file)
+    assert os.listdir(tmp_path) == ['games.feather']
+    pd.testing.assert_frame_equal(read_columnar_cache(cache_file), df)
+
+def test_bump_data_version(tmp_path):
+    version_file = str(tmp_path / 'data_version.json')
+    assert data_version(version_file) == 0
+    assert [bump_data_version(version_file) for _ in range(3)] == [1, 2, 3]
+    assert data_version(version_file) == 3 and os.listdir(tmp_path) == ['data_version.json']
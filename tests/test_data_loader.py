@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+from data_loader import build_filter_mask, load_filtered_games, load_column_stats, normalize_filter_ranges
+
+# One combined mask gives the games of the chained per-predicate filters, missing values never pass
+def test_filter_mask_matches_chained_filters(games):
+    ranges = (('Positive', 10.0, 500.0), ('Price', 0.0, 20.0), ('Release Year', 2015.0, 2020.0))
+    expected = games
+    for column, min_value, max_value in ranges:
+        expected = expected[expected[column].notna() & (expected[column] >= min_value) & (expected[column] <= max_value)]
+    np.testing.assert_array_equal(games.index[build_filter_mask(ranges)], expected.index)
+    pd.testing.assert_frame_equal(load_filtered_games(ranges), expected)
+    assert load_filtered_games(()) is games
+
+def test_column_stats_match_frame(games):
+    stats = load_column_stats()
+    assert list(stats) == list(games.columns)
+    for column in ['Price', 'Reviews', 'Release Year', 'Windows', 'Name']:
+        values = games[column]
+        assert stats[column]['nulls'] == values.isna().sum()
+        assert stats[column]['cardinality'] == values.nunique()
+    assert stats['Price']['numeric'] and stats['Release Year']['numeric']
+    assert not stats['Windows']['numeric'] and not stats['Name']['numeric']
+    assert (stats['Price']['min'], stats['Price']['max']) == (games['Price'].min(), games['Price'].max())
+    assert stats['Reviews']['quantiles'][0.5] == games['Reviews'].median()
+
+# Full-range filters of columns without nulls keep every game and are dropped, the others become sorted float ranges
+def test_normalize_filter_ranges():
+    stats = {'Price': {'nulls': 0, 'min': 0.0, 'max': 100.0}, 'Release Year': {'nulls': 3, 'min': 1997.0, 'max': 2025.0}}
+    assert normalize_filter_ranges([('Price', 0, 100), ('Release Year', 1997, 2025)], stats) == [
+        ['Release Year', 1997.0, 2025.0]]
+    assert normalize_filter_ranges([('Release Year', 2000, 2010), ('Price', 1, 100)], stats) == [
+        ['Price', 1.0, 100.0], ['Release Year', 2000.0, 2010.0]]
@@ -0,0 +1,39 @@
+import pytest
+import analytics
+import data_loader
+from data_loader import check_data_version, load_data_for_page, load_column_stats
+
+# Derived cache recording its clears
+class RecordingCache:
+    def __init__(self):
+        self.clears = 0
+
+    def clear(self):
+        self.clears += 1
+
+@pytest.fixture
+def recording_cache(catalog, monkeypatch):
+    cache = RecordingCache()
+    monkeypatch.setattr(data_loader, 'DERIVED_CACHES', data_loader.DERIVED_CACHES + [cache])
+    check_data_version()  # Version of the catalog, possibly after the version set by a previous test
+    cache.clears = 0
+    return cache
+
+def bump(monkeypatch):
+    version = data_loader.data_version() + 1
+    monkeypatch.setattr(data_loader, 'data_version', lambda: version)
+
+# Reruns that only hit cached functions still drop the derived caches of a previous data version
+def test_page_rerun_picks_up_new_data_version(recording_cache, monkeypatch):
+    load_data_for_page()
+    assert recording_cache.clears == 0
+    bump(monkeypatch)
+    load_data_for_page()
+    load_data_for_page()
+    assert recording_cache.clears == 1
+
+def test_analytics_call_picks_up_new_data_version(recording_cache, monkeypatch):
+    analytics.price_bin_metrics([], 'Reviews')
+    bump(monkeypatch)
+    analytics.price_bin_metrics([], 'Reviews')
+    assert recording_cache.clears == 1
@@ -0,0 +1,14 @@
+import itertools
+import pandas as pd
+from derived_columns import with_derived_columns, OS_COMBINATION_ORDER
+
+# Same OS combinations and counts as the per-row derivation of the OS Support page they replace
+def test_os_columns_match_per_row_derivation(games):
+    df = with_derived_columns(games, 'OS_combination', 'OS_count')
+    supported = games[['Windows', 'Mac', 'Linux']].to_numpy()
+    combinations = ['+'.join(os[0] for os, flag in zip(['Windows', 'Mac', 'Linux'], row) if flag) for row in supported]
+    expected = pd.Categorical(combinations, categories=OS_COMBINATION_ORDER, ordered=True)
+    pd.testing.assert_extension_array_equal(df['OS_combination'].array, expected)
+    assert df['OS_count'].tolist() == [str(sum(row)) for row in supported]
+    # Every OS code of the catalog is covered
+    assert {tuple(row) for row in supported} == set(itertools.product([False, True], repeat=3))
@@ -0,0 +1,27 @@
+import pandas as pd
+import plotly.graph_objects as go
+import figures
+from figures import figure_key, cached_figure
+
+def test_figure_keys_depend_on_name_data_and_style():
+    data = pd.DataFrame({'x': ['a', 'b'], 'y': [1.0, 2.0]})
+    key = figure_key('bar', data, {'title': 'T'})
+    assert key == figure_key('bar', data.copy(), {'title': 'T'})
+    assert key != figure_key('line', data, {'title': 'T'})
+    assert key != figure_key('bar', data.assign(y=[1.0, 2.5]), {'title': 'T'})
+    assert key != figure_key('bar', data, {'title': 'U'})
+
+# A figure is built once per key, and figures of other keys are never returned for it
+def test_cached_figure_builds_once_per_key():
+    figures.FIGURES.clear()
+    builds = []
+    def build(y):
+        builds.append(y)
+        return go.Figure(go.Bar(x=['a'], y=[y]), layout={'template': 'plotly'})
+    first = cached_figure('bar', [1], {}, lambda: build(1))
+    assert cached_figure('bar', [1], {}, lambda: build(1)) is first
+    second = cached_figure('bar', [2], {}, lambda: build(2))
+    assert second is not first and list(second.data[0].y) == [2]
+    assert builds == [1, 2]
+    # Only the bar trace defaults of the template are kept
+    assert set(first.layout.template.data.to_plotly_json()) == {'bar'}
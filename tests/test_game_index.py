@@ -0,0 +1,49 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from game_index import GameIndex, IncidenceMatrix, load_game_index, load_incidence_matrix
+
+def test_game_index_masks_match_sets():
+    index = GameIndex({'a': [10, 20, 30], 'b': [20, 30, 99], 'c': []}, [30, 10, 20, 40])
+    assert index.keys == ['a', 'b', 'c']
+    assert index.mask(['a']).tolist() == [True, True, True, False]
+    assert index.mask(['a', 'b']).tolist() == [True, False, True, False]  # AppID 99 is not in the CSV
+    assert index.mask(['b', 'c'], how='any').tolist() == [True, False, True, False]
+    assert index.mask([]).tolist() == [True] * 4
+
+# Masks of the index files of the synthetic catalog, aligned with a filtered frame
+@pytest.mark.parametrize('file', ['genres.json', 'categories.json'])
+def test_frame_mask_matches_app_ids_of_keys(games, file):
+    with open(file, 'r') as f:
+        postings = json.load(f)
+    keys = sorted(postings, key=lambda key: -len(postings[key]))[:2]
+    df = games[games['Reviews'] >= 20]
+    expected = np.logical_and.reduce([df['AppID'].isin(list(map(int, postings[key]))) for key in keys])
+    np.testing.assert_array_equal(load_game_index(file).frame_mask(df, keys), expected)
+
+def test_incidence_matrix_key_stats_match_exploded_groupby():
+    app_ids = [30, 10, 20, 40]
+    df = pd.DataFrame({'AppID': app_ids, 'Reviews': [3.0, 1.0, np.nan, 4.0]})
+    postings = {'English': [10, 20, 30, 40], 'French': [20, 30, 99], 'German': []}
+    matrix = IncidenceMatrix(postings, app_ids)
+    assert matrix.keys == ['English', 'French']  # Keys without games are dropped
+    subset = df.iloc[[0, 2, 3]]  # A filtered frame keeps the row positions of the full frame as index
+    stats = matrix.key_stats(subset, ['Reviews'])
+
+    exploded = pd.DataFrame([(key, int(app_id)) for key, ids in postings.items() for app_id in ids],
+                            columns=['key', 'AppID']).merge(subset, on='AppID')
+    grouped = exploded.groupby('key')
+    assert stats['Games released'].tolist() == grouped.size().reindex(matrix.keys).tolist() == [3, 2]
+    np.testing.assert_allclose(stats['Reviews'], grouped['Reviews'].mean().reindex(matrix.keys))
+
+# Every (game, language) pair of the games of the CSV is counted once
+def test_incidence_matrix_totals_of_catalog(games):
+    with open('supported_languages.json', 'r') as f:
+        postings = json.load(f)
+    app_ids = set(games['AppID'].tolist())
+    pairs = sum(int(app_id) in app_ids for ids in postings.values() for app_id in ids)
+    matrix = load_incidence_matrix('supported_languages.json')
+    assert matrix.indptr[-1] == pairs
+    assert matrix.key_stats(games, [])['Games released'].sum() == pairs
+    np.testing.assert_array_equal(np.diff(matrix.indptr), games['language_count'])
@@ -0,0 +1,97 @@
+import os
+import json
+import threading
+import numpy as np
+import pytest
+import posting_lists
+from posting_lists import (PostingLists, RowLookup, write_postings, build_postings, flat_postings, load_postings,
+                           postings_path)
+
+def test_posting_lists_round_trip(tmp_path):
+    path = str(tmp_path / 'index.postings')
+    write_postings({'b': ['30', '10', '20', '10'], 'a': [5], 'empty': [], 'Français': [2 ** 32 - 1, 0]}, path)
+    lists = PostingLists(path)
+    assert lists.keys() == ['b', 'a', 'empty', 'Français']
+    assert len(lists) == 4 and 'a' in lists and 'c' not in lists
+    assert lists['b'].tolist() == [10, 20, 30]  # Sorted without duplicates
+    assert lists['a'].tolist() == [5]
+    assert lists['empty'].tolist() == []
+    assert lists['Français'].tolist() == [0, 2 ** 32 - 1]
+    assert [key for key, ids in lists.items()] == lists.keys()
+
+def test_write_postings_rejects_app_ids_beyond_uint32(tmp_path):
+    path = str(tmp_path / 'index.postings')
+    with pytest.raises(ValueError):
+        write_postings({'a': [2 ** 32]}, path)
+    assert not os.path.exists(path)
+
+def test_flat_postings_of_release_index():
+    assert flat_postings({'2020': {'1': ['1'], '12': ['2', '3']}, 'Action': ['4']}) == {
+        '2020-1': ['1'], '2020-12': ['2', '3'], 'Action': ['4']}
+
+def test_row_lookup_skips_missing_app_ids():
+    lookup = RowLookup([40, 10, 30, 20])
+    assert sorted(lookup.rows([10, 30, 25, 50]).tolist()) == [1, 2]
+    assert lookup.mask([20, 40, 5]).tolist() == [True, False, False, True]
+
+# Posting lists are rebuilt when their JSON file changes
+def test_load_postings_rebuilds_stale_lists(tmp_path):
+    json_file = str(tmp_path / 'genres.json')
+    with open(json_file, 'w') as f:
+        json.dump({'Action': ['1', '2']}, f)
+    assert load_postings(json_file).keys() == ['Action']
+    with open(json_file, 'w') as f:
+        json.dump({'Indie': ['3']}, f)
+    mtime = os.path.getmtime(postings_path(json_file)) + 10
+    os.utime(json_file, (mtime, mtime))
+    assert load_postings(json_file)['Indie'].tolist() == [3]
+
+# The posting lists of every index file of the synthetic catalog hold the AppIDs of its JSON
+@pytest.mark.parametrize('file', ['release.json', 'genres.json', 'categories.json', 'supported_languages.json'])
+def test_catalog_postings_match_json(catalog, file):
+    with open(file, 'r') as f:
+        flat = flat_postings(json.load(f))
+    lists = load_postings(file)
+    assert lists.keys() == list(flat)
+    for key, ids in flat.items():
+        np.testing.assert_array_equal(lists[key], np.unique(np.array(ids, dtype=np.int64)))
+
+# Threads loading stale posting lists at the same time build them once, and readers only see complete files
+def test_concurrent_loads_build_postings_once(tmp_path, monkeypatch):
+    json_file = str(tmp_path / 'tags.json')
+    with open(json_file, 'w') as f:
+        json.dump({str(key): list(range(key, 100000, 7)) for key in range(50)}, f)
+    builds = []
+    monkeypatch.setattr(posting_lists, 'build_postings', lambda file: builds.append(file) or build_postings(file))
+    results, errors = [], []
+    def load():
+        try:
+            results.append(len(load_postings(json_file)['3']))
+        except Exception as error:
+            errors.append(error)
+    threads = [threading.Thread(target=load) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors and builds == [json_file]
+    assert results == [len(range(3, 100000, 7))] * 8
+
+# Concurrent writers of the same posting lists never share a temporary file
+def test_concurrent_writes_of_postings(tmp_path):
+    path = str(tmp_path / 'index.postings')
+    errors = []
+    def write(key):
+        try:
+            for _ in range(20):
+                write_postings({key: list(range(1000))}, path)
+        except Exception as error:
+            errors.append(error)
+    threads = [threading.Thread(target=write, args=(str(key),)) for key in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert PostingLists(path).keys()[0] in {'0', '1', '2', '3'}
+    assert os.listdir(tmp_path) == ['index.postings']
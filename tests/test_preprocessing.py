@@ -0,0 +1,126 @@
+import json
+import pandas as pd
+import preprocessing
+from columnar_cache import read_columnar_cache, load_games_frame
+from posting_lists import load_postings
+
+# Raw game of the Steam games.json with the given fields replaced
+def raw_game(name, **fields):
+    game = {'name': name, 'release_date': 'Nov 12, 2020', 'required_age': 0, 'price': 9.99, 'dlc_count': 1,
+            'windows': True, 'mac': False, 'linux': True, 'metacritic_score': 0, 'user_score': 0, 'positive': 10,
+            'negative': 2, 'achievements': 3, 'recommendations': 0, 'average_playtime_forever': 5,
+            'median_playtime_forever': 5, 'peak_ccu': 3, 'estimated_owners': '0 - 20000',
+            'supported_languages': ['English', 'French'], 'full_audio_languages': [], 'developers': ['Dev'],
+            'publishers': ['Pub'], 'categories': ['Single-player'], 'genres': ['Indie'], 'tags': {'Indie': 10}}
+    game.update(fields)
+    return game
+
+def write_games(games, path):
+    with open(path, 'w', encoding='utf8') as f:
+        json.dump(games, f, indent=1)
+    return str(path)
+
+# Outputs of a run as comparable values: the columnar table sorted by AppID and every index with sorted AppIDs
+def outputs(out_dir):
+    df = read_columnar_cache(str(out_dir / preprocessing.CACHE_FILE)).sort_values('AppID', ignore_index=True)
+    indexes = {}
+    for file in [preprocessing.RELEASE_FILE] + [f"{column}.json" for column in preprocessing.INDEX_COLUMNS]:
+        with open(out_dir / file, 'r', encoding='utf8') as f:
+            indexes[file] = json.load(f, object_hook=lambda index: {key: sorted(ids) if isinstance(ids, list) else ids
+                                                                    for key, ids in index.items()})
+    return df, indexes
+
+# Data the app loads from a run, with the applied deltas merged in: the typed table sorted by AppID and the AppIDs of
+# every key of every index
+def loaded(out_dir):
+    df = load_games_frame(str(out_dir / preprocessing.CSV_FILE), str(out_dir / preprocessing.CACHE_FILE),
+                          str(out_dir / 'supported_languages.json')).sort_values('AppID', ignore_index=True)
+    postings = {file: {key: list(ids) for key, ids in load_postings(str(out_dir / file)).items()}
+                for file in [preprocessing.RELEASE_FILE] + [f"{column}.json" for column in preprocessing.INDEX_COLUMNS]}
+    return df, postings
+
+def run(games, out_dir):
+    out_dir.mkdir()
+    preprocessing.run_pipeline(write_games(games, out_dir / 'games.json'), str(out_dir))
+
+OLD_GAMES = {str(app_id): raw_game(f"Game {app_id}", release_date=f"Mar {app_id}, 2019", tags={f"Tag{app_id % 3}": 1})
+             for app_id in range(10, 20)}
+
+# Applying a delta only appends to the overlay of the outputs, the app loads the data of a full run over the updated
+# games, also when new values do not fit the integer types of the previous table (they were downcast to the values of
+# the old games). Compacting the overlay gives the outputs of the full run.
+def test_apply_delta_matches_full_run(tmp_path):
+    delta = {
+        '11': None,
+        '12': raw_game("Game 12", peak_ccu=40000, dlc_count=300, positive=10**6, genres=['Action']),
+        '13': raw_game("Game 13", release_date='', tags={'New tag': 1}),
+        '99': raw_game("Game 99", achievements=70000, supported_languages=['German']),
+    }
+    run(OLD_GAMES, tmp_path / 'old')
+    assert read_columnar_cache(str(tmp_path / 'old' / preprocessing.CACHE_FILE))['Peak CCU'].dtype == 'int8'
+    base = {path.name: path.read_bytes() for path in (tmp_path / 'old').iterdir() if path.name != 'data_version.json'}
+    preprocessing.apply_delta(write_games(delta, tmp_path / 'delta.json'), str(tmp_path / 'old'))
+    assert {path.name: path.read_bytes() for path in (tmp_path / 'old').iterdir() if path.name in base} == base
+
+    updated = {app_id: game for app_id, game in dict(OLD_GAMES, **delta).items() if game is not None}
+    run(updated, tmp_path / 'full')
+    df, postings = loaded(tmp_path / 'old')
+    full_df, full_postings = loaded(tmp_path / 'full')
+    pd.testing.assert_frame_equal(df, full_df)
+    assert postings == full_postings
+    assert df.loc[df['AppID'] == 12, 'Peak CCU'].item() == 40000
+
+    assert preprocessing.compact_delta(str(tmp_path / 'old'))[0] == len(delta)
+    assert not (tmp_path / 'old' / preprocessing.DELTA_FILE).exists()
+    df, indexes = outputs(tmp_path / 'old')
+    full_df, full_indexes = outputs(tmp_path / 'full')
+    pd.testing.assert_frame_equal(df, full_df)
+    assert indexes == full_indexes
+
+# Deltas applied one after the other are merged in order, the last one wins
+def test_later_deltas_win(tmp_path):
+    run(OLD_GAMES, tmp_path / 'old')
+    preprocessing.apply_delta(write_games({'12': None, '99': raw_game("Game 99", price=1.0)}, tmp_path / 'first.json'),
+                              str(tmp_path / 'old'))
+    preprocessing.apply_delta(write_games({'12': raw_game("Game 12", genres=['Action']), '99': None},
+                                          tmp_path / 'second.json'), str(tmp_path / 'old'))
+    updated = dict(OLD_GAMES, **{'12': raw_game("Game 12", genres=['Action'])})
+    run(updated, tmp_path / 'full')
+    df, postings = loaded(tmp_path / 'old')
+    full_df, full_postings = loaded(tmp_path / 'full')
+    pd.testing.assert_frame_equal(df, full_df)
+    assert postings == full_postings
+
+# A run split into several segments resumes from the saved segments and gives the outputs of a single segment run
+def test_run_pipeline_resumes_from_finished_segments(tmp_path, monkeypatch):
+    run(OLD_GAMES, tmp_path / 'single')
+    segments = preprocessing.source_segments
+    monkeypatch.setattr(preprocessing, 'source_segments', lambda path: segments(path, segment_size=1000))
+    out_dir = tmp_path / 'resumed'
+    out_dir.mkdir()
+    source = write_games(OLD_GAMES, out_dir / 'games.json')
+
+    # Interrupt the run after its first segments
+    process_segment, calls = preprocessing.process_segment, []
+    def interrupted(*args):
+        calls.append(args)
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        return process_segment(*args)
+    monkeypatch.setattr(preprocessing, 'process_segment', interrupted)
+    try:
+        preprocessing.run_pipeline(source, str(out_dir))
+    except KeyboardInterrupt:
+        pass
+    n_segments = len(segments(source, segment_size=1000))
+    assert n_segments > 3
+
+    calls.clear()
+    monkeypatch.setattr(preprocessing, 'process_segment', lambda *args: calls.append(args) or process_segment(*args))
+    assert preprocessing.run_pipeline(source, str(out_dir)) == (len(OLD_GAMES), len(OLD_GAMES))
+    assert len(calls) == n_segments - 2
+    assert not (out_dir / preprocessing.PROGRESS_DIR).exists()
+    df, indexes = outputs(out_dir)
+    single_df, single_indexes = outputs(tmp_path / 'single')
+    pd.testing.assert_frame_equal(df, single_df)
+    assert indexes == single_indexes
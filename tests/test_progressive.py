@@ -0,0 +1,19 @@
+import types
+import threading
+import concurrent.futures
+import progressive
+from streamlit.runtime.scriptrunner_utils.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME
+
+# Context of the thread running a task
+def thread_ctx():
+    return getattr(threading.current_thread(), SCRIPT_RUN_CONTEXT_ATTR_NAME, None)
+
+# A pooled thread runs a task with the context of the rerun that submitted it, and keeps no context afterwards
+def test_submit_clears_the_context_of_pooled_threads(monkeypatch):
+    monkeypatch.setattr(progressive, 'RENDER_POOL', concurrent.futures.ThreadPoolExecutor(max_workers=1))
+    ctx = types.SimpleNamespace(pages_manager=types.SimpleNamespace(main_script_hash='page'))
+    monkeypatch.setattr(progressive, 'get_script_run_ctx', lambda: ctx)
+    assert progressive.submit(thread_ctx).result() is ctx
+    assert progressive.RENDER_POOL.submit(thread_ctx).result() is None
+    monkeypatch.setattr(progressive, 'get_script_run_ctx', lambda: None)
+    assert progressive.submit(thread_ctx).result() is None
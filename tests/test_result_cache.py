@@ -0,0 +1,70 @@
+import threading
+import pytest
+import streamlit as st
+import result_cache
+from result_cache import LRUCache, memoized, memoized_batch
+
+def test_lru_cache_evicts_least_recently_used_entries():
+    cache = LRUCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1  # 'a' is now more recently used than 'b'
+    cache.put('c', 3)
+    assert list(cache.entries) == ['a', 'c']
+    assert cache.get('b', 'missing') == 'missing'
+
+def test_lru_cache_bounds_total_size():
+    cache = LRUCache(max_bytes=10)
+    cache.put('a', 1, size=4)
+    cache.put('b', 2, size=4)
+    cache.put('a', 3, size=2)  # Replacing a value replaces its size
+    assert cache.size == 6
+    cache.put('c', 4, size=5)
+    assert list(cache.entries) == ['a', 'c'] and cache.size == 7
+    cache.put('d', 5, size=20)  # An entry larger than max_bytes is still kept alone
+    assert list(cache.entries) == ['d'] and cache.size == 20
+    cache.clear()
+    assert not cache.entries and cache.size == 0
+
+@pytest.fixture
+def empty_caches(catalog):
+    st.session_state.pop('result_cache', None)
+    result_cache.GLOBAL_RESULTS.clear()
+
+# Only the selections without a cached result are computed, in one call
+def test_memoized_batch_computes_missing_results(empty_caches):
+    calls = []
+    def compute(inputs_list):
+        calls.append(list(inputs_list))
+        return [{'value': inputs * 2} for inputs in inputs_list]
+    assert memoized_batch('double', [1, 2], compute) == [{'value': 2}, {'value': 4}]
+    assert memoized_batch('double', [2, 3, 1], compute) == [{'value': 4}, {'value': 6}, {'value': 2}]
+    assert calls == [[1, 2], [3]]
+    assert memoized('double', 3, lambda: pytest.fail('cached result computed again')) == {'value': 6}
+
+# Callers get copies of the cached results, so changing them does not change the cache
+def test_memoized_results_are_copies(empty_caches):
+    result = memoized('list', 1, lambda: {'values': [1, 2]})
+    result['values'].append(3)
+    assert memoized('list', 1, lambda: None) == {'values': [1, 2]}
+
+# Concurrent overlapping batches compute every result once
+def test_memoized_batch_computes_results_once_across_threads(empty_caches):
+    counts = {}
+    lock = threading.Lock()
+    def compute(inputs_list):
+        with lock:
+            for inputs in inputs_list:
+                counts[inputs] = counts.get(inputs, 0) + 1
+        return list(inputs_list)
+    batches = [[i % 3, (i + 1) % 3, 3] for i in range(8)]
+    results = [None] * len(batches)
+    def run(i):
+        results[i] = memoized_batch('identity', batches[i], compute)
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(batches))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == batches
+    assert counts == {0: 1, 1: 1, 2: 1, 3: 1}